@@ -0,0 +1,221 @@
+"""
+Proxy under a slowloris connection flood: legitimate request success rate and latency with admission control off and on.
+
+    python benchmarks/bench_connection_flood.py --flood 3000 --fd-limit 1024 --seconds 10
+
+The proxy runs in its own process with RLIMIT_NOFILE lowered to --fd-limit
+(a common default). An attacker from 127.0.0.2 keeps --flood connections
+open, each trickling one header line per second without ever finishing
+its request head. Meanwhile --clients loops from 127.0.0.1 send ordinary
+requests on fresh connections to a local origin; a request counts as
+failed if it is refused, reset or not answered within --timeout.
+
+- off: no connection caps, an hour to finish a head (the proxy before admission control)
+- on: default caps (half the fd limit, 256 per IP) and a --header-timeout head deadline
+- banned: as on, with 127.0.0.2 banned, so its connections are dropped at accept
+
+`held` is the most flood sockets open at once on the attacker's side,
+`peak` the most connections the proxy admitted at once.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from core.bans import BanRegistry  # noqa: E402
+from core.config import PyShieldConfig  # noqa: E402
+from core.proxy_server import HTTPProxyServer  # noqa: E402
+
+ATTACKER = "127.0.0.2"
+CLIENT = "127.0.0.1"
+
+
+def proxy_process(mode: str, args: argparse.Namespace, conn) -> None:
+    resource.setrlimit(resource.RLIMIT_NOFILE, (args.fd_limit, args.fd_limit))
+    logging.getLogger("asyncio").setLevel(logging.CRITICAL)  # EMFILE on accept is the point of the "off" run
+    cfg = PyShieldConfig()
+    cfg.dashboard.proxy_port = 0
+    cfg.proxy.upstream_pool = False
+    if mode == "off":
+        cfg.proxy.client_max_connections = 10 ** 9
+        cfg.proxy.client_max_connections_per_ip = 0
+        cfg.proxy.client_header_timeout_seconds = 3600.0
+    else:
+        cfg.proxy.client_header_timeout_seconds = args.header_timeout
+    bans = BanRegistry()
+    if mode == "banned":
+        bans.ban(ATTACKER, 3600, reason="flood", source="ids")
+
+    async def main() -> None:
+        proxy = HTTPProxyServer(cfg, SimpleNamespace(ban_registry=bans))
+        proxy.logger.setLevel(logging.CRITICAL)
+        await proxy.start()
+        conn.send(proxy.server.sockets[0].getsockname()[1])
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, conn.recv)
+        conn.send(proxy.admission.snapshot())
+
+    asyncio.run(main())
+
+
+async def start_origin() -> asyncio.AbstractServer:
+    async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\nok")
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(serve, CLIENT, 0)
+
+
+async def attacker(proxy_port: int, deadline: float, held: list) -> None:
+    """One flood slot: keep a half-sent request head open, reconnecting whenever the proxy lets go."""
+    while time.perf_counter() < deadline:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(CLIENT, proxy_port, local_addr=(ATTACKER, 0)), 1.0)
+        except (OSError, asyncio.TimeoutError):
+            await asyncio.sleep(1.0)
+            continue
+        held[0] += 1
+        try:
+            writer.write(b"GET http://example.com/ HTTP/1.1\r\n")
+            while time.perf_counter() < deadline and not reader.at_eof():
+                await asyncio.sleep(1.0)
+                writer.write(b"X-Keep: 1\r\n")
+                await writer.drain()
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            held[0] -= 1
+            writer.close()
+        await asyncio.sleep(1.0)
+
+
+def attacker_process(proxy_port: int, args: argparse.Namespace, conn) -> None:
+    """The flood runs on its own event loop, so its reconnects do not delay the clients' loop."""
+    async def main() -> None:
+        deadline = time.perf_counter() + args.ramp + args.seconds
+        held = [0]
+        peak = 0
+
+        async def watch() -> None:
+            nonlocal peak
+            while time.perf_counter() < deadline:
+                peak = max(peak, held[0])
+                await asyncio.sleep(0.1)
+
+        await asyncio.gather(watch(), *(attacker(proxy_port, deadline, held) for _ in range(args.flood)))
+        conn.send(peak)
+
+    asyncio.run(main())
+
+
+async def client(proxy_port: int, origin_port: int, deadline: float, timeout: float,
+                 latencies: list, failures: list) -> None:
+    request = f"GET http://{CLIENT}:{origin_port}/ HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n".encode()
+
+    async def once() -> bool:
+        reader, writer = await asyncio.open_connection(CLIENT, proxy_port, local_addr=(CLIENT, 0))
+        try:
+            writer.write(request)
+            return (await reader.read()).startswith(b"HTTP/1.1 200")
+        finally:
+            writer.close()
+
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            ok = await asyncio.wait_for(once(), timeout)
+        except (OSError, asyncio.TimeoutError):
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            failures[0] += 1
+            await asyncio.sleep(0.05)
+
+
+async def run_load(proxy_port: int, args: argparse.Namespace) -> tuple:
+    origin = await start_origin()
+    origin_port = origin.sockets[0].getsockname()[1]
+    await asyncio.sleep(args.ramp)
+    deadline = time.perf_counter() + args.seconds
+    latencies: list = []
+    failures = [0]
+    await asyncio.gather(*(client(proxy_port, origin_port, deadline, args.timeout, latencies, failures)
+                           for _ in range(args.clients)))
+    origin.close()
+    return latencies, failures[0]
+
+
+def run(mode: str, args: argparse.Namespace) -> None:
+    ctx = mp.get_context("fork")
+    parent, child = ctx.Pipe()
+    process = ctx.Process(target=proxy_process, args=(mode, args, child), daemon=True)
+    process.start()
+    proxy_port = parent.recv()
+    flood_results, flood_conn = ctx.Pipe()
+    flood = ctx.Process(target=attacker_process, args=(proxy_port, args, flood_conn), daemon=True)
+    flood.start()
+    latencies, failed = asyncio.run(run_load(proxy_port, args))
+    held = flood_results.recv()
+    flood.join(5)
+    parent.send("stop")
+    admission = parent.recv()
+    process.join(5)
+
+    latencies.sort()
+    total = len(latencies) + failed
+    p50 = latencies[len(latencies) // 2] * 1e3 if latencies else float("nan")
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e3 if latencies else float("nan")
+    rejected = admission["rejected"]
+    print(f"{mode:>7} {len(latencies) / args.seconds:>8.0f} {len(latencies) / max(total, 1):>7.1%} {p50:>8.2f} "
+          f"{p99:>8.2f} {held:>6} {admission['peak']:>6} {rejected['banned']:>7} "
+          f"{rejected['connection_limit'] + rejected['per_ip_limit']:>7} {rejected['header_timeout']:>8}", flush=True)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--flood", type=int, default=3000, help="slowloris connections the attacker keeps open")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent legitimate clients")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds the flood runs before clients start")
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-request client timeout")
+    parser.add_argument("--fd-limit", type=int, default=1024, help="RLIMIT_NOFILE of the proxy process")
+    parser.add_argument("--header-timeout", type=float, default=3.0, help="proxy.client_header_timeout_seconds")
+    parser.add_argument("--modes", nargs="+", default=["off", "on", "banned"], choices=["off", "on", "banned"])
+    args = parser.parse_args(argv)
+    if resource is None or "fork" not in mp.get_all_start_methods():
+        sys.exit("needs the resource module and the fork start method")
+    print(f"{args.flood} slowloris connections, {args.clients} clients, proxy fd limit {args.fd_limit}, "
+          f"{args.seconds:g} s")
+    print(f"{'mode':>7} {'ok/s':>8} {'ok':>7} {'p50 ms':>8} {'p99 ms':>8} {'held':>6} {'peak':>6} "
+          f"{'banned':>7} {'capped':>7} {'timeouts':>8}")
+    for mode in args.modes:
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
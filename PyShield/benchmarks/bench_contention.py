@@ -0,0 +1,86 @@
+"""
+Contention benchmark: N threads hammering DDoSProtector.register_request.
+
+    python benchmarks/bench_contention.py --threads 1 2 4 8
+
+Each thread mixes requests for its own IPs with requests for one shared hot IP.
+Besides throughput, the run checks that the hot IP was allowed exactly
+`request_limit` times in total, which fails if concurrent updates are lost.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from core.config import DDoSConfig  # noqa: E402
+from core.rate_limiter import LIMITER_ALGORITHMS  # noqa: E402
+from modules.ddos_protection import DDoSProtector  # noqa: E402
+
+HOT_IP = "198.51.100.1"
+
+
+def run(algorithm: str, threads: int, ops_per_thread: int, hot_every: int, limit: int) -> dict:
+    ddos = DDoSProtector(DDoSConfig(request_limit=limit, window_seconds=3600, ban_seconds=3600, algorithm=algorithm))
+    ddos.logger.disabled = True
+    now = 1_000_000.0
+    hot_allowed = [0] * threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(n: int) -> None:
+        ips = [f"10.{n}.{i >> 8 & 255}.{i & 255}" for i in range(1024)]
+        register = ddos.register_request
+        allowed = 0
+        barrier.wait()
+        for i in range(ops_per_thread):
+            if i % hot_every == 0:
+                if register(HOT_IP, now=now) is None:
+                    allowed += 1
+            else:
+                register(ips[i & 1023], now=now)
+        hot_allowed[n] = allowed
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    total = threads * ops_per_thread
+    return {
+        "algorithm": algorithm,
+        "threads": threads,
+        "ops_per_sec": round(total / elapsed),
+        "hot_allowed": sum(hot_allowed),
+        "correct": sum(hot_allowed) == min(limit, sum((ops_per_thread + hot_every - 1) // hot_every for _ in range(threads))),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, nargs="*", default=[1, 2, 4, 8])
+    parser.add_argument("--ops", type=int, default=200_000, help="register_request calls per thread")
+    parser.add_argument("--hot-every", type=int, default=10, help="every Nth call targets the shared hot IP")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--algorithms", nargs="*", default=list(LIMITER_ALGORITHMS))
+    args = parser.parse_args(argv)
+
+    print(f"{'algorithm':<16}{'threads':>8}{'ops/sec':>12}{'hot allowed':>13}{'correct':>9}")
+    for algorithm in args.algorithms:
+        for n in args.threads:
+            r = run(algorithm, n, args.ops, args.hot_every, args.limit)
+            print(f"{r['algorithm']:<16}{r['threads']:>8}{r['ops_per_sec']:>12}{r['hot_allowed']:>13}{str(r['correct']):>9}")
+
+
+if __name__ == "__main__":
+    main()
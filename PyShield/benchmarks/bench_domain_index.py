@@ -0,0 +1,139 @@
+"""
+Domain lookup benchmark: locked set (previous URLBlocker) vs copy-on-write DomainIndex.
+
+    python benchmarks/bench_domain_index.py --domains 1000000
+
+Reports memory per structure and lookup latency percentiles, idle and while a
+background thread keeps adding and removing a 100k-entry feed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from modules.domain_index import DomainIndex  # noqa: E402
+
+TLDS = ["com", "net", "org", "io", "ru", "cn", "info", "xyz"]
+
+
+def make_domains(n: int, seed: int) -> list[str]:
+    rnd = random.Random(seed)
+    return [f"{rnd.choice(['ads', 'track', 'cdn', 'x', 'www'])}{i}.site{i % 50000}.{rnd.choice(TLDS)}" for i in range(n)]
+
+
+class LockedSet:
+    """The previous URLBlocker layout: one set behind an RLock, suffixes rebuilt per lookup."""
+
+    def __init__(self, domains) -> None:
+        self._set = set(domains)
+        self._lock = threading.RLock()
+
+    def contains(self, host: str) -> bool:
+        with self._lock:
+            if host in self._set:
+                return True
+            parts = host.split(".")
+            for i in range(1, len(parts)):
+                if ".".join(parts[i:]) in self._set:
+                    return True
+        return False
+
+    def refresh(self, add, remove) -> None:
+        with self._lock:
+            self._set.update(add)
+            self._set.difference_update(remove)
+
+
+class CowIndex:
+    def __init__(self, domains) -> None:
+        self._index = DomainIndex.build(domains)
+        self._write_lock = threading.Lock()
+
+    def contains(self, host: str) -> bool:
+        return self._index.contains(host)
+
+    def refresh(self, add, remove) -> None:
+        with self._write_lock:
+            self._index = self._index.with_changes(add=add, remove=remove)
+
+
+def measure_memory(factory, n: int) -> int:
+    """Memory of the structure including its strings, as the blocker owns them."""
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    obj = factory(make_domains(n, seed=1))
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del obj
+    return used
+
+
+def measure_latency(store, hosts, batch, duration: float, refresh: bool) -> dict:
+    """Lookup latency, optionally while another thread adds and then removes `batch` in a loop."""
+    stop = threading.Event()
+    refreshes = 0
+
+    def refresher() -> None:
+        nonlocal refreshes
+        while not stop.is_set():
+            store.refresh(batch, ())
+            store.refresh((), batch)
+            refreshes += 2
+
+    bg = threading.Thread(target=refresher, daemon=True)
+    if refresh:
+        bg.start()
+    samples = []
+    end = time.perf_counter() + duration
+    contains = store.contains
+    while time.perf_counter() < end:
+        for h in hosts:
+            t0 = time.perf_counter_ns()
+            contains(h)
+            samples.append(time.perf_counter_ns() - t0)
+    stop.set()
+    if refresh:
+        bg.join()
+    samples.sort()
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] / 1000.0  # noqa: E731
+    return {"refreshes": refreshes, "p50_us": pick(0.50), "p99_us": pick(0.99), "max_us": samples[-1] / 1000.0}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=1_000_000)
+    parser.add_argument("--refresh-size", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    domains = make_domains(args.domains, seed=1)
+    batch = [f"new{d}" for d in make_domains(args.refresh_size, seed=2)]
+    rnd = random.Random(4)
+    hosts = [f"img.{d}" for d in rnd.sample(domains, 500)] + [f"www.clean{i}.example.org" for i in range(500)]
+    rnd.shuffle(hosts)
+
+    print(f"{'store':<11} {'memory':>9} {'phase':<8} {'p50':>8} {'p99':>8} {'max':>10} {'refreshes':>10}")
+    for name, factory in (("locked set", LockedSet), ("cow index", CowIndex)):
+        mem = measure_memory(factory, args.domains)
+        store = factory(domains)
+        for phase, refresh in (("idle", False), ("refresh", True)):
+            r = measure_latency(store, hosts, batch, args.seconds, refresh)
+            print(f"{name:<11} {mem / 1e6:7.1f}MB {phase:<8} {r['p50_us']:7.2f}us {r['p99_us']:7.2f}us "
+                  f"{r['max_us']:9.0f}us {r['refreshes']:>10}")
+
+
+if __name__ == "__main__":
+    main()
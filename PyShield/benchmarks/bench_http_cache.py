@@ -0,0 +1,137 @@
+"""
+Proxy response cache: origin fetches, requests/sec and latency with the cache off and on.
+
+    python benchmarks/bench_http_cache.py --requests 20000 --urls 2000 --concurrency 32 --origin-ms 20
+
+The origin answers every GET after --origin-ms (standing in for a remote
+server) with a --body byte response marked `Cache-Control: max-age=300`
+and an ETag. URLs are drawn from a Zipf-like distribution over --urls
+paths, as browser traffic behind a shared proxy repeats popular assets.
+A last run sends --burst simultaneous requests for one uncached URL, which
+the cache coalesces into a single origin fetch.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import bisect
+import logging
+import os
+import random
+import sys
+import time
+from itertools import accumulate
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from core.config import PyShieldConfig  # noqa: E402
+from core.proxy_server import HTTPProxyServer  # noqa: E402
+
+
+async def start_origin(body_size: int, delay: float, counters: dict) -> asyncio.AbstractServer:
+    body = b"c" * body_size
+
+    async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                counters["requests"] += 1
+                await asyncio.sleep(delay)
+                path = head.split(b" ", 2)[1]
+                writer.write(b"HTTP/1.1 200 OK\r\nCache-Control: max-age=300\r\nETag: \"%s\"\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (path, len(body), body))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(serve, "127.0.0.1", 0)
+
+
+def zipf_paths(n: int, urls: int, rnd: random.Random, s: float = 1.0) -> list[str]:
+    weights = list(accumulate(1 / (rank ** s) for rank in range(1, urls + 1)))
+    total = weights[-1]
+    return [f"/asset/{bisect.bisect_left(weights, rnd.random() * total)}.js" for _ in range(n)]
+
+
+async def client(proxy_port: int, origin_port: int, paths, latencies: list) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+    try:
+        for path in paths:
+            start = time.perf_counter()
+            writer.write(f"GET http://127.0.0.1:{origin_port}{path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = int(head.lower().split(b"content-length:", 1)[1].split(b"\r\n", 1)[0])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if b"connection: close" in head.lower():
+                writer.close()
+                reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+    finally:
+        writer.close()
+
+
+async def run(cache: bool, paths: list[str], args: argparse.Namespace) -> None:
+    counters = {"requests": 0}
+    origin = await start_origin(args.body, args.origin_ms / 1000, counters)
+    origin_port = origin.sockets[0].getsockname()[1]
+    cfg = PyShieldConfig()
+    cfg.dashboard.proxy_port = 0
+    cfg.proxy.cache_enabled = cache
+    cfg.proxy.cache_memory_bytes = args.memory_mb << 20
+    proxy = HTTPProxyServer(cfg, SimpleNamespace())
+    proxy.logger.setLevel(logging.ERROR)
+    await proxy.start()
+    proxy_port = proxy.server.sockets[0].getsockname()[1]
+
+    latencies: list = []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(proxy_port, origin_port, paths[i::args.concurrency], latencies)
+                           for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    fetched = counters["requests"]
+
+    counters["requests"] = 0
+    burst_path = [f"/burst/{time.monotonic_ns()}.js"]
+    await asyncio.gather(*(client(proxy_port, origin_port, burst_path, []) for _ in range(args.burst)))
+    burst_fetches = counters["requests"]
+
+    snapshot = proxy.cache.snapshot() if proxy.cache is not None else None
+    ratio = f"{snapshot['hit_ratio']:.1%}" if snapshot else "-"
+    saved = f"{snapshot['bytes_saved'] / 1e6:.1f}" if snapshot else "-"
+    print(f"{'on' if cache else 'off':>5} {len(paths) / elapsed:>9.0f} {latencies[len(latencies) // 2] * 1e3:>8.2f} "
+          f"{latencies[int(len(latencies) * 0.99)] * 1e3:>8.2f} {fetched:>8} {ratio:>9} {saved:>10} "
+          f"{burst_fetches:>6}/{args.burst}", flush=True)
+    await proxy.stop()
+    await asyncio.sleep(0.1)  # let the origin see the pooled connections close
+    origin.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--urls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--origin-ms", type=float, default=20.0, help="origin response delay")
+    parser.add_argument("--body", type=int, default=16 * 1024)
+    parser.add_argument("--memory-mb", type=int, default=64, help="proxy.cache_memory_bytes in MiB")
+    parser.add_argument("--burst", type=int, default=50, help="simultaneous requests for one cold URL")
+    args = parser.parse_args(argv)
+    paths = zipf_paths(args.requests, args.urls, random.Random(7))
+    print(f"{args.requests} requests over {args.urls} URLs, {args.concurrency} connections, "
+          f"origin {args.origin_ms:g} ms, {args.body} byte bodies")
+    print(f"{'cache':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'origin':>8} {'hit ratio':>9} {'MB saved':>10} "
+          f"{'burst fetches':>13}")
+    for cache in (False, True):
+        asyncio.run(run(cache, paths, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Cold start and lookup cost of the mmap'ed blacklist index file vs an in-memory build.
+
+    python benchmarks/bench_index_file.py --domains 1000000
+
+Writes a temporary index file, then compares building DomainIndex from raw
+domains with mapping the file, and lookup latency for listed and clean hosts
+with and without the Bloom filter.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from modules.domain_index import DomainIndex  # noqa: E402
+from modules.index_file import IndexFile, write_index_file  # noqa: E402
+
+TLDS = ["com", "net", "org", "io", "ru", "cn", "info", "xyz"]
+
+
+def make_domains(n: int, seed: int) -> list[str]:
+    rnd = random.Random(seed)
+    return [f"{rnd.choice(['ads', 'track', 'cdn', 'x', 'www'])}{i}.site{i % 50000}.{rnd.choice(TLDS)}" for i in range(n)]
+
+
+def latency(index: DomainIndex, hosts: list[str], rounds: int) -> tuple[float, float]:
+    samples = []
+    contains = index.contains
+    for _ in range(rounds):
+        for h in hosts:
+            t0 = time.perf_counter_ns()
+            contains(h)
+            samples.append(time.perf_counter_ns() - t0)
+    samples.sort()
+    return samples[len(samples) // 2] / 1000.0, samples[int(len(samples) * 0.99)] / 1000.0
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=1_000_000)
+    parser.add_argument("--bits-per-key", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    domains = make_domains(args.domains, seed=1)
+    rnd = random.Random(2)
+    listed = [f"img.{d}" for d in rnd.sample(domains, 1000)]
+    clean = [f"www.clean{i}.example.org" for i in range(1000)]
+
+    t0 = time.perf_counter()
+    memory = DomainIndex.build(domains)
+    build_s = time.perf_counter() - t0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "blacklist.idx")
+        t0 = time.perf_counter()
+        write_index_file(path, memory.keys, [1] * len(memory), {"feeds": []}, bloom_bits_per_key=args.bits_per_key)
+        write_s = time.perf_counter() - t0
+        size = os.path.getsize(path)
+
+        t0 = time.perf_counter()
+        loaded = IndexFile.open(path)
+        mapped = DomainIndex(loaded.keys, bloom=loaded.bloom)
+        open_s = time.perf_counter() - t0
+        unfiltered = DomainIndex(loaded.keys)
+
+        false_pos = sum(loaded.bloom.may_match(("." + h)[::-1]) for h in clean) / len(clean) if loaded.bloom else 1.0
+        print(f"entries={len(memory)}  file={size / 1e6:.1f} MB  write={write_s:.2f}s  bloom fp(clean)={false_pos:.3f}")
+        print(f"startup: in-memory build {build_s * 1000:9.1f} ms | mmap open {open_s * 1000:7.2f} ms")
+        print(f"{'index':<16} {'listed p50':>11} {'listed p99':>11} {'clean p50':>10} {'clean p99':>10}")
+        for name, index in (("in-memory", memory), ("mmap + bloom", mapped), ("mmap, no bloom", unfiltered)):
+            lp50, lp99 = latency(index, listed, args.rounds)
+            cp50, cp99 = latency(index, clean, args.rounds)
+            print(f"{name:<16} {lp50:9.2f}us {lp99:9.2f}us {cp50:8.2f}us {cp99:8.2f}us")
+        del mapped, unfiltered, loaded
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Path/query rule matching cost vs rule count: Aho-Corasick and combined regex vs a naive scan.
+
+    python benchmarks/bench_path_rules.py --counts 10 100 1000 10000 50000
+
+Literal rules are random path fragments; regex rules are small patterns
+with a character class and a quantifier. Targets are mostly clean request
+paths, as in real traffic.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from modules.url_blocking import PathRuleSet, rule_target  # noqa: E402
+
+WORDS = ["admin", "login", "api", "v1", "static", "img", "user", "cart", "search", "config", "backup", "shell"]
+
+
+def make_literals(n: int, rnd: random.Random) -> list[str]:
+    return [f"/{rnd.choice(WORDS)}-{rnd.randrange(10**6):06d}.{rnd.choice(['php', 'asp', 'cgi'])}" for _ in range(n)]
+
+
+def make_regexes(n: int, rnd: random.Random) -> list[str]:
+    return [f"re:{rnd.choice(WORDS)}_{rnd.randrange(10**6):06d}[a-z]+=\\d+" for _ in range(n)]
+
+
+def make_targets(n: int, rnd: random.Random) -> list[str]:
+    paths = []
+    for i in range(n):
+        path = "/" + "/".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 4)))
+        query = f"id={i}&q={rnd.choice(WORDS)}" if i % 2 else ""
+        paths.append(rule_target(path, query))
+    return paths
+
+
+def per_target_us(fn, targets, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for t in targets:
+            fn(t)
+    return (time.perf_counter() - t0) / (rounds * len(targets)) * 1e6
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000, 10000, 50000])
+    parser.add_argument("--max-regex", type=int, default=10000, help="skip regex sets larger than this")
+    parser.add_argument("--targets", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(7)
+    targets = make_targets(args.targets, rnd)
+    print(f"{'rules':>7} {'kind':<8} {'build':>9} {'engine':>11} {'naive':>11}")
+    for count in args.counts:
+        literals = make_literals(count, rnd)
+        t0 = time.perf_counter()
+        rules = PathRuleSet(literals)
+        build = time.perf_counter() - t0
+        lowered = [r.lower() for r in literals]
+        engine = per_target_us(rules.match, targets, args.rounds)
+        naive = per_target_us(lambda t: next((r for r in lowered if r in t), None), targets, 1)
+        print(f"{count:>7} {'literal':<8} {build * 1000:7.0f}ms {engine:9.2f}us {naive:9.2f}us")
+
+        if count > args.max_regex:
+            continue
+        regexes = make_regexes(count, rnd)
+        t0 = time.perf_counter()
+        rules = PathRuleSet(regexes)
+        build = time.perf_counter() - t0
+        engine = per_target_us(rules.match, targets, args.rounds)
+        print(f"{count:>7} {'regex':<8} {build * 1000:7.0f}ms {engine:9.2f}us {'':>11}")
+
+
+if __name__ == "__main__":
+    main()
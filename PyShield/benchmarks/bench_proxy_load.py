@@ -0,0 +1,345 @@
+"""
+Proxy load test: requests/sec, bytes/sec and latency percentiles as JSON.
+
+    python benchmarks/bench_proxy_load.py --scenarios get upload tunnel --concurrency 1 16 64 \\
+        --blacklist 0 100000 1000000 --firewall on off --seconds 5 --output proxy-load.json
+
+One process runs the targets: an aiohttp origin (GET /bytes/<n>, POST
+/upload) and a plain TCP echo server reached through CONNECT. A second
+process runs HTTPProxyServer, restarted for every firewall setting: "on"
+builds a ban registry, the DDoS limiter (limit never reached) and a URL
+blocker holding --blacklist random domains plus a few path rules; "off" runs
+the proxy with no modules at all. This process drives the load:
+
+- get: persistent connections, each a GET of --body bytes at a time
+- upload: persistent connections, each a POST of --upload bytes at a time
+- tunnel: a CONNECT per operation, then --tunnel bytes echoed back
+
+Each result holds operations, errors, requests/sec, bytes/sec (payload in
+both directions), p50/p95/p99/max latency in ms and the proxy's CPU seconds.
+The JSON goes to stdout (or --output); progress goes to stderr. Compare
+files from two releases run on the same host to spot regressions.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing as mp
+import os
+import platform
+import random
+import signal
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from aiohttp import web  # noqa: E402
+
+from core.bans import BanRegistry  # noqa: E402
+from core.config import PyShieldConfig  # noqa: E402
+from core.logging_system import LoggerFactory  # noqa: E402
+from core.proxy_server import HTTPProxyServer  # noqa: E402
+from modules.ddos_protection import DDoSProtector  # noqa: E402
+from modules.url_blocking import URLBlocker  # noqa: E402
+
+BLOCK = 64 * 1024
+PATH_RULES = ["/wp-admin/", "/.env", "/phpmyadmin", "re:union\\s+select", "re:\\.\\./\\.\\./"]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * q), len(sorted_values) - 1)]
+
+
+# --- targets ---------------------------------------------------------------
+
+def targets_process(conn) -> None:
+    async def get_bytes(request: web.Request) -> web.Response:
+        return web.Response(body=b"o" * int(request.match_info["size"]))
+
+    async def upload(request: web.Request) -> web.Response:
+        received = 0
+        async for chunk in request.content.iter_any():
+            received += len(chunk)
+        return web.Response(text=str(received))
+
+    async def echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                data = await reader.read(BLOCK)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def main() -> None:
+        app = web.Application(client_max_size=1 << 30)
+        app.router.add_get("/bytes/{size}", get_bytes)
+        app.router.add_post("/upload", upload)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        origin_port = runner.addresses[0][1]
+        echo_server = await asyncio.start_server(echo, "127.0.0.1", 0)
+        conn.send((origin_port, echo_server.sockets[0].getsockname()[1]))
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+# --- proxy -----------------------------------------------------------------
+
+def firewall_modules(cfg: PyShieldConfig, blacklist: int) -> SimpleNamespace:
+    rnd = random.Random(blacklist)
+    cfg.ddos.request_limit = 10 ** 9
+    cfg.url_blocking.blacklist = [f"{rnd.getrandbits(48):012x}.example" for _ in range(blacklist)]
+    cfg.url_blocking.path_rules = list(PATH_RULES)
+    bans = BanRegistry()
+    return SimpleNamespace(
+        ban_registry=bans, ddos_protector=DDoSProtector(cfg.ddos, bans=bans),
+        url_blocker=URLBlocker(cfg.url_blocking), on_url_block=lambda url: None,
+    )
+
+
+def proxy_process(conn, firewall: bool, blacklist: int) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for name in ("pyshield.proxy", "pyshield.ddos", "pyshield.url", "pyshield.rules"):
+        LoggerFactory.get_logger(name).setLevel(logging.ERROR)
+    cfg = PyShieldConfig()
+    cfg.dashboard.proxy_port = 0
+    pyshield = firewall_modules(cfg, blacklist) if firewall else SimpleNamespace()
+
+    async def main() -> None:
+        proxy = HTTPProxyServer(cfg, pyshield)
+        await proxy.start()
+        conn.send(proxy.server.sockets[0].getsockname()[1])
+        loop = asyncio.get_running_loop()
+        while True:
+            command = await loop.run_in_executor(None, conn.recv)
+            if command is None:
+                break
+            times = os.times()
+            conn.send(times.user + times.system)
+        await proxy.stop()
+
+    asyncio.run(main())
+
+
+# --- load ------------------------------------------------------------------
+
+async def read_response(reader: asyncio.StreamReader) -> Tuple[int, bool]:
+    """(body bytes, whether the proxy closes the connection after it)"""
+    head = await reader.readuntil(b"\r\n\r\n")
+    if not head.startswith(b"HTTP/1.1 200"):
+        raise RuntimeError(head.split(b"\r\n", 1)[0].decode(errors="replace"))
+    lower = head.lower()
+    length = int(lower.split(b"content-length:", 1)[1].split(b"\r\n", 1)[0])
+    await reader.readexactly(length)
+    # proxy.client_max_requests ends persistent connections now and then
+    return length, b"connection: close" in lower
+
+
+async def http_worker(scenario: str, proxy_port: int, origin_port: int, args: argparse.Namespace,
+                      deadline: float, out: Dict[str, Any]) -> None:
+    if scenario == "get":
+        request = (f"GET http://127.0.0.1:{origin_port}/bytes/{args.body} HTTP/1.1\r\n"
+                   f"Host: 127.0.0.1:{origin_port}\r\n\r\n").encode()
+        payload = b""
+    else:
+        request = (f"POST http://127.0.0.1:{origin_port}/upload HTTP/1.1\r\n"
+                   f"Host: 127.0.0.1:{origin_port}\r\nContent-Length: {args.upload}\r\n\r\n").encode()
+        payload = b"u" * args.upload
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+            writer.write(request)
+            if payload:
+                writer.write(payload)
+            received, close = await read_response(reader)
+        except Exception:
+            out["errors"] += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        out["latencies"].append(time.perf_counter() - start)
+        out["bytes"] += received + len(payload)
+        if close:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def tunnel_worker(proxy_port: int, echo_port: int, args: argparse.Namespace, deadline: float,
+                        out: Dict[str, Any]) -> None:
+    connect = f"CONNECT 127.0.0.1:{echo_port} HTTP/1.1\r\nHost: 127.0.0.1:{echo_port}\r\n\r\n".encode()
+    block = b"t" * min(args.tunnel, BLOCK)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+            writer.write(connect)
+            head = await reader.readuntil(b"\r\n\r\n")
+            if not head.startswith(b"HTTP/1.1 200"):
+                raise RuntimeError(head.split(b"\r\n", 1)[0].decode(errors="replace"))
+            sent = echoed = 0
+            while echoed < args.tunnel:
+                if sent < args.tunnel:
+                    n = min(len(block), args.tunnel - sent)
+                    writer.write(block[:n])
+                    sent += n
+                    await writer.drain()
+                echoed += len(await reader.read(BLOCK))
+        except Exception:
+            out["errors"] += 1
+            continue
+        finally:
+            if writer is not None:
+                writer.close()
+        out["latencies"].append(time.perf_counter() - start)
+        out["bytes"] += 2 * args.tunnel
+
+
+async def drive(scenario: str, concurrency: int, proxy_port: int, origin_port: int, echo_port: int,
+                args: argparse.Namespace) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"latencies": [], "errors": 0, "bytes": 0}
+    deadline = time.perf_counter() + args.seconds
+    if scenario == "tunnel":
+        workers = [tunnel_worker(proxy_port, echo_port, args, deadline, out) for _ in range(concurrency)]
+    else:
+        workers = [http_worker(scenario, proxy_port, origin_port, args, deadline, out) for _ in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*workers)
+    out["seconds"] = time.perf_counter() - start
+    return out
+
+
+def run_proxy_config(firewall: bool, blacklist: int, ports, args: argparse.Namespace,
+                     results: List[Dict[str, Any]]) -> None:
+    origin_port, echo_port = ports
+    ctx = mp.get_context("fork")
+    parent, child = ctx.Pipe()
+    proxy = ctx.Process(target=proxy_process, args=(child, firewall, blacklist), daemon=True)
+    built = time.perf_counter()
+    proxy.start()
+    proxy_port = parent.recv()
+    print(f"proxy firewall={'on' if firewall else 'off'} blacklist={blacklist} ready in "
+          f"{time.perf_counter() - built:.1f}s", file=sys.stderr, flush=True)
+    try:
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                parent.send("cpu")
+                cpu_before = parent.recv()
+                out = asyncio.run(drive(scenario, concurrency, proxy_port, origin_port, echo_port, args))
+                parent.send("cpu")
+                cpu = parent.recv() - cpu_before
+                latencies = sorted(out["latencies"])
+                ops = len(latencies)
+                result = {
+                    "scenario": scenario,
+                    "firewall": firewall,
+                    "blacklist": blacklist if firewall else 0,
+                    "concurrency": concurrency,
+                    "operations": ops,
+                    "errors": out["errors"],
+                    "seconds": round(out["seconds"], 3),
+                    "requests_per_sec": round(ops / out["seconds"], 1),
+                    "bytes_per_sec": round(out["bytes"] / out["seconds"]),
+                    "latency_ms": {
+                        "p50": round(percentile(latencies, 0.50) * 1e3, 3),
+                        "p95": round(percentile(latencies, 0.95) * 1e3, 3),
+                        "p99": round(percentile(latencies, 0.99) * 1e3, 3),
+                        "max": round((latencies[-1] if latencies else 0.0) * 1e3, 3),
+                    },
+                    "proxy_cpu_seconds": round(cpu, 3),
+                }
+                results.append(result)
+                print(f"  {scenario:>6} c={concurrency:<4} {result['requests_per_sec']:>9.1f} req/s "
+                      f"{result['bytes_per_sec'] / 1e6:>8.1f} MB/s  p50 {result['latency_ms']['p50']:.2f} "
+                      f"p99 {result['latency_ms']['p99']:.2f} ms  errors {out['errors']}",
+                      file=sys.stderr, flush=True)
+    finally:
+        parent.send(None)
+        proxy.join(10)
+        if proxy.is_alive():
+            proxy.kill()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=["get", "upload", "tunnel"],
+                        default=["get", "upload", "tunnel"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--blacklist", type=int, nargs="+", default=[0, 100000],
+                        help="blacklisted domains loaded when the firewall is on")
+    parser.add_argument("--firewall", nargs="+", choices=["on", "off"], default=["on", "off"])
+    parser.add_argument("--seconds", type=float, default=5.0, help="per scenario and concurrency level")
+    parser.add_argument("--body", type=int, default=1024, help="GET response body bytes")
+    parser.add_argument("--upload", type=int, default=64 * 1024, help="POST body bytes")
+    parser.add_argument("--tunnel", type=int, default=256 * 1024, help="bytes echoed per CONNECT tunnel")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if "fork" not in mp.get_all_start_methods():
+        sys.exit("this benchmark needs the fork start method")
+
+    ctx = mp.get_context("fork")
+    parent, child = ctx.Pipe()
+    targets = ctx.Process(target=targets_process, args=(child,), daemon=True)
+    targets.start()
+    ports = parent.recv()
+
+    results: List[Dict[str, Any]] = []
+    try:
+        for setting in args.firewall:
+            if setting == "on":
+                for blacklist in args.blacklist:
+                    run_proxy_config(True, blacklist, ports, args, results)
+            else:
+                run_proxy_config(False, 0, ports, args, results)
+    finally:
+        targets.terminate()
+
+    report = {
+        "benchmark": "proxy_load",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "parameters": {
+            "seconds": args.seconds, "body_bytes": args.body, "upload_bytes": args.upload,
+            "tunnel_bytes": args.tunnel,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Proxy requests/sec with 1, 2, 4 and 8 SO_REUSEPORT worker processes.
+
+    python benchmarks/bench_proxy_workers.py --workers 1 2 4 8 --clients 4 --seconds 5
+
+The origin and --clients load generator processes (each holding
+--connections persistent proxy connections) run alongside the workers, so
+scaling flattens once the machine runs out of cores for all of them. Every
+proxied request goes through the shared ban table and the shared per-IP
+rate limit counters. After each run, a ban issued in this (the parent)
+process is checked to block new connections to every worker at once.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import socket
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from core.bans import BanRegistry  # noqa: E402
+from core.config import PyShieldConfig  # noqa: E402
+from core.logging_system import LoggerFactory  # noqa: E402
+from core.proxy_workers import REUSEPORT_AVAILABLE, ProxyWorkerPool  # noqa: E402
+from core.shared_state import SharedState  # noqa: E402
+from modules.ddos_protection import DDoSProtector  # noqa: E402
+
+BODY = b"x" * 1024
+
+
+def origin_process(port_conn) -> None:
+    async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        response = b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(BODY), BODY)
+        try:
+            while True:
+                await reader.readuntil(b"\r\n\r\n")
+                writer.write(response)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def main() -> None:
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port_conn.send(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def client_process(proxy_port: int, origin_port: int, connections: int, seconds: float, result) -> None:
+    request = (f"GET http://127.0.0.1:{origin_port}/ HTTP/1.1\r\n"
+               f"Host: 127.0.0.1:{origin_port}\r\n\r\n").encode()
+
+    async def persistent(deadline: float, counts: list) -> None:
+        reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+        try:
+            while time.perf_counter() < deadline:
+                writer.write(request)
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = int(head.lower().split(b"content-length:", 1)[1].split(b"\r\n", 1)[0])
+                await reader.readexactly(length)
+                counts[0 if head.startswith(b"HTTP/1.1 200") else 1] += 1
+        finally:
+            writer.close()
+
+    async def main() -> None:
+        counts = [0, 0]
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(persistent(deadline, counts) for _ in range(connections)))
+        result.put(tuple(counts))
+
+    asyncio.run(main())
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_listening(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"proxy workers did not start listening on {port}")
+
+
+def status_of(proxy_port: int, origin_port: int) -> bytes:
+    with socket.create_connection(("127.0.0.1", proxy_port), timeout=5) as s:
+        s.sendall(f"GET http://127.0.0.1:{origin_port}/ HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n".encode())
+        return s.recv(12)[9:12]
+
+
+def run(workers: int, origin_port: int, args: argparse.Namespace) -> None:
+    cfg = PyShieldConfig()
+    cfg.dashboard.proxy_port = free_port()
+    cfg.ddos.request_limit = 10 ** 9  # counted in the shared table, never exceeded
+    bans = BanRegistry()
+    pyshield = SimpleNamespace(ban_registry=bans, ddos_protector=DDoSProtector(cfg.ddos, bans=bans))
+    shared = SharedState(ban_slots=cfg.proxy.shared_ban_slots, counter_slots=cfg.proxy.shared_counter_slots,
+                         workers=workers)
+    bans.attach_shared(shared.bans)
+    pyshield.ddos_protector.share_counters(shared.counters)
+    pool = ProxyWorkerPool(cfg, pyshield, shared, workers)
+    pool.start()
+    try:
+        wait_listening(cfg.dashboard.proxy_port)
+        time.sleep(0.2 * workers)  # every worker bound before load starts
+        ctx = mp.get_context("fork")
+        result = ctx.Queue()
+        clients = [ctx.Process(target=client_process,
+                               args=(cfg.dashboard.proxy_port, origin_port, args.connections, args.seconds, result))
+                   for _ in range(args.clients)]
+        for c in clients:
+            c.start()
+        counts = [result.get() for _ in clients]
+        for c in clients:
+            c.join()
+        ok = sum(c[0] for c in counts)
+        failed = sum(c[1] for c in counts)
+
+        bans.ban("127.0.0.1", 60, reason="benchmark", source="bench")
+        probes = [status_of(cfg.dashboard.proxy_port, origin_port) for _ in range(4 * workers)]
+        blocked = sum(1 for s in probes if s == b"403")
+        bans.unban("127.0.0.1")
+        print(f"{workers:>7} {ok / args.seconds:>9.0f} {failed:>7}   ban seen on {blocked}/{len(probes)} new connections",
+              flush=True)
+    finally:
+        pool.stop()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--connections", type=int, default=16, help="persistent connections per client process")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+    if not REUSEPORT_AVAILABLE:
+        sys.exit("SO_REUSEPORT / fork unavailable on this platform")
+
+    # Per-request log lines (and the ban check's 403s) would dominate; workers inherit these levels
+    for name in ("pyshield.proxy", "pyshield.ddos", "pyshield.workers"):
+        LoggerFactory.get_logger(name).setLevel(logging.ERROR)
+    port_parent, port_child = mp.Pipe()
+    origin = mp.get_context("fork").Process(target=origin_process, args=(port_child,), daemon=True)
+    origin.start()
+    origin_port = port_parent.recv()
+    print(f"{os.cpu_count()} CPUs, {args.clients} client processes x {args.connections} connections, "
+          f"{args.seconds:g}s per run")
+    print(f"{'workers':>7} {'req/s':>9} {'non-200':>7}")
+    for workers in args.workers:
+        run(workers, origin_port, args)
+    origin.terminate()
+
+
+if __name__ == "__main__":
+    main()
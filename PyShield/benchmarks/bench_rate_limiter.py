@@ -0,0 +1,82 @@
+"""
+Rate limiter benchmark: memory per tracked IP and hit throughput at many distinct keys.
+
+    python benchmarks/bench_rate_limiter.py --keys 1000000
+
+Key strings are generated before measuring, so the reported bytes cover limiter
+state only (dict slot + per-key value), not the IP strings themselves.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from core.rate_limiter import LIMITER_ALGORITHMS, create_rate_limiter  # noqa: E402
+
+
+def make_keys(n: int) -> list[str]:
+    return [f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" if i < 1 << 24 else f"fd00::{i:x}" for i in range(n)]
+
+
+def bench(algorithm: str, keys: list[str], hits_per_key: int, limit: int, window: int) -> dict:
+    limiter = create_rate_limiter(algorithm, limit=limit, window_seconds=window)
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    now = 1_000_000.0
+    for k in keys:
+        limiter.hit(k, now=now)
+    state_bytes = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    hit = limiter.hit
+    total = 0
+    start = time.perf_counter()
+    for r in range(hits_per_key):
+        t = now + r * 0.01
+        for k in keys:
+            hit(k, now=t)
+        total += len(keys)
+    elapsed = time.perf_counter() - start
+
+    sweep_start = time.perf_counter()
+    removed = limiter.sweep(now=now + 10 * window)
+    sweep_elapsed = time.perf_counter() - sweep_start
+    return {
+        "algorithm": algorithm,
+        "keys": len(keys),
+        "bytes_per_ip": round(state_bytes / len(keys), 1),
+        "hits_per_sec": round(total / elapsed),
+        "sweep_seconds": round(sweep_elapsed, 3),
+        "swept": removed,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", type=int, default=1_000_000)
+    parser.add_argument("--hits-per-key", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--window", type=int, default=60)
+    parser.add_argument("--algorithms", nargs="*", default=list(LIMITER_ALGORITHMS))
+    args = parser.parse_args(argv)
+
+    keys = make_keys(args.keys)
+    print(f"{'algorithm':<16}{'keys':>10}{'bytes/IP':>10}{'hits/sec':>12}{'sweep s':>9}")
+    for algorithm in args.algorithms:
+        r = bench(algorithm, keys, args.hits_per_key, args.limit, args.window)
+        print(f"{r['algorithm']:<16}{r['keys']:>10}{r['bytes_per_ip']:>10}{r['hits_per_sec']:>12}{r['sweep_seconds']:>9}")
+
+
+if __name__ == "__main__":
+    main()
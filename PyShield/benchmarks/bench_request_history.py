@@ -0,0 +1,83 @@
+"""
+Proxy request history: append cost and /proxy/stats cost, list vs ring.
+
+    python benchmarks/bench_request_history.py --sizes 1000 10000 100000
+
+"list" is the former history: a list trimmed with pop(0), stats computed by
+rescanning it and each dashboard row re-parsing its URL. "ring" is
+RequestHistory. Each size is filled first, then measured at steady state.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from core.proxy_server import ProxyRequest  # noqa: E402
+from core.request_history import HistoryRecord, RequestHistory  # noqa: E402
+
+
+def _url(i: int) -> str:
+    return f"http://host{i % 997}.example.com/path/{i}?q=1"
+
+
+def bench_list(size: int, appends: int, polls: int):
+    history = []
+    for i in range(size):
+        history.append(ProxyRequest("GET", _url(i), {}, "10.0.0.1", time.time(), i % 10 == 0))
+    t0 = time.perf_counter()
+    for i in range(appends):
+        history.append(ProxyRequest("GET", _url(i), {"Host": "x"}, "10.0.0.1", time.time(), i % 10 == 0))
+        if len(history) > size:
+            history.pop(0)
+    append_us = (time.perf_counter() - t0) / appends * 1e6
+    t0 = time.perf_counter()
+    for _ in range(polls):
+        total = len(history)
+        blocked = sum(1 for r in history if r.blocked)
+        rows = [urlparse(r.url).netloc for r in history[-100:]]
+    poll_us = (time.perf_counter() - t0) / polls * 1e6
+    assert total and blocked and rows
+    return append_us, poll_us
+
+
+def bench_ring(size: int, appends: int, polls: int):
+    history = RequestHistory(size)
+    for i in range(size):
+        history.append(HistoryRecord("GET", _url(i), "10.0.0.1", time.time(), i % 10 == 0))
+    t0 = time.perf_counter()
+    for i in range(appends):
+        history.append(HistoryRecord("GET", _url(i), "10.0.0.1", time.time(), i % 10 == 0))
+    append_us = (time.perf_counter() - t0) / appends * 1e6
+    t0 = time.perf_counter()
+    for _ in range(polls):
+        stats = history.stats()
+        rows = [r.to_dict() for r in history.recent(100)]
+    poll_us = (time.perf_counter() - t0) / polls * 1e6
+    assert stats["total_requests"] and rows
+    return append_us, poll_us
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--appends", type=int, default=50000)
+    parser.add_argument("--polls", type=int, default=50)
+    args = parser.parse_args(argv)
+    print(f"{'size':>8} {'impl':>5} {'append us':>10} {'stats+rows us':>14}")
+    for size in args.sizes:
+        for name, fn in (("list", bench_list), ("ring", bench_ring)):
+            append_us, poll_us = fn(size, args.appends, args.polls)
+            print(f"{size:>8} {name:>5} {append_us:>10.2f} {poll_us:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Proxy peak memory and throughput while streaming large request and response bodies.
+
+    python benchmarks/bench_streaming_bodies.py --megabytes 16 256 1024
+
+A child process runs the origin and the client with blocking sockets; the
+proxy runs in this process, whose peak RSS is reported after each transfer.
+Sizes run in increasing order, so a peak that does not grow with the body
+size means the proxy's buffering is bounded. Each size is sent as a
+Content-Length upload, a chunked upload and a Content-Length download. A
+last run checks that proxy.max_request_body_bytes refuses a chunked upload
+with 413 once it passes the cap.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from core.config import PyShieldConfig  # noqa: E402
+from core.proxy_server import HTTPProxyServer  # noqa: E402
+
+BLOCK = 1 << 20
+
+
+def _read_head(f) -> bytes:
+    head = b""
+    while not head.endswith(b"\r\n\r\n"):
+        line = f.readline()
+        if not line:
+            break
+        head += line
+    return head
+
+
+def _discard_body(f, head: bytes) -> int:
+    lower = head.lower()
+    if b"transfer-encoding: chunked" in lower:
+        total = 0
+        while True:
+            size = int(f.readline().split(b";", 1)[0], 16)
+            if size == 0:
+                f.readline()
+                return total
+            total += size
+            while size:
+                size -= len(f.read(min(size, BLOCK)))
+            f.readline()
+    length = int(lower.split(b"content-length:", 1)[1].split(b"\r\n", 1)[0])
+    remaining = length
+    while remaining:
+        data = f.read(min(remaining, BLOCK))
+        if not data:
+            break
+        remaining -= len(data)
+    return length - remaining
+
+
+def serve_origin(conn: socket.socket) -> None:
+    with conn, conn.makefile("rb") as f:
+        head = _read_head(f)
+        if head.startswith(b"GET"):
+            size = int(head.split(b" ", 2)[1].rsplit(b"/", 1)[1])
+            conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % size)
+            block = memoryview(b"d" * BLOCK)
+            while size:
+                n = min(size, BLOCK)
+                conn.sendall(block[:n])
+                size -= n
+        else:
+            try:
+                _discard_body(f, head)
+            except (ValueError, OSError):
+                return  # upload cut off by the proxy (the cap check)
+            conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+
+
+def peer_process(conn) -> None:
+    """Origin + client. Receives (proxy_port, mode, bytes) jobs; replies with (status line, seconds)."""
+    origin = socket.create_server(("127.0.0.1", 0))
+    origin_port = origin.getsockname()[1]
+
+    def accept_loop() -> None:
+        while True:
+            c, _ = origin.accept()
+            threading.Thread(target=serve_origin, args=(c,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    conn.send(origin_port)
+    block = memoryview(b"u" * BLOCK)
+    while True:
+        job = conn.recv()
+        if job is None:
+            return
+        proxy_port, mode, total = job
+        url = f"http://127.0.0.1:{origin_port}/{total}"
+        c = socket.create_connection(("127.0.0.1", proxy_port))
+        t0 = time.perf_counter()
+        try:
+            if mode == "download":
+                c.sendall(f"GET {url} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n".encode())
+            else:
+                framing = "Transfer-Encoding: chunked" if mode == "chunked" else f"Content-Length: {total}"
+                c.sendall(f"POST {url} HTTP/1.1\r\nHost: x\r\n{framing}\r\nConnection: close\r\n\r\n".encode())
+                sent = 0
+                while sent < total:
+                    n = min(BLOCK, total - sent)
+                    if mode == "chunked":
+                        c.sendall(b"%x\r\n" % n)
+                    c.sendall(block[:n])
+                    if mode == "chunked":
+                        c.sendall(b"\r\n")
+                    sent += n
+                if mode == "chunked":
+                    c.sendall(b"0\r\n\r\n")
+        except OSError:
+            pass  # refused mid-upload: the status line is still readable
+        with c.makefile("rb") as f:
+            status = f.readline().strip().decode()
+            while f.read(BLOCK):
+                pass
+        c.close()
+        conn.send((status, time.perf_counter() - t0))
+
+
+def max_rss_mb() -> float:
+    # KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+async def run(conn, sizes_mb, cap_mb: int) -> None:
+    cfg = PyShieldConfig()
+    cfg.dashboard.proxy_port = 0
+    proxy = HTTPProxyServer(cfg, SimpleNamespace())
+    proxy.logger.setLevel(logging.ERROR)
+    await proxy.start()
+    port = proxy.server.sockets[0].getsockname()[1]
+    loop = asyncio.get_running_loop()
+    print(f"baseline peak RSS {max_rss_mb():.1f} MB")
+    print(f"{'MiB':>6} {'mode':>14} {'MB/s':>8} {'peak RSS MB':>12}  status")
+    for mb in sizes_mb:
+        for mode in ("content-length", "chunked", "download"):
+            conn.send((port, mode, mb * BLOCK))
+            status, elapsed = await loop.run_in_executor(None, conn.recv)
+            print(f"{mb:>6} {mode:>14} {mb * BLOCK / 1e6 / elapsed:>8.0f} {max_rss_mb():>12.1f}  {status}", flush=True)
+
+    cfg.proxy.max_request_body_bytes = cap_mb * BLOCK
+    conn.send((port, "chunked", 4 * cap_mb * BLOCK))
+    status, _ = await loop.run_in_executor(None, conn.recv)
+    print(f"chunked upload of {4 * cap_mb} MiB with a {cap_mb} MiB cap: {status}")
+    await proxy.stop()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megabytes", type=int, nargs="+", default=[16, 256, 1024])
+    parser.add_argument("--cap", type=int, default=8, help="MiB cap for the max_request_body_bytes check")
+    args = parser.parse_args(argv)
+    parent, child = mp.Pipe()
+    peer = mp.Process(target=peer_process, args=(child,), daemon=True)
+    peer.start()
+    parent.recv()  # origin is listening
+    asyncio.run(run(parent, sorted(args.megabytes), args.cap))
+    parent.send(None)
+    peer.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+SNI checks on CONNECT tunnels: ClientHello parse + blacklist lookup cost, and tunnel setup latency with the check off and on.
+
+    python benchmarks/bench_tls_hello.py --domains 100000 --tunnels 2000
+
+ClientHellos are produced by the ssl module (the interpreter's OpenSSL, so
+sizes and extensions match a real client), with a padded variant standing
+in for a hello carrying post-quantum key shares. Tunnel setup is measured
+from sending CONNECT to reading back the ClientHello from an echo server
+behind the proxy, one tunnel at a time.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import ssl
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from core.config import PyShieldConfig  # noqa: E402
+from core.logging_system import LoggerFactory  # noqa: E402
+from core.proxy_server import HTTPProxyServer  # noqa: E402
+from core.tls_hello import parse_client_hello  # noqa: E402
+from modules.url_blocking import URLBlocker  # noqa: E402
+
+
+def client_hello(server_name: str, padding: int = 0) -> bytes:
+    """The TLS records a client sends first for `server_name`, optionally with a padding extension."""
+    ctx = ssl.create_default_context()
+    ctx.set_alpn_protocols(["h2", "http/1.1"])
+    out = ssl.MemoryBIO()
+    try:
+        ctx.wrap_bio(ssl.MemoryBIO(), out, server_hostname=server_name).do_handshake()
+    except ssl.SSLWantReadError:
+        pass
+    record = out.read()
+    if not padding:
+        return record
+    # Append an RFC 7685 padding extension and fix up the three length fields
+    message = bytearray(record[5:])
+    message += (21).to_bytes(2, "big") + padding.to_bytes(2, "big") + bytes(padding)
+    body_len = len(message) - 4
+    message[1:4] = body_len.to_bytes(3, "big")
+    pos = 4 + 34
+    pos += 1 + message[pos]
+    pos += 2 + int.from_bytes(message[pos:pos + 2], "big")
+    pos += 1 + message[pos]
+    ext_len = int.from_bytes(message[pos:pos + 2], "big") + 4 + padding
+    message[pos:pos + 2] = ext_len.to_bytes(2, "big")
+    return record[:3] + len(message).to_bytes(2, "big") + bytes(message)
+
+
+def bench_parse(blocker: URLBlocker, args: argparse.Namespace) -> None:
+    print(f"{'hello':>10} {'bytes':>6} {'parse us':>9} {'+lookup us':>11}")
+    for label, padding in (("plain", 0), ("pq-sized", 1200)):
+        record = client_hello("www.example-shop.com", padding)
+        message = record[9:]
+        t0 = time.perf_counter()
+        for _ in range(args.iterations):
+            parse_client_hello(message)
+        parse_us = (time.perf_counter() - t0) / args.iterations * 1e6
+        t0 = time.perf_counter()
+        for _ in range(args.iterations):
+            blocker.is_malicious_host(parse_client_hello(message).server_name)
+        total_us = (time.perf_counter() - t0) / args.iterations * 1e6
+        print(f"{label:>10} {len(record):>6} {parse_us:>9.2f} {total_us:>11.2f}")
+
+
+async def bench_tunnels(blocker: URLBlocker, args: argparse.Namespace) -> None:
+    async def echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    origin = await asyncio.start_server(echo, "127.0.0.1", 0)
+    origin_port = origin.sockets[0].getsockname()[1]
+    hello = client_hello("www.example-shop.com")
+    print(f"{'sni check':>10} {'tunnels/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for check in (False, True):
+        cfg = PyShieldConfig()
+        cfg.dashboard.proxy_port = 0
+        cfg.proxy.tunnel_sni_check = check
+        proxy = HTTPProxyServer(cfg, SimpleNamespace(url_blocker=blocker))
+        proxy.logger.setLevel(logging.ERROR)
+        await proxy.start()
+        proxy_port = proxy.server.sockets[0].getsockname()[1]
+        latencies = []
+        t0 = time.perf_counter()
+        for _ in range(args.tunnels):
+            start = time.perf_counter()
+            reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+            writer.write(f"CONNECT 127.0.0.1:{origin_port} HTTP/1.1\r\nHost: x\r\n\r\n".encode() + hello)
+            await reader.readuntil(b"\r\n\r\n")
+            await reader.readexactly(len(hello))
+            latencies.append(time.perf_counter() - start)
+            writer.close()
+        elapsed = time.perf_counter() - t0
+        latencies.sort()
+        print(f"{'on' if check else 'off':>10} {args.tunnels / elapsed:>10.0f} "
+              f"{latencies[len(latencies) // 2] * 1e3:>8.3f} {latencies[int(len(latencies) * 0.99)] * 1e3:>8.3f}",
+              flush=True)
+        await asyncio.sleep(0.1)  # let the last tunnel wind down
+        await proxy.stop()
+        proxy.rules.close()
+    origin.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=100000, help="blacklist size")
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--tunnels", type=int, default=2000)
+    args = parser.parse_args(argv)
+    LoggerFactory.get_logger("pyshield.url").setLevel(logging.ERROR)
+    cfg = PyShieldConfig()
+    cfg.url_blocking.blacklist = [f"bad{i}.example" for i in range(args.domains)]
+    blocker = URLBlocker(cfg.url_blocking)
+    print(f"{args.domains} blacklisted domains")
+    bench_parse(blocker, args)
+    asyncio.run(bench_tunnels(blocker, args))
+
+
+if __name__ == "__main__":
+    main()
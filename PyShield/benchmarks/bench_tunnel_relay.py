@@ -0,0 +1,150 @@
+"""
+CONNECT tunnel throughput and proxy CPU per GB on loopback, per relay mode.
+
+    python benchmarks/bench_tunnel_relay.py --megabytes 2048 --modes stream protocol splice
+
+A child process runs both the origin and the client with blocking sockets
+(C speed, and its CPU is not counted); the proxy runs in this process, so
+the CPU figures are the relay's own user + system time. Each mode moves
+--megabytes through one tunnel downstream (origin -> client), then upstream.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from core.config import PyShieldConfig  # noqa: E402
+from core.proxy_server import HTTPProxyServer  # noqa: E402
+from core.tunnel import SPLICE_AVAILABLE  # noqa: E402
+
+CHUNK = 1 << 20
+
+
+def _send(sock: socket.socket, total: int) -> None:
+    block = memoryview(b"\x5a" * CHUNK)
+    sent = 0
+    while sent < total:
+        n = min(CHUNK, total - sent)
+        sock.sendall(block[:n])
+        sent += n
+    sock.shutdown(socket.SHUT_WR)
+
+
+def _recv(sock: socket.socket, total: int) -> int:
+    buf = bytearray(CHUNK)
+    got = 0
+    while got < total:
+        n = sock.recv_into(buf)
+        if not n:
+            break
+        got += n
+    return got
+
+
+def peer_process(conn, total: int) -> None:
+    """Origin + client. Receives (proxy_port, direction) jobs; replies with (bytes, seconds)."""
+    origin = socket.create_server(("127.0.0.1", 0))
+    conn.send(origin.getsockname()[1])
+    origin_port = origin.getsockname()[1]
+    while True:
+        job = conn.recv()
+        if job is None:
+            return
+        proxy_port, direction = job
+
+        def serve() -> None:
+            s, _ = origin.accept()
+            with s:
+                if direction == "down":
+                    _send(s, total)
+                    _recv(s, 1)  # wait for the client to close
+                else:
+                    result["origin_got"] = _recv(s, total)
+
+        result = {}
+        t = threading.Thread(target=serve)
+        t.start()
+        c = socket.create_connection(("127.0.0.1", proxy_port))
+        c.sendall(f"CONNECT 127.0.0.1:{origin_port} HTTP/1.1\r\nHost: 127.0.0.1:{origin_port}\r\n\r\n".encode())
+        head = b""
+        while b"\r\n\r\n" not in head:
+            head += c.recv(1)
+        t0 = time.perf_counter()
+        if direction == "down":
+            got = _recv(c, total)
+        else:
+            _send(c, total)
+            t.join()
+            got = result.get("origin_got", 0)
+        elapsed = time.perf_counter() - t0
+        c.close()
+        t.join()
+        conn.send((got, elapsed))
+
+
+def cpu_seconds() -> float:
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+
+async def bench_mode(mode: str, conn, total: int) -> None:
+    cfg = PyShieldConfig()
+    cfg.dashboard.proxy_port = 0
+    cfg.proxy.tunnel_relay = mode
+    # The client sends no ClientHello; the SNI peek would only add its timeout to the upstream run
+    cfg.proxy.tunnel_sni_check = False
+    proxy = HTTPProxyServer(cfg, SimpleNamespace())
+    proxy.logger.setLevel(logging.WARNING)
+    await proxy.start()
+    port = proxy.server.sockets[0].getsockname()[1]
+    loop = asyncio.get_running_loop()
+    for direction in ("down", "up"):
+        cpu0 = cpu_seconds()
+        conn.send((port, direction))
+        got, elapsed = await loop.run_in_executor(None, conn.recv)
+        cpu = cpu_seconds() - cpu0
+        gb = got / 1e9
+        status = "" if got == total else f"  (short: {got}/{total} bytes)"
+        await asyncio.sleep(0.2)  # let the proxy see both closes before the next job / shutdown
+        print(f"{mode:>9} {direction:>4}: {gb / elapsed:7.2f} GB/s  {cpu / gb if gb else 0:6.2f} CPU-s/GB{status}", flush=True)
+    await proxy.stop()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megabytes", type=int, default=1024)
+    parser.add_argument("--modes", nargs="+", default=["stream", "protocol", "splice"],
+                        choices=["stream", "protocol", "splice"])
+    args = parser.parse_args(argv)
+    total = args.megabytes * 1024 * 1024
+    if "splice" in args.modes and not SPLICE_AVAILABLE:
+        print("os.splice unavailable: 'splice' runs the protocol relay")
+
+    parent, child = mp.Pipe()
+    peer = mp.Process(target=peer_process, args=(child, total), daemon=True)
+    peer.start()
+    parent.recv()  # origin is listening
+    print(f"{args.megabytes} MiB per direction")
+    for mode in args.modes:
+        asyncio.run(bench_mode(mode, parent, total))
+    parent.send(None)
+    peer.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Proxy throughput against a local origin, with and without the upstream connection pool.
+
+    python benchmarks/bench_upstream_pool.py --requests 5000 --concurrency 32 --body 1024
+
+The origin is a minimal keep-alive HTTP/1.1 server answering every request
+with a fixed Content-Length body. --handshake-ms delays the first response
+on each new origin connection to stand in for the round trip(s) a real
+remote server costs to connect to; the default of 0 measures loopback only.
+By default clients open one proxy connection per request, so the difference
+between runs is upstream reuse alone; --client-keepalive reuses each client's
+proxy connection as well.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from core.config import PyShieldConfig  # noqa: E402
+from core.proxy_server import HTTPProxyServer  # noqa: E402
+
+
+async def start_origin(body_size: int, handshake_ms: float, counters: dict) -> asyncio.AbstractServer:
+    body = b"x" * body_size
+    response = b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+
+    async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        counters["connections"] += 1
+        first = True
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                if first and handshake_ms:
+                    await asyncio.sleep(handshake_ms / 1000)
+                first = False
+                writer.write(response)
+                await writer.drain()
+                if b"connection: close" in head.lower():
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(serve, "127.0.0.1", 0)
+
+
+async def run_clients(proxy_port: int, origin_port: int, requests: int, concurrency: int, keepalive: bool) -> int:
+    request = (f"GET http://127.0.0.1:{origin_port}/ HTTP/1.1\r\n"
+               f"Host: 127.0.0.1:{origin_port}\r\n").encode()
+    remaining = [requests]
+    ok = [0]
+
+    async def one_shot() -> None:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+            writer.write(request + b"Connection: close\r\n\r\n")
+            await writer.drain()
+            data = await reader.read()
+            if data.startswith(b"HTTP/1.1 200"):
+                ok[0] += 1
+            writer.close()
+
+    async def persistent() -> None:
+        reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            writer.write(request + b"\r\n")
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = int(head.lower().split(b"content-length:", 1)[1].split(b"\r\n", 1)[0])
+            await reader.readexactly(length)
+            if head.startswith(b"HTTP/1.1 200"):
+                ok[0] += 1
+        writer.close()
+
+    await asyncio.gather(*((persistent if keepalive else one_shot)() for _ in range(concurrency)))
+    return ok[0]
+
+
+async def bench(pool: bool, args: argparse.Namespace) -> None:
+    counters = {"connections": 0}
+    origin = await start_origin(args.body, args.handshake_ms, counters)
+    origin_port = origin.sockets[0].getsockname()[1]
+
+    cfg = PyShieldConfig()
+    cfg.dashboard.proxy_port = 0
+    cfg.proxy.upstream_pool = pool
+    cfg.proxy.upstream_max_idle_per_host = args.max_idle
+    proxy = HTTPProxyServer(cfg, SimpleNamespace())
+    proxy.logger.setLevel(logging.WARNING)  # per-request INFO lines would dominate the measurement
+    await proxy.start()
+    proxy_port = proxy.server.sockets[0].getsockname()[1]
+
+    await run_clients(proxy_port, origin_port, min(200, args.requests), args.concurrency, args.client_keepalive)  # warm-up
+    counters["connections"] = 0
+    t0 = time.perf_counter()
+    ok = await run_clients(proxy_port, origin_port, args.requests, args.concurrency, args.client_keepalive)
+    elapsed = time.perf_counter() - t0
+
+    label = "pooled" if pool else "unpooled"
+    print(f"{label:>9}: {ok / elapsed:9.0f} req/s  ok={ok}/{args.requests}  "
+          f"origin connections={counters['connections']}")
+    if proxy.upstream_pool is not None:
+        print(f"{'':>11}pool {proxy.upstream_pool.snapshot()}")
+    await proxy.stop()
+    origin.close()
+    await origin.wait_closed()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--body", type=int, default=1024, help="response body bytes")
+    parser.add_argument("--max-idle", type=int, default=32, help="idle connections kept per upstream")
+    parser.add_argument("--client-keepalive", action="store_true", help="reuse each client's proxy connection")
+    parser.add_argument("--handshake-ms", type=float, default=0.0, help="simulated cost of a new origin connection")
+    args = parser.parse_args(argv)
+
+    print(f"requests={args.requests} concurrency={args.concurrency} body={args.body}B "
+          f"handshake={args.handshake_ms}ms client_keepalive={args.client_keepalive}")
+    for pool in (False, True):
+        asyncio.run(bench(pool, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Admission control for proxy client connections.
+
+Every accepted socket is checked before a byte is read from it: peers
+holding a ban are dropped at once, and connections past the global or
+per-IP cap are turned away with a 503 instead of piling up until the
+process runs out of file descriptors. The 503 is followed by a lingering
+close: closing a socket with the client's request still unread makes the
+kernel send an RST, which can discard the response before it is read.
+Lingering sockets are capped too; past that cap a refusal closes at once.
+Connections that are admitted but stall inside a request head
+(slowloris) or send an oversized one are counted here too, so
+`/proxy/stats` shows why clients were refused.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Rejection reasons, in the order they are checked (the last two come from the proxy while reading)
+BANNED = "banned"
+CONNECTION_LIMIT = "connection_limit"
+PER_IP_LIMIT = "per_ip_limit"
+HEADER_TIMEOUT = "header_timeout"
+HEADER_TOO_LARGE = "header_too_large"
+REASONS = (BANNED, CONNECTION_LIMIT, PER_IP_LIMIT, HEADER_TIMEOUT, HEADER_TOO_LARGE)
+
+DEFAULT_MAX_CONNECTIONS = 1024
+
+# Lingering close after a 503: how long, and how much input, to read and discard before closing
+REFUSAL_LINGER_SECONDS = 0.5
+REFUSAL_LINGER_BYTES = 64 * 1024
+# Refused sockets allowed to linger at once; a flood past the caps must not hold descriptors without bound
+MAX_LINGERING_REFUSALS = 64
+
+
+def default_max_connections() -> int:
+    """
+    Half the soft file descriptor limit: a proxied request holds the client
+    socket and an upstream one, and the listener, logs and pool need a few more.
+    """
+    if resource is None:
+        return DEFAULT_MAX_CONNECTIONS
+    try:
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (OSError, ValueError):
+        return DEFAULT_MAX_CONNECTIONS
+    if soft == resource.RLIM_INFINITY:
+        return DEFAULT_MAX_CONNECTIONS * 64
+    return max((soft - 32) // 2, 1)
+
+
+class AdmissionControl:
+    """
+    Open connection counts, global and per client IP, plus rejection counters.
+
+    Only the proxy's event loop calls `admit`/`release`/`reject`; the
+    dashboard thread reads `snapshot()`, which copies plain ints. With
+    proxy workers every process enforces its own caps.
+    """
+
+    def __init__(self, max_connections: int = 0, max_per_ip: int = 0, bans=None,
+                 max_lingering: int = MAX_LINGERING_REFUSALS) -> None:
+        # 0 = derived from the file descriptor limit
+        self.max_connections = max_connections if max_connections > 0 else default_max_connections()
+        # 0 = no per-IP cap
+        self.max_per_ip = max(max_per_ip, 0)
+        self.bans = bans
+        self.active = 0
+        self.peak = 0
+        self.accepted = 0
+        self._per_ip: Dict[str, int] = {}
+        # Refused connections currently in their lingering close, and refusals closed at once for lack of room
+        self.max_lingering = max(max_lingering, 0)
+        self.lingering = 0
+        self.unlingered = 0
+        self.rejected: Dict[str, int] = dict.fromkeys(REASONS, 0)
+
+    def admit(self, client_ip: str) -> Optional[str]:
+        """Take a slot for a new connection from `client_ip`, or return why it is refused."""
+        if self.bans is not None and self.bans.get(client_ip) is not None:
+            return self.reject(BANNED)
+        if self.active >= self.max_connections:
+            return self.reject(CONNECTION_LIMIT)
+        open_from_ip = self._per_ip.get(client_ip, 0)
+        if self.max_per_ip and open_from_ip >= self.max_per_ip:
+            return self.reject(PER_IP_LIMIT)
+        self._per_ip[client_ip] = open_from_ip + 1
+        self.active += 1
+        self.accepted += 1
+        if self.active > self.peak:
+            self.peak = self.active
+        return None
+
+    def release(self, client_ip: str) -> None:
+        """Give back the slot of an admitted connection."""
+        self.active -= 1
+        remaining = self._per_ip.get(client_ip, 1) - 1
+        if remaining > 0:
+            self._per_ip[client_ip] = remaining
+        else:
+            self._per_ip.pop(client_ip, None)
+
+    def start_linger(self) -> bool:
+        """Take a lingering-close slot for a refused connection; False if it must close at once."""
+        if self.lingering >= self.max_lingering:
+            self.unlingered += 1
+            return False
+        self.lingering += 1
+        return True
+
+    def end_linger(self) -> None:
+        self.lingering -= 1
+
+    def reject(self, reason: str) -> str:
+        self.rejected[reason] += 1
+        return reason
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "peak": self.peak,
+            "accepted": self.accepted,
+            "max_connections": self.max_connections,
+            "max_per_ip": self.max_per_ip,
+            "client_ips": len(self._per_ip),
+            "lingering": self.lingering,
+            "unlingered": self.unlingered,
+            "rejected": dict(self.rejected),
+        }
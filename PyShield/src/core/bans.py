@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .ipnet import network_int, parse_ip, parse_prefix
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .shared_state import SharedBanTable
+
+BanListener = Callable[[str, "BanEntry"], None]
+
+
+@dataclass
+class BanEntry:
+    key: str
+    until: float
+    reason: str
+    source: str
+    created: float
+    # False when the key was taken from a request header (X-Forwarded-For) rather than the socket peer
+    peer: bool = True
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "key": self.key,
+            "until": self.until,
+            "reason": self.reason,
+            "source": self.source,
+            "created": self.created,
+            "peer": self.peer,
+        }
+
+
+class BanRegistry:
+    """
+    Active bans shared by every module that can ban a client.
+
+    `is_banned` is a single dict probe for clients that are not banned. Expiry
+    is driven by a min-heap of deadlines, so `expire()` only touches entries
+    that are actually due instead of rescanning the table. Listeners receive
+    ("ban" | "unban" | "expire", entry) after each change.
+
+    Keys are IP literals or 'network/length' prefixes. While prefix bans are
+    active, lookups also probe one key per banned prefix length.
+
+    With a shared table attached (proxy worker processes), bans are written
+    through to it and lookups are answered from it, so a ban issued in any
+    process applies in all of them at once. The local entries then only
+    carry reasons and drive listeners; `sync_shared` mirrors the table into
+    them in the process that owns it.
+    """
+
+    def __init__(self) -> None:
+        self._bans: Dict[str, BanEntry] = {}
+        self._heap: List[Tuple[float, str]] = []
+        # (version, prefix length) -> {network int: key} for active prefix bans
+        self._prefixes: Dict[Tuple[int, int], Dict[int, str]] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[BanListener] = []
+        self._shared: Optional["SharedBanTable"] = None
+
+    def subscribe(self, listener: BanListener) -> None:
+        self._listeners.append(listener)
+
+    def clear_listeners(self) -> None:
+        self._listeners = []
+
+    @property
+    def shared(self) -> Optional["SharedBanTable"]:
+        return self._shared
+
+    def attach_shared(self, table: "SharedBanTable") -> None:
+        """Share bans through `table` from now on, starting with the ones already active."""
+        with self._lock:
+            self._shared = table
+            for entry in self._bans.values():
+                table.ban(entry.key, entry.until)
+
+    def _notify(self, event: str, entries: List[BanEntry]) -> None:
+        for entry in entries:
+            for listener in self._listeners:
+                try:
+                    listener(event, entry)
+                except Exception:  # pragma: no cover
+                    pass
+
+    def ban(self, key: str, seconds: float, *, reason: str, source: str,
+            now: Optional[float] = None, peer: bool = True) -> BanEntry:
+        """
+        Ban `key` for `seconds`. An existing longer ban is kept; a shorter one is extended.
+        `peer` is False when `key` is a client-supplied address (forwarding headers).
+        """
+        t = now if now is not None else time.time()
+        until = t + seconds
+        with self._lock:
+            entry = self._bans.get(key)
+            if self._shared is not None:
+                # Even if the local entry is longer: it may have been lifted in another process
+                self._shared.ban(key, max(until, entry.until) if entry is not None else until, now=t)
+            if entry is not None and entry.until >= until:
+                return entry
+            # Once seen as a socket peer, an extension from a forwarded address does not make it less so
+            peer = peer or (entry is not None and entry.peer)
+            entry = BanEntry(key=key, until=until, reason=reason, source=source, created=t, peer=peer)
+            self._bans[key] = entry
+            self._index_prefix(key, add=True)
+            heapq.heappush(self._heap, (until, key))
+            expired = self._expire_locked(t)
+        self._notify("expire", expired)
+        self._notify("ban", [entry])
+        return entry
+
+    def unban(self, key: str) -> bool:
+        with self._lock:
+            entry = self._bans.pop(key, None)
+            if entry is not None:
+                self._index_prefix(key, add=False)
+            lifted = self._shared is not None and self._shared.unban(key)
+        if entry is None:
+            return lifted
+        self._notify("unban", [entry])
+        return True
+
+    def _index_prefix(self, key: str, *, add: bool) -> None:
+        parsed = parse_prefix(key)
+        if parsed is None:
+            return
+        version, net, length = parsed
+        if add:
+            self._prefixes.setdefault((version, length), {})[net] = key
+            return
+        nets = self._prefixes.get((version, length))
+        if nets is not None:
+            nets.pop(net, None)
+            if not nets:
+                del self._prefixes[(version, length)]
+
+    def _covering_prefix(self, ip: str) -> Optional[BanEntry]:
+        parsed = parse_ip(ip)
+        if parsed is None:
+            return None
+        version, value = parsed
+        for (v, length), nets in list(self._prefixes.items()):
+            if v == version:
+                key = nets.get(network_int(version, value, length))
+                if key is not None:
+                    entry = self._bans.get(key)
+                    if entry is not None:
+                        return entry
+        return None
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[BanEntry]:
+        if self._shared is not None:
+            return self._get_shared(self._shared, key, now)
+        entry = self._bans.get(key)
+        if entry is None and self._prefixes:
+            entry = self._covering_prefix(key)
+        if entry is None:
+            return None
+        t = now if now is not None else time.time()
+        if entry.until > t:
+            return entry
+        self.expire(t)
+        return None
+
+    def _get_shared(self, shared: "SharedBanTable", key: str, now: Optional[float]) -> Optional[BanEntry]:
+        t = now if now is not None else time.time()
+        found = shared.lookup(key, now=t)
+        if found is None:
+            return None
+        ban_key, until = found
+        entry = self._bans.get(ban_key)
+        if entry is not None and entry.until == until:
+            return entry
+        if entry is not None:
+            return BanEntry(key=ban_key, until=until, reason=entry.reason, source=entry.source, created=entry.created)
+        return BanEntry(key=ban_key, until=until, reason="banned by another process", source="shared", created=t)
+
+    def sync_shared(self, now: Optional[float] = None) -> int:
+        """
+        In the process that owns the shared table: drop its expired entries,
+        then mirror it into the local entries and notify listeners of bans
+        issued or lifted in other processes. Returns local changes.
+        """
+        shared = self._shared
+        if shared is None or not shared.owner:
+            return 0
+        t = now if now is not None else time.time()
+        started = time.time()
+        shared.sweep(now=t)
+        current = dict(shared.items(now=t))
+        added: List[BanEntry] = []
+        lifted: List[BanEntry] = []
+        with self._lock:
+            for key, until in current.items():
+                entry = self._bans.get(key)
+                if entry is not None and entry.until >= until:
+                    continue
+                if entry is None:
+                    # Proxy workers only ban socket peers
+                    self._index_prefix(key, add=True)
+                    reason, source, peer = "banned by another process", "shared", True
+                else:
+                    reason, source, peer = entry.reason, entry.source, entry.peer
+                entry = BanEntry(key=key, until=until, reason=reason, source=source, created=t, peer=peer)
+                self._bans[key] = entry
+                heapq.heappush(self._heap, (until, key))
+                added.append(entry)
+            for key, entry in list(self._bans.items()):
+                # Entries created after the table was read are not in `current` yet
+                if key not in current and entry.until > t and entry.created < started:
+                    del self._bans[key]
+                    self._index_prefix(key, add=False)
+                    lifted.append(entry)
+        self._notify("ban", added)
+        self._notify("unban", lifted)
+        return len(added) + len(lifted)
+
+    def is_banned(self, key: str, now: Optional[float] = None) -> bool:
+        return self.get(key, now=now) is not None
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Remove bans whose deadline has passed. Returns the number removed."""
+        t = now if now is not None else time.time()
+        if not self._heap or self._heap[0][0] > t:
+            return 0
+        with self._lock:
+            expired = self._expire_locked(t)
+        self._notify("expire", expired)
+        return len(expired)
+
+    def _expire_locked(self, t: float) -> List[BanEntry]:
+        heap = self._heap
+        expired: List[BanEntry] = []
+        while heap and heap[0][0] <= t:
+            until, key = heapq.heappop(heap)
+            entry = self._bans.get(key)
+            # Stale heap item if the ban was extended or lifted meanwhile
+            if entry is not None and entry.until == until:
+                del self._bans[key]
+                self._index_prefix(key, add=False)
+                expired.append(entry)
+        return expired
+
+    def active(self, now: Optional[float] = None) -> Iterator[BanEntry]:
+        """Iterate over a snapshot of the bans that are still in force."""
+        t = now if now is not None else time.time()
+        return (e for e in list(self._bans.values()) if e.until > t)
+
+    def snapshot(self, now: Optional[float] = None) -> List[Dict[str, object]]:
+        return [e.to_dict() for e in self.active(now)]
+
+    def __len__(self) -> int:
+        return len(self._bans)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self.is_banned(key)
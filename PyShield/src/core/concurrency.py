@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import threading
+from typing import Dict, Generic, Hashable, Iterator, List, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+
+def _stripe_count(stripes: int) -> int:
+    # Power of two so the stripe index is a mask instead of a modulo
+    n = 1
+    while n < max(stripes, 1):
+        n <<= 1
+    return n
+
+
+class StripedLock:
+    """
+    A fixed pool of locks indexed by key hash.
+
+    Two threads only contend when their keys land on the same stripe, so the
+    proxy loop and the uvicorn thread rarely wait on each other.
+    """
+
+    def __init__(self, stripes: int = 64) -> None:
+        n = _stripe_count(stripes)
+        self._mask = n - 1
+        self._locks: List[threading.Lock] = [threading.Lock() for _ in range(n)]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def for_key(self, key: Hashable) -> threading.Lock:
+        return self._locks[hash(key) & self._mask]
+
+    def index(self, key: Hashable) -> int:
+        """Stripe of `key`, for callers that keep per-stripe state guarded by `at(index)`."""
+        return hash(key) & self._mask
+
+    def at(self, index: int) -> threading.Lock:
+        return self._locks[index]
+
+
+class ShardedCounter(Generic[K]):
+    """
+    Key -> int counter split over independently locked shards.
+
+    `snapshot()` copies one shard at a time, so readers never observe a dict
+    that is being resized by a writer.
+    """
+
+    def __init__(self, shards: int = 16) -> None:
+        n = _stripe_count(shards)
+        self._mask = n - 1
+        self._shards: List[Tuple[threading.Lock, Dict[K, int]]] = [(threading.Lock(), {}) for _ in range(n)]
+
+    def incr(self, key: K, amount: int = 1) -> int:
+        lock, data = self._shards[hash(key) & self._mask]
+        with lock:
+            value = data.get(key, 0) + amount
+            data[key] = value
+        return value
+
+    def get(self, key: K, default: int = 0) -> int:
+        _, data = self._shards[hash(key) & self._mask]
+        return data.get(key, default)
+
+    def pop(self, key: K, default: int = 0) -> int:
+        lock, data = self._shards[hash(key) & self._mask]
+        with lock:
+            return data.pop(key, default)
+
+    def snapshot(self) -> Dict[K, int]:
+        out: Dict[K, int] = {}
+        for lock, data in self._shards:
+            with lock:
+                out.update(data)
+        return out
+
+    def items(self) -> Iterator[Tuple[K, int]]:
+        return iter(self.snapshot().items())
+
+    def __len__(self) -> int:
+        return sum(len(data) for _, data in self._shards)
+
+    def __contains__(self, key: object) -> bool:
+        _, data = self._shards[hash(key) & self._mask]
+        return key in data
@@ -11,6 +11,17 @@ import yaml
 class RedisConfig:
     enabled: bool = False
     url: str = "redis://localhost:6379/0"
+    max_connections: int = 20
+
+
+@dataclass
+class RoutePolicy:
+    group: str
+    prefixes: List[str] = field(default_factory=list)
+    # Budget units charged per request, against the per-IP, per-route and global limits
+    cost: float = 1.0
+    # Per (IP, group) limit in cost units per window; 0 = only charge the shared buckets
+    limit: int = 0
 
 
 @dataclass
@@ -20,6 +31,20 @@ class DDoSConfig:
     window_seconds: int = 60
     ban_seconds: int = 900
     use_redis: bool = False
+    # Local limiter: sliding_log (exact, O(limit) per IP), gcra or sliding_counter (O(1) per IP)
+    algorithm: str = "sliding_log"
+    sweep_interval_seconds: int = 30
+    # Redis limiter (use_redis): spend a local per-IP budget and reconcile in batches
+    redis_hybrid: bool = False
+    redis_local_budget: int = 10
+    redis_sync_interval_ms: int = 1000
+    # Aggregate limits per network, {prefix length: request_limit}; the whole prefix is banned
+    prefix_limits_v4: Dict[int, int] = field(default_factory=dict)
+    prefix_limits_v6: Dict[int, int] = field(default_factory=dict)
+    prefix_max_nodes: int = 200000
+    # Cost-weighted route groups and a global cap (cost units per window, 0 = off)
+    route_policies: List[RoutePolicy] = field(default_factory=list)
+    global_limit: int = 0
 
 
 @dataclass
@@ -29,6 +54,13 @@ class URLBlockingConfig:
     feeds: List[str] = field(default_factory=list)
     virustotal_api_key: Optional[str] = None
     auto_update_minutes: int = 60
+    feed_concurrency: int = 4
+    feed_timeout_seconds: int = 30
+    index_path: Optional[str] = None  # compiled blacklist, mmap'ed at startup
+    bloom_bits_per_key: int = 0  # >0 writes a Bloom filter in front of the index
+    verdict_cache_size: int = 4096  # hosts whose verdict is cached (0 disables)
+    path_rules: List[str] = field(default_factory=list)  # substrings of 'path?query'; 're:' prefix for regexes
+    path_rule_feeds: List[str] = field(default_factory=list)
 
 
 @dataclass
@@ -38,6 +70,33 @@ class PortBlockingConfig:
     dry_run: bool = True  # Safe default for development/testing
 
 
+@dataclass
+class BanEnforcementConfig:
+    enabled: bool = False
+    backend: str = "ipset"  # ipset | nftables
+    set_name: str = "pyshield_bans"
+    flush_interval_ms: int = 500
+    dry_run: bool = True  # Safe default for development/testing
+    # Networks never mirrored into the kernel set (admin hosts, resolvers, upstream proxies); loopback always is
+    never_ban: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ReputationConfig:
+    enabled: bool = False
+    provider: str = "virustotal"
+    api_key: Optional[str] = None  # falls back to url_blocking.virustotal_api_key
+    base_url: str = "https://www.virustotal.com/api/v3"
+    blocking: bool = False  # False: first request to an unknown host passes, later ones get the verdict
+    positive_ttl_seconds: int = 86400
+    negative_ttl_seconds: int = 3600
+    requests_per_minute: float = 4  # VirusTotal public API quota
+    burst: int = 4
+    timeout_seconds: float = 5.0
+    malicious_threshold: int = 1  # engines that must flag a host
+    max_entries: int = 100000
+
+
 @dataclass
 class IDSConfig:
     enabled: bool = True
@@ -55,6 +114,13 @@ class GeoBlockingConfig:
     geoip_db_path: Optional[str] = None
 
 
+@dataclass
+class RulesConfig:
+    executor_workers: int = 4  # threads for blocking checks (GeoIP reader, sync Redis) and alert hooks
+    adaptive_order: bool = True  # re-sort checks by observed latency / block rate
+    reorder_every: int = 1000  # requests between re-sorts
+
+
 @dataclass
 class InspectionConfig:
     enabled: bool = False
@@ -89,6 +155,51 @@ class DashboardConfig:
     proxy_port: int = 8888
 
 
+@dataclass
+class ProxyConfig:
+    client_keepalive: bool = True  # serve several requests per browser connection
+    client_idle_timeout_seconds: float = 60.0  # wait for the next request on an idle client connection
+    client_max_requests: int = 1000
+    client_max_connections: int = 0  # open client connections before new ones get 503; 0 = half the fd limit
+    client_max_connections_per_ip: int = 256  # 0 = no per-IP cap
+    client_header_timeout_seconds: float = 10.0  # deadline for the rest of a request head once it has started
+    client_max_header_bytes: int = 64 * 1024  # larger request heads get 431 (the client StreamReader limit)
+    history_size: int = 1000  # requests kept for the dashboard; ring buffer, up to ~100000 is cheap
+    stats_window_seconds: int = 60  # per-second request counts kept for the recent rate
+    upstream_pool: bool = True  # reuse keep-alive connections to plain-HTTP upstreams
+    upstream_max_per_host: int = 32  # connections in use at once per (host, port)
+    upstream_max_idle_per_host: int = 32
+    upstream_idle_timeout_seconds: float = 30.0
+    upstream_connect_timeout_seconds: float = 10.0
+    upstream_max_requests: int = 1000  # requests per upstream connection before it is retired
+    max_request_body_bytes: int = 0  # larger uploads get 413; 0 = unlimited (bodies are streamed either way)
+    max_response_body_bytes: int = 0  # larger responses are refused (502) or cut off; 0 = unlimited
+    tunnel_relay: str = "protocol"  # CONNECT relay: stream | protocol | splice (Linux, falls back to protocol)
+    tunnel_sni_check: bool = True  # match the ClientHello server name of CONNECT tunnels against the blacklist
+    tunnel_sni_timeout_seconds: float = 1.0  # client bytes wait this long for a hello; server bytes flow meanwhile
+    dns_backend: str = "system"  # system (getaddrinfo) | aiodns (record TTLs; requires aiodns)
+    dns_nameservers: List[str] = field(default_factory=list)  # aiodns only; empty uses the system's
+    dns_static_hosts: Dict[str, List[str]] = field(default_factory=dict)  # name -> IPs, answered locally
+    dns_default_ttl_seconds: float = 60.0  # when the backend reports no TTL
+    dns_min_ttl_seconds: float = 5.0
+    dns_max_ttl_seconds: float = 3600.0
+    dns_negative_ttl_seconds: float = 10.0  # "no such name" answers
+    dns_timeout_seconds: float = 5.0
+    dns_max_entries: int = 10000
+    happy_eyeballs_delay_seconds: float = 0.25  # head start of each connection attempt before the next one
+    cache_enabled: bool = False  # shared RFC 9111 cache of plain-HTTP GET responses
+    cache_memory_bytes: int = 64 * 1024 * 1024  # memory tier budget; least recently used entries go first
+    cache_max_object_bytes: int = 8 * 1024 * 1024  # larger responses are relayed but not stored
+    cache_disk_path: Optional[str] = None  # directory of the disk tier (entries evicted from memory); None = off
+    # With proxy workers each one keeps its tier in <cache_disk_path>/worker-N with 1/workers of cache_disk_bytes
+    cache_disk_bytes: int = 1024 * 1024 * 1024
+    cache_heuristic_max_seconds: int = 86400  # cap on freshness guessed from Last-Modified
+    cache_coalesce_timeout_seconds: float = 10.0  # concurrent misses wait this long for the first fetch
+    workers: int = 0  # >1: fork that many proxy processes sharing the port (SO_REUSEPORT; Linux/BSD)
+    shared_ban_slots: int = 65536  # capacity of the ban table shared by workers
+    shared_counter_slots: int = 262144  # client IPs tracked by the shared per-IP rate limit
+
+
 @dataclass
 class LoggingConfig:
     level: str = "INFO"
@@ -104,11 +215,15 @@ class PyShieldConfig:
     ddos: DDoSConfig = field(default_factory=DDoSConfig)
     url_blocking: URLBlockingConfig = field(default_factory=URLBlockingConfig)
     port_blocking: PortBlockingConfig = field(default_factory=PortBlockingConfig)
+    ban_enforcement: BanEnforcementConfig = field(default_factory=BanEnforcementConfig)
+    reputation: ReputationConfig = field(default_factory=ReputationConfig)
     ids: IDSConfig = field(default_factory=IDSConfig)
     geo: GeoBlockingConfig = field(default_factory=GeoBlockingConfig)
+    rules: RulesConfig = field(default_factory=RulesConfig)
     inspection: InspectionConfig = field(default_factory=InspectionConfig)
     alerts: AlertConfig = field(default_factory=AlertConfig)
     dashboard: DashboardConfig = field(default_factory=DashboardConfig)
+    proxy: ProxyConfig = field(default_factory=ProxyConfig)
     logging: LoggingConfig = field(default_factory=LoggingConfig)
     redis: RedisConfig = field(default_factory=RedisConfig)
 
@@ -130,11 +245,15 @@ class ConfigLoader:
         ddos = get(data, "ddos", {})
         urlb = get(data, "url_blocking", {})
         ports = get(data, "port_blocking", {})
+        enforcement = get(data, "ban_enforcement", {})
+        reputation = get(data, "reputation", {})
         ids = get(data, "ids", {})
         geo = get(data, "geo", {})
+        rules = get(data, "rules", {})
         inspection = get(data, "inspection", {})
         alerts = get(data, "alerts", {})
         dashboard = get(data, "dashboard", {})
+        proxy = get(data, "proxy", {})
         logging = get(data, "logging", {})
         redis = get(data, "redis", {})
 
@@ -145,6 +264,24 @@ class ConfigLoader:
                 window_seconds=ddos.get("window_seconds", 60),
                 ban_seconds=ddos.get("ban_seconds", 900),
                 use_redis=ddos.get("use_redis", False),
+                algorithm=ddos.get("algorithm", "sliding_log"),
+                sweep_interval_seconds=ddos.get("sweep_interval_seconds", 30),
+                redis_hybrid=ddos.get("redis_hybrid", False),
+                redis_local_budget=ddos.get("redis_local_budget", 10),
+                redis_sync_interval_ms=ddos.get("redis_sync_interval_ms", 1000),
+                prefix_limits_v4={int(k): int(v) for k, v in (ddos.get("prefix_limits_v4") or {}).items()},
+                prefix_limits_v6={int(k): int(v) for k, v in (ddos.get("prefix_limits_v6") or {}).items()},
+                prefix_max_nodes=ddos.get("prefix_max_nodes", 200000),
+                route_policies=[
+                    RoutePolicy(
+                        group=str(r.get("group", "")),
+                        prefixes=list(r.get("prefixes", []) or []),
+                        cost=float(r.get("cost", 1.0)),
+                        limit=int(r.get("limit", 0)),
+                    )
+                    for r in (ddos.get("route_policies") or [])
+                ],
+                global_limit=ddos.get("global_limit", 0),
             ),
             url_blocking=URLBlockingConfig(
                 enabled=urlb.get("enabled", True),
@@ -152,12 +289,41 @@ class ConfigLoader:
                 feeds=list(urlb.get("feeds", []) or []),
                 virustotal_api_key=urlb.get("virustotal_api_key"),
                 auto_update_minutes=urlb.get("auto_update_minutes", 60),
+                feed_concurrency=urlb.get("feed_concurrency", 4),
+                feed_timeout_seconds=urlb.get("feed_timeout_seconds", 30),
+                index_path=urlb.get("index_path"),
+                bloom_bits_per_key=urlb.get("bloom_bits_per_key", 0),
+                verdict_cache_size=urlb.get("verdict_cache_size", 4096),
+                path_rules=list(urlb.get("path_rules", []) or []),
+                path_rule_feeds=list(urlb.get("path_rule_feeds", []) or []),
             ),
             port_blocking=PortBlockingConfig(
                 enabled=ports.get("enabled", True),
                 blocked_ports=list(ports.get("blocked_ports", []) or []),
                 dry_run=ports.get("dry_run", True),
             ),
+            ban_enforcement=BanEnforcementConfig(
+                enabled=enforcement.get("enabled", False),
+                backend=enforcement.get("backend", "ipset"),
+                set_name=enforcement.get("set_name", "pyshield_bans"),
+                flush_interval_ms=enforcement.get("flush_interval_ms", 500),
+                dry_run=enforcement.get("dry_run", True),
+                never_ban=list(enforcement.get("never_ban", []) or []),
+            ),
+            reputation=ReputationConfig(
+                enabled=reputation.get("enabled", False),
+                provider=reputation.get("provider", "virustotal"),
+                api_key=reputation.get("api_key"),
+                base_url=reputation.get("base_url", "https://www.virustotal.com/api/v3"),
+                blocking=reputation.get("blocking", False),
+                positive_ttl_seconds=reputation.get("positive_ttl_seconds", 86400),
+                negative_ttl_seconds=reputation.get("negative_ttl_seconds", 3600),
+                requests_per_minute=reputation.get("requests_per_minute", 4),
+                burst=reputation.get("burst", 4),
+                timeout_seconds=reputation.get("timeout_seconds", 5.0),
+                malicious_threshold=reputation.get("malicious_threshold", 1),
+                max_entries=reputation.get("max_entries", 100000),
+            ),
             ids=IDSConfig(
                 enabled=ids.get("enabled", True),
                 failed_login_threshold=ids.get("failed_login_threshold", 5),
@@ -170,6 +336,11 @@ class ConfigLoader:
                 whitelist_countries=list(geo.get("whitelist_countries", []) or []),
                 geoip_db_path=geo.get("geoip_db_path"),
             ),
+            rules=RulesConfig(
+                executor_workers=rules.get("executor_workers", 4),
+                adaptive_order=rules.get("adaptive_order", True),
+                reorder_every=rules.get("reorder_every", 1000),
+            ),
             inspection=InspectionConfig(
                 enabled=inspection.get("enabled", False),
                 interface=inspection.get("interface"),
@@ -197,6 +368,49 @@ class ConfigLoader:
                 enable_proxy=dashboard.get("enable_proxy", False),
                 proxy_port=dashboard.get("proxy_port", 8888),
             ),
+            proxy=ProxyConfig(
+                client_keepalive=proxy.get("client_keepalive", True),
+                client_idle_timeout_seconds=proxy.get("client_idle_timeout_seconds", 60.0),
+                client_max_requests=proxy.get("client_max_requests", 1000),
+                client_max_connections=proxy.get("client_max_connections", 0),
+                client_max_connections_per_ip=proxy.get("client_max_connections_per_ip", 256),
+                client_header_timeout_seconds=proxy.get("client_header_timeout_seconds", 10.0),
+                client_max_header_bytes=proxy.get("client_max_header_bytes", 64 * 1024),
+                history_size=proxy.get("history_size", 1000),
+                stats_window_seconds=proxy.get("stats_window_seconds", 60),
+                upstream_pool=proxy.get("upstream_pool", True),
+                upstream_max_per_host=proxy.get("upstream_max_per_host", 32),
+                upstream_max_idle_per_host=proxy.get("upstream_max_idle_per_host", 32),
+                upstream_idle_timeout_seconds=proxy.get("upstream_idle_timeout_seconds", 30.0),
+                upstream_connect_timeout_seconds=proxy.get("upstream_connect_timeout_seconds", 10.0),
+                upstream_max_requests=proxy.get("upstream_max_requests", 1000),
+                max_request_body_bytes=proxy.get("max_request_body_bytes", 0),
+                max_response_body_bytes=proxy.get("max_response_body_bytes", 0),
+                tunnel_relay=proxy.get("tunnel_relay", "protocol"),
+                tunnel_sni_check=proxy.get("tunnel_sni_check", True),
+                tunnel_sni_timeout_seconds=proxy.get("tunnel_sni_timeout_seconds", 1.0),
+                dns_backend=proxy.get("dns_backend", "system"),
+                dns_nameservers=list(proxy.get("dns_nameservers", []) or []),
+                dns_static_hosts={str(k): [str(ip) for ip in (v if isinstance(v, list) else [v])]
+                                  for k, v in (proxy.get("dns_static_hosts") or {}).items()},
+                dns_default_ttl_seconds=proxy.get("dns_default_ttl_seconds", 60.0),
+                dns_min_ttl_seconds=proxy.get("dns_min_ttl_seconds", 5.0),
+                dns_max_ttl_seconds=proxy.get("dns_max_ttl_seconds", 3600.0),
+                dns_negative_ttl_seconds=proxy.get("dns_negative_ttl_seconds", 10.0),
+                dns_timeout_seconds=proxy.get("dns_timeout_seconds", 5.0),
+                dns_max_entries=proxy.get("dns_max_entries", 10000),
+                happy_eyeballs_delay_seconds=proxy.get("happy_eyeballs_delay_seconds", 0.25),
+                cache_enabled=proxy.get("cache_enabled", False),
+                cache_memory_bytes=proxy.get("cache_memory_bytes", 64 * 1024 * 1024),
+                cache_max_object_bytes=proxy.get("cache_max_object_bytes", 8 * 1024 * 1024),
+                cache_disk_path=proxy.get("cache_disk_path"),
+                cache_disk_bytes=proxy.get("cache_disk_bytes", 1024 * 1024 * 1024),
+                cache_heuristic_max_seconds=proxy.get("cache_heuristic_max_seconds", 86400),
+                cache_coalesce_timeout_seconds=proxy.get("cache_coalesce_timeout_seconds", 10.0),
+                workers=proxy.get("workers", 0),
+                shared_ban_slots=proxy.get("shared_ban_slots", 65536),
+                shared_counter_slots=proxy.get("shared_counter_slots", 262144),
+            ),
             logging=LoggingConfig(
                 level=logging.get("level", "INFO"),
                 json=logging.get("json", False),
@@ -208,6 +422,7 @@ class ConfigLoader:
             redis=RedisConfig(
                 enabled=redis.get("enabled", False),
                 url=redis.get("url", "redis://localhost:6379/0"),
+                max_connections=redis.get("max_connections", 20),
             ),
         )
 
@@ -220,6 +435,7 @@ class ConfigLoader:
 
         cfg.ddos.enabled = env_bool("PYSHIELD_DDOS_ENABLED", cfg.ddos.enabled)
         cfg.port_blocking.dry_run = env_bool("PYSHIELD_PORTS_DRY_RUN", cfg.port_blocking.dry_run)
+        cfg.ban_enforcement.dry_run = env_bool("PYSHIELD_BANS_DRY_RUN", cfg.ban_enforcement.dry_run)
         cfg.dashboard.enabled = env_bool("PYSHIELD_DASHBOARD_ENABLED", cfg.dashboard.enabled)
 
         return cfg
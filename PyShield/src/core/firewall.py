@@ -4,8 +4,9 @@ import platform
 import threading
 import time
 from dataclasses import dataclass, field
-from typing import Dict, Set, Optional
+from typing import Any, Dict, Set, Optional
 
+from .concurrency import ShardedCounter
 from .config import PyShieldConfig
 from .logging_system import LoggerFactory
 from .alerts import AlertSender
@@ -13,10 +14,26 @@ from .alerts import AlertSender
 
 @dataclass
 class Stats:
-    blocked_ips: Dict[str, int] = field(default_factory=dict)
-    blocked_urls: Dict[str, int] = field(default_factory=dict)
+    # Updated from the proxy loop and the uvicorn thread concurrently
+    blocked_ips: ShardedCounter[str] = field(default_factory=ShardedCounter)
+    blocked_urls: ShardedCounter[str] = field(default_factory=ShardedCounter)
     blocked_ports: Set[int] = field(default_factory=set)
-    active_attacks: Dict[str, int] = field(default_factory=dict)
+    active_attacks: ShardedCounter[str] = field(default_factory=ShardedCounter)
+    _ports_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add_blocked_port(self, port: int) -> None:
+        with self._ports_lock:
+            self.blocked_ports.add(port)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._ports_lock:
+            ports = sorted(self.blocked_ports)
+        return {
+            "blocked_ips": self.blocked_ips.snapshot(),
+            "blocked_urls": self.blocked_urls.snapshot(),
+            "blocked_ports": ports,
+            "active_attacks": self.active_attacks.snapshot(),
+        }
 
 
 class PyShield:
@@ -58,20 +75,20 @@ class PyShield:
 
     # Example event ingestion APIs other modules can call
     def on_ddos_block(self, ip: str, count: int) -> None:
-        self.stats.blocked_ips[ip] = self.stats.blocked_ips.get(ip, 0) + 1
+        self.stats.blocked_ips.incr(ip)
         self.logger.warning("DDoS blocked IP %s (reqs=%s)", ip, count)
-        self.alerts.alert("DDoS Blocked", f"Blocked IP {ip}", {"requests": count})
+        self.alerts.alert("DDoS Blocked", f"Blocked IP {ip}", context={"requests": count})
 
     def on_url_block(self, url: str) -> None:
-        self.stats.blocked_urls[url] = self.stats.blocked_urls.get(url, 0) + 1
+        self.stats.blocked_urls.incr(url)
         self.logger.warning("Blocked malicious URL: %s", url)
         self.alerts.alert("Malicious URL Blocked", url)
 
     def on_port_block(self, port: int) -> None:
-        self.stats.blocked_ports.add(port)
+        self.stats.add_blocked_port(port)
         self.logger.info("Port blocked: %s", port)
 
     def on_attack_detected(self, kind: str, info: Optional[dict] = None) -> None:
-        self.stats.active_attacks[kind] = self.stats.active_attacks.get(kind, 0) + 1
+        self.stats.active_attacks.incr(kind)
         self.logger.error("Attack detected: %s %s", kind, info or {})
-        self.alerts.alert("Attack detected", kind, info)
+        self.alerts.alert("Attack detected", kind, context=info)
@@ -0,0 +1,303 @@
+"""
+HTTP/1.x message framing shared by the proxy: head parsing, persistence
+rules and body relaying for Content-Length, chunked and close-delimited bodies.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Iterable, List, Optional, Set, Tuple
+
+Headers = List[Tuple[str, str]]
+
+# Connection-scoped headers never forwarded to the other side (RFC 9110 section 7.6.1)
+HOP_BY_HOP = frozenset({"connection", "keep-alive", "proxy-connection", "proxy-authorization", "te", "trailer"})
+# Headers that frame the message: never dropped because Connection names them, or the next hop reads another body
+FRAMING_HEADERS = frozenset({"transfer-encoding", "content-length", "host"})
+
+# Body framings returned by request_framing / response_framing
+NO_BODY = "none"
+LENGTH = "length"
+CHUNKED = "chunked"
+UNTIL_CLOSE = "close"
+
+CRLF = b"\r\n"
+_HEX_DIGITS = frozenset(b"0123456789abcdefABCDEF")
+
+
+def reader_buffer(reader: asyncio.StreamReader) -> Optional[bytearray]:
+    """
+    Bytes `reader` has received but not yet handed out, or None if they cannot be seen.
+
+    StreamReader has no public API for this; CPython keeps them in the
+    private `_buffer` bytearray. Callers must take None as "unknown" and
+    choose the safe side (not reusing a connection, not taking the
+    socket over from the reader).
+    """
+    buffer = getattr(reader, "_buffer", None)
+    return buffer if isinstance(buffer, bytearray) else None
+
+
+class HTTPError(Exception):
+    """Malformed or oversized HTTP/1 message."""
+
+
+class BodyTooLarge(HTTPError):
+    """A message body is longer than the caller's byte limit."""
+
+    def __init__(self, limit: int) -> None:
+        super().__init__(f"body exceeds {limit} bytes")
+        self.limit = limit
+
+
+class HeadTooLarge(HTTPError):
+    """A message head is longer than the reader's limit."""
+
+
+async def read_head(reader: asyncio.StreamReader) -> bytes:
+    """
+    Read a message head up to and including the blank line.
+
+    Returns b"" on a clean EOF before any byte; raises HTTPError when the
+    head is truncated or larger than the reader's limit.
+    """
+    try:
+        return await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return b""
+        raise HTTPError("connection closed inside message head") from e
+    except asyncio.LimitOverrunError as e:
+        raise HeadTooLarge("message head too large") from e
+
+
+def parse_head(raw: bytes) -> Tuple[str, Headers]:
+    """Split a raw head into its start line and (name, value) pairs in original order."""
+    lines = raw.decode("latin-1").split("\r\n")
+    start = lines[0]
+    headers: Headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        if line[0] in " \t":
+            raise HTTPError("obsolete header line folding")
+        name, sep, value = line.partition(":")
+        if not sep or not name or name != name.strip():
+            raise HTTPError(f"malformed header line: {line[:64]!r}")
+        headers.append((name, value.strip()))
+    return start, headers
+
+
+def serialize_head(start_line: str, headers: Iterable[Tuple[str, str]]) -> bytes:
+    parts = [start_line]
+    parts.extend(f"{name}: {value}" for name, value in headers)
+    parts.append("\r\n")
+    return "\r\n".join(parts).encode("latin-1")
+
+
+def get_header(headers: Headers, name: str) -> Optional[str]:
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def connection_tokens(headers: Headers) -> Set[str]:
+    tokens: Set[str] = set()
+    for key, value in headers:
+        if key.lower() in ("connection", "proxy-connection"):
+            tokens.update(t.strip().lower() for t in value.split(",") if t.strip())
+    return tokens
+
+
+def transfer_codings(headers: Headers) -> Optional[List[str]]:
+    """
+    Transfer codings of every Transfer-Encoding field, in order (separate
+    fields make up one list), or None without the header.
+    """
+    codings: Optional[List[str]] = None
+    for key, value in headers:
+        if key.lower() == "transfer-encoding":
+            if codings is None:
+                codings = []
+            codings.extend(c.strip().lower() for c in value.split(",") if c.strip())
+    return codings
+
+
+def strip_hop_by_hop(headers: Headers) -> Headers:
+    """
+    Drop hop-by-hop headers, including any named in Connection, and merge
+    Transfer-Encoding into one field so the next hop sees the codings the
+    framing was decided on, not just its first field.
+    """
+    drop = (HOP_BY_HOP | connection_tokens(headers)) - FRAMING_HEADERS
+    forward: Headers = []
+    merged = False
+    for key, value in headers:
+        name = key.lower()
+        if name in drop:
+            continue
+        if name == "transfer-encoding":
+            if not merged:
+                merged = True
+                forward.append((key, ", ".join(transfer_codings(headers) or ())))
+            continue
+        forward.append((key, value))
+    return forward
+
+
+def keep_alive(version: str, headers: Headers) -> bool:
+    """Whether the sender of a message with this version and headers keeps the connection open."""
+    tokens = connection_tokens(headers)
+    if "close" in tokens:
+        return False
+    if version.upper() == "HTTP/1.0":
+        return "keep-alive" in tokens
+    return True
+
+
+def _content_length(headers: Headers) -> Optional[int]:
+    values = {v.strip() for k, v in headers if k.lower() == "content-length"}
+    if not values:
+        return None
+    if len(values) > 1:
+        raise HTTPError("conflicting Content-Length headers")
+    value = values.pop()
+    # str.isdigit() alone also takes non-ASCII digits such as '\xb2', which int() then rejects
+    if not (value.isascii() and value.isdigit()):
+        raise HTTPError(f"invalid Content-Length: {value[:32]!r}")
+    return int(value)
+
+
+def _is_chunked(headers: Headers) -> bool:
+    codings = transfer_codings(headers)
+    if codings is None:
+        return False
+    # Chunked must be applied exactly once and last (RFC 9112 section 6.1); anything else is a smuggling vector
+    if not codings or codings[-1] != "chunked" or codings.count("chunked") > 1:
+        raise HTTPError(f"unsupported Transfer-Encoding: {', '.join(codings)[:64]!r}")
+    return True
+
+
+def request_framing(headers: Headers) -> Tuple[str, int]:
+    """(framing, length) of a request body; requests without either header have none."""
+    if _is_chunked(headers):
+        if _content_length(headers) is not None:
+            # Request smuggling vector (RFC 9112 section 6.3)
+            raise HTTPError("both Transfer-Encoding and Content-Length present")
+        return CHUNKED, -1
+    length = _content_length(headers)
+    if not length:
+        return NO_BODY, 0
+    return LENGTH, length
+
+
+def response_framing(method: str, status: int, headers: Headers) -> Tuple[str, int]:
+    """(framing, length) of a response body, per RFC 9112 section 6.3."""
+    if method == "HEAD" or 100 <= status < 200 or status in (204, 304):
+        return NO_BODY, 0
+    if _is_chunked(headers):
+        return CHUNKED, -1
+    length = _content_length(headers)
+    if length is None:
+        return UNTIL_CLOSE, -1
+    return (LENGTH, length) if length else (NO_BODY, 0)
+
+
+def _chunk_size(line: bytes) -> int:
+    # Stricter than int(x, 16), which also takes signs, "0x", "_" and whitespace: a smuggling vector
+    digits = line.split(b";", 1)[0].rstrip(b"\r\n").rstrip(b" \t")
+    if not digits or len(digits) > 16 or not _HEX_DIGITS.issuperset(digits):
+        raise HTTPError("invalid chunk size")
+    return int(digits, 16)
+
+
+async def relay_body(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, framing: str, length: int = -1,
+                     *, dechunk: bool = False, chunk_size: int = 64 * 1024, limit: int = 0) -> int:
+    """
+    Stream one message body from `reader` to `writer`, at most `chunk_size`
+    bytes at a time and draining `writer` in between, so memory stays flat
+    whatever the body size. Chunk framing is kept unless `dechunk` (for
+    HTTP/1.0 recipients, which then need the body close-delimited). Raises
+    BodyTooLarge before forwarding anything past `limit` payload bytes (0:
+    no limit). Returns the number of bytes written; raises HTTPError or
+    IncompleteReadError if the body ends early.
+    """
+    if framing == NO_BODY:
+        return 0
+    copied = 0
+    if framing == LENGTH:
+        if limit and length > limit:
+            raise BodyTooLarge(limit)
+        remaining = length
+        while remaining:
+            data = await reader.read(min(chunk_size, remaining))
+            if not data:
+                raise HTTPError(f"body ended {remaining} bytes early")
+            writer.write(data)
+            await writer.drain()
+            remaining -= len(data)
+            copied += len(data)
+        return copied
+    if framing == UNTIL_CLOSE:
+        while True:
+            data = await reader.read(chunk_size)
+            if not data:
+                return copied
+            if limit and copied + len(data) > limit:
+                raise BodyTooLarge(limit)
+            writer.write(data)
+            await writer.drain()
+            copied += len(data)
+    # Chunked: size line, data, CRLF ... then a zero-size chunk, trailers and a blank line
+    payload = 0
+    while True:
+        line = await reader.readuntil(CRLF)
+        size = _chunk_size(line)
+        payload += size
+        if limit and payload > limit:
+            raise BodyTooLarge(limit)
+        if not dechunk:
+            writer.write(line)
+            copied += len(line)
+        if size == 0:
+            while True:
+                trailer = await reader.readuntil(CRLF)
+                if not dechunk:
+                    writer.write(trailer)
+                    copied += len(trailer)
+                if trailer == CRLF:
+                    await writer.drain()
+                    return copied
+        remaining = size
+        while remaining:
+            data = await reader.read(min(chunk_size, remaining))
+            if not data:
+                raise HTTPError("chunked body ended early")
+            writer.write(data)
+            remaining -= len(data)
+            copied += len(data)
+            await writer.drain()
+        if await reader.readexactly(2) != CRLF:
+            raise HTTPError("missing CRLF after chunk data")
+        if not dechunk:
+            writer.write(CRLF)
+            copied += 2
+
+
+async def relay_as_chunked(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                           *, chunk_size: int = 64 * 1024, limit: int = 0) -> int:
+    """Re-frame a close-delimited body as chunks, so the recipient's connection can stay open."""
+    copied = 0
+    while True:
+        data = await reader.read(chunk_size)
+        if not data:
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+            return copied
+        if limit and copied + len(data) > limit:
+            raise BodyTooLarge(limit)
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+        await writer.drain()
+        copied += len(data)
@@ -0,0 +1,578 @@
+"""
+Shared HTTP response cache for the forward proxy (RFC 9111).
+
+Only GET responses the origin marks cacheable for a shared cache are
+stored: explicit freshness (s-maxage, max-age, Expires) or, for statuses
+cacheable by default, a heuristic of 10% of the time since Last-Modified.
+Responses with no-store, private, Set-Cookie or `Vary: *`, and responses to
+requests with credentials (unless the origin allows it), are never stored.
+
+Entries are keyed by URL plus the request header values named in the
+response's Vary. They live in a memory tier with a byte budget and LRU
+eviction; with a disk tier, entries evicted from memory are written to
+`disk_path` (its own LRU byte budget) and promoted back on a hit. Stale
+entries are revalidated with If-None-Match / If-Modified-Since, and
+concurrent misses for one URL wait for the first one's fetch instead of
+each going upstream.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .http1 import CRLF, Headers, HTTPError, get_header, transfer_codings
+
+# Cacheable without explicit freshness (RFC 9110 section 15.1)
+HEURISTIC_STATUSES = frozenset({200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501})
+# Also stored, but only with explicit freshness
+EXPLICIT_STATUSES = frozenset({302, 307})
+# Methods whose non-error responses invalidate the target URI (RFC 9111 section 4.4)
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "TRACE"})
+# Header fields a 304 may not overwrite in the stored response
+_NOT_UPDATED = frozenset({"content-length", "content-encoding", "transfer-encoding", "content-range"})
+# Sent along with a 304 to a client's own conditional request (RFC 9110 section 15.4.5)
+_NOT_MODIFIED_FIELDS = ("cache-control", "content-location", "date", "etag", "expires", "vary", "last-modified")
+_CONDITIONALS = ("if-none-match", "if-modified-since", "if-match", "if-unmodified-since", "if-range")
+_DIRECTIVE = re.compile(r'\s*([!#$%&\'*+\-.^_`|~0-9A-Za-z]+)\s*(?:=\s*("(?:[^"\\]|\\.)*"|[^,\s]*))?\s*(?:,|$)')
+
+Key = Tuple[str, Tuple[str, ...]]
+
+
+def cache_control(headers: Headers) -> Dict[str, Optional[str]]:
+    """Cache-Control directives (lowercased names; quoted values unquoted) from every Cache-Control field."""
+    directives: Dict[str, Optional[str]] = {}
+    for name, value in headers:
+        if name.lower() != "cache-control":
+            continue
+        for match in _DIRECTIVE.finditer(value):
+            directive, argument = match.group(1).lower(), match.group(2)
+            if argument is not None and argument.startswith('"'):
+                argument = argument[1:-1]
+            directives.setdefault(directive, argument)
+    return directives
+
+
+def _delta_seconds(value: Optional[str]) -> Optional[int]:
+    # An invalid value counts as 0: such a response is stale at once (RFC 9111 section 1.2.2)
+    if value is None:
+        return None
+    return int(value) if value.isdigit() else 0
+
+
+def http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def has_conditionals(headers: Headers) -> bool:
+    return any(name.lower() in _CONDITIONALS for name, _ in headers)
+
+
+def cache_url(host: str, port: int, path: str) -> str:
+    """Absolute URL of a plain-HTTP request, the primary cache key."""
+    authority = host.lower() if port == 80 else f"{host.lower()}:{port}"
+    return f"http://{authority}{path}"
+
+
+def decode_chunked(data: bytes) -> bytes:
+    """Payload of a complete chunked body (as relayed, so already validated); trailers are dropped."""
+    out = []
+    pos = 0
+    while True:
+        end = data.index(CRLF, pos)
+        size = int(data[pos:end].split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            return b"".join(out)
+        start = end + 2
+        out.append(data[start:start + size])
+        pos = start + size + 2
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def _vary_value(headers: Headers, name: str) -> str:
+    values = [" ".join(v.split()) for k, v in headers if k.lower() == name]
+    return ",".join(values)
+
+
+class CacheEntry:
+    """A stored response: status line, end-to-end headers, body and the timing to compute its age."""
+
+    __slots__ = ("url", "vary", "status_line", "status", "headers", "body", "request_time", "response_time",
+                 "initial_age", "lifetime", "no_cache", "size", "key", "on_disk")
+
+    def __init__(self, url: str, vary: Tuple[str, ...], status_line: str, headers: Headers, body: bytes,
+                 request_time: float, response_time: float, *, heuristic_max: float) -> None:
+        self.url = url
+        self.vary = vary
+        self.status_line = status_line
+        self.status = int(status_line.split(" ", 2)[1])
+        self.body = body
+        # Set when the cache holds it: URL plus the request's values of the Vary fields
+        self.key: Key = (url, ())
+        self.on_disk = False
+        self.update(headers, request_time, response_time, heuristic_max=heuristic_max)
+
+    def update(self, headers: Headers, request_time: float, response_time: float, *, heuristic_max: float) -> None:
+        """(Re)compute age and freshness lifetime from response headers (RFC 9111 sections 4.2.1 and 4.2.3)."""
+        self.headers = headers
+        # Bytes charged against the memory budget
+        self.size = len(self.body) + sum(len(k) + len(v) + 4 for k, v in headers) + len(self.url) + 256
+        self.request_time = request_time
+        self.response_time = response_time
+        date = http_date(get_header(headers, "date"))
+        age_value = _delta_seconds(get_header(headers, "age")) or 0
+        apparent_age = max(0.0, response_time - date) if date is not None else 0.0
+        self.initial_age = max(apparent_age, age_value + (response_time - request_time))
+        directives = cache_control(headers)
+        self.no_cache = "no-cache" in directives
+        lifetime = _delta_seconds(directives.get("s-maxage"))
+        if lifetime is None:
+            lifetime = _delta_seconds(directives.get("max-age"))
+        if lifetime is None and get_header(headers, "expires") is not None:
+            expires = http_date(get_header(headers, "expires"))
+            lifetime = max(0.0, expires - (date if date is not None else response_time)) if expires else 0
+        if lifetime is None:
+            last_modified = http_date(get_header(headers, "last-modified"))
+            reference = date if date is not None else response_time
+            heuristic = (reference - last_modified) / 10 if last_modified is not None else 0
+            lifetime = min(max(heuristic, 0), heuristic_max) if self.status in HEURISTIC_STATUSES else 0
+        self.lifetime = float(lifetime)
+
+    def age(self, now: float) -> float:
+        return self.initial_age + max(0.0, now - self.response_time)
+
+    def fresh(self, now: float) -> bool:
+        return not self.no_cache and self.lifetime > self.age(now)
+
+    @property
+    def etag(self) -> Optional[str]:
+        return get_header(self.headers, "etag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return get_header(self.headers, "last-modified")
+
+    def validators(self) -> Headers:
+        """Conditional headers that revalidate this entry upstream."""
+        headers = []
+        if self.etag is not None:
+            headers.append(("If-None-Match", self.etag))
+        if self.last_modified is not None:
+            headers.append(("If-Modified-Since", self.last_modified))
+        return headers
+
+    def not_modified_for(self, request_headers: Headers) -> bool:
+        """Whether a client's own conditional GET is answered by a 304 (RFC 9110 section 13.2.2)."""
+        if self.status != 200:
+            return False
+        if_none_match = get_header(request_headers, "if-none-match")
+        if if_none_match is not None:
+            etag = self.etag
+            if etag is None:
+                return False
+            tags = [t.strip() for t in if_none_match.split(",")]
+            # Weak comparison
+            return "*" in tags or _opaque_tag(etag) in {_opaque_tag(t) for t in tags}
+        since = http_date(get_header(request_headers, "if-modified-since"))
+        modified = http_date(self.last_modified)
+        return since is not None and modified is not None and modified <= since
+
+    def response_head(self, now: float, *, not_modified: bool = False) -> Tuple[str, Headers]:
+        """Start line and headers to serve this entry, without connection headers."""
+        age = ("Age", str(int(self.age(now))))
+        if not_modified:
+            headers = [(k, v) for k, v in self.headers if k.lower() in _NOT_MODIFIED_FIELDS]
+            return "HTTP/1.1 304 Not Modified", headers + [age]
+        headers = [(k, v) for k, v in self.headers if k.lower() not in ("age", "content-length")]
+        if not any(k.lower() == "date" for k, _ in headers):
+            headers.append(("Date", formatdate(self.response_time, usegmt=True)))
+        return self.status_line, headers + [age, ("Content-Length", str(len(self.body)))]
+
+    def to_meta(self) -> Dict[str, Any]:
+        return {
+            "url": self.url, "vary": list(self.vary), "status_line": self.status_line, "headers": self.headers,
+            "request_time": self.request_time, "response_time": self.response_time,
+        }
+
+
+class CacheSlot:
+    """What `ResponseCache.acquire` found for a request."""
+
+    __slots__ = ("entry", "fresh", "leader")
+
+    def __init__(self, entry: Optional[CacheEntry], fresh: bool, leader: bool) -> None:
+        # Fresh: serve it. Otherwise a stale entry to revalidate, or None
+        self.entry = entry
+        self.fresh = fresh
+        # True: this request fetches for everyone waiting on the URL and must call `release`
+        self.leader = leader
+
+
+class BodyCapture:
+    """
+    Writer wrapper that forwards to the client and keeps a copy of what was
+    written, up to `limit` bytes (past that, the copy is dropped).
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, limit: int) -> None:
+        self.writer = writer
+        self.limit = limit
+        self.parts: List[bytes] = []
+        self.size = 0
+        self.overflow = False
+
+    def write(self, data: bytes) -> None:
+        self.writer.write(data)
+        if self.overflow:
+            return
+        self.size += len(data)
+        if self.size > self.limit:
+            self.overflow = True
+            self.parts = []
+            return
+        self.parts.append(bytes(data))
+
+    async def drain(self) -> None:
+        await self.writer.drain()
+
+    def body(self, *, chunked: bool) -> bytes:
+        data = b"".join(self.parts)
+        return decode_chunked(data) if chunked else data
+
+
+class DiskTier:
+    """
+    Entries evicted from memory, one file each under `path`: a JSON metadata
+    line, then the body. Files are replaced atomically; the index is rebuilt
+    from them at startup, oldest first. Methods do file I/O, so the cache
+    calls them on the default executor.
+    """
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+        # file name -> (size, URL), in LRU order
+        self._files: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @staticmethod
+    def file_name(key: Key) -> str:
+        return hashlib.sha256("\0".join((key[0],) + key[1]).encode()).hexdigest() + ".cache"
+
+    def load_index(self) -> List[Dict[str, Any]]:
+        """Index the files present; returns their metadata so the cache can learn URLs' Vary fields."""
+        found = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".cache"):
+                continue
+            file_path = os.path.join(self.path, name)
+            try:
+                with open(file_path, "rb") as f:
+                    meta = json.loads(f.readline())
+                found.append((os.stat(file_path).st_mtime, name, os.path.getsize(file_path), meta))
+            except (OSError, ValueError):
+                self._unlink(name)
+        found.sort(key=lambda item: item[0])
+        with self._lock:
+            for _, name, size, meta in found:
+                self._files[name] = (size, meta["url"])
+                self._bytes += size
+        return [meta for *_, meta in found]
+
+    def __contains__(self, key: Key) -> bool:
+        return self.file_name(key) in self._files
+
+    def write(self, key: Key, entry: CacheEntry) -> None:
+        name = self.file_name(key)
+        data = json.dumps(entry.to_meta()).encode() + b"\n" + entry.body
+        if len(data) > self.max_bytes:
+            return
+        tmp = os.path.join(self.path, f".{name}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(self.path, name))
+        with self._lock:
+            self._bytes += len(data) - self._files.pop(name, (0, ""))[0]
+            self._files[name] = (len(data), entry.url)
+            victims = []
+            while self._bytes > self.max_bytes and self._files:
+                victim, (size, _) = self._files.popitem(last=False)
+                self._bytes -= size
+                victims.append(victim)
+        for victim in victims:
+            self.evictions += 1
+            self._unlink(victim)
+
+    def read(self, key: Key) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        name = self.file_name(key)
+        if name not in self._files:
+            return None
+        try:
+            with open(os.path.join(self.path, name), "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            self.remove(key)
+            return None
+        with self._lock:
+            if name in self._files:
+                self._files.move_to_end(name)
+        return meta, body
+
+    def remove(self, key: Key) -> None:
+        name = self.file_name(key)
+        with self._lock:
+            self._bytes -= self._files.pop(name, (0, ""))[0]
+        self._unlink(name)
+
+    def remove_url(self, url: str) -> None:
+        """Drop every variant of `url`."""
+        with self._lock:
+            names = [name for name, (_, file_url) in self._files.items() if file_url == url]
+            for name in names:
+                self._bytes -= self._files.pop(name)[0]
+        for name in names:
+            self._unlink(name)
+
+    def _unlink(self, name: str) -> None:
+        try:
+            os.unlink(os.path.join(self.path, name))
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._files), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                "evictions": self.evictions}
+
+
+class ResponseCache:
+    """
+    Memory (and optionally disk) cache of upstream responses for one event
+    loop. `acquire` looks a request up and coalesces concurrent misses;
+    `storable`/`store` decide on and record a response; `refresh` applies a
+    304 to a stale entry; `invalidate` drops a URL after an unsafe request.
+    """
+
+    def __init__(self, *, memory_bytes: int = 64 << 20, max_object_bytes: int = 8 << 20,
+                 disk_path: Optional[str] = None, disk_bytes: int = 1 << 30,
+                 heuristic_max_seconds: float = 86400, coalesce_timeout: float = 10.0) -> None:
+        self.memory_bytes = memory_bytes
+        self.max_object_bytes = min(max_object_bytes, memory_bytes)
+        self.heuristic_max = heuristic_max_seconds
+        self.coalesce_timeout = coalesce_timeout
+        self._entries: "OrderedDict[Key, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        # URL -> request header names its responses vary on (lowercased, sorted)
+        self._vary: Dict[str, Tuple[str, ...]] = {}
+        # URL -> fetch other requests for it wait on
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.disk: Optional[DiskTier] = None
+        if disk_path:
+            self.disk = DiskTier(disk_path, disk_bytes)
+            for meta in self.disk.load_index():
+                self._vary.setdefault(meta["url"], tuple(meta["vary"]))
+        self.stats: Dict[str, int] = {
+            "lookups": 0, "hits": 0, "revalidated": 0, "misses": 0, "coalesced": 0, "stores": 0,
+            "evictions": 0, "invalidations": 0, "disk_hits": 0, "disk_writes": 0, "bytes_saved": 0,
+        }
+
+    def _key(self, url: str, request_headers: Headers) -> Key:
+        names = self._vary.get(url, ())
+        return url, tuple(_vary_value(request_headers, name) for name in names)
+
+    async def lookup(self, url: str, request_headers: Headers) -> Optional[CacheEntry]:
+        key = self._key(url, request_headers)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        if self.disk is None or key not in self.disk:
+            return None
+        found = await asyncio.get_running_loop().run_in_executor(None, self.disk.read, key)
+        if found is None:
+            return None
+        meta, body = found
+        entry = CacheEntry(meta["url"], tuple(meta["vary"]), meta["status_line"], [tuple(h) for h in meta["headers"]],
+                           body, meta["request_time"], meta["response_time"], heuristic_max=self.heuristic_max)
+        entry.on_disk = True
+        self.stats["disk_hits"] += 1
+        self._insert(key, entry)
+        return entry
+
+    def usable(self, entry: CacheEntry, request_headers: Headers, now: Optional[float] = None) -> bool:
+        """Whether `entry` may answer this request without revalidation."""
+        t = now if now is not None else time.time()
+        directives = cache_control(request_headers)
+        if "no-cache" in directives or (not directives and get_header(request_headers, "pragma") == "no-cache"):
+            return False
+        max_age = _delta_seconds(directives.get("max-age"))
+        if max_age is not None and entry.age(t) > max_age:
+            return False
+        return entry.fresh(t)
+
+    async def acquire(self, url: str, request_headers: Headers) -> CacheSlot:
+        """
+        Look up a GET. On a miss or stale entry, the first request becomes the
+        leader; later ones wait (up to `coalesce_timeout`) for its response to
+        be stored and look again, then fetch on their own if still unserved.
+        """
+        self.stats["lookups"] += 1
+        entry = await self.lookup(url, request_headers)
+        if entry is not None and self.usable(entry, request_headers):
+            self._served(entry)
+            return CacheSlot(entry, True, False)
+        waiter = self._inflight.get(url)
+        if waiter is None:
+            self._inflight[url] = asyncio.get_running_loop().create_future()
+            return CacheSlot(entry, False, True)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.coalesce_timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.stats["coalesced"] += 1
+        entry = await self.lookup(url, request_headers)
+        if entry is not None and self.usable(entry, request_headers):
+            self._served(entry)
+            return CacheSlot(entry, True, False)
+        return CacheSlot(entry, False, False)
+
+    def release(self, url: str) -> None:
+        """End a leader's fetch, waking the requests coalesced behind it."""
+        waiter = self._inflight.pop(url, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def miss(self) -> None:
+        self.stats["misses"] += 1
+
+    def _served(self, entry: CacheEntry) -> None:
+        self.stats["hits"] += 1
+        self.stats["bytes_saved"] += len(entry.body)
+
+    def storable(self, request_headers: Headers, status: int, response_headers: Headers) -> bool:
+        """Whether a response to a GET may be stored by a shared cache (RFC 9111 section 3)."""
+        if status not in HEURISTIC_STATUSES and status not in EXPLICIT_STATUSES:
+            return False
+        response_cc = cache_control(response_headers)
+        if "no-store" in response_cc or "private" in response_cc or "no-store" in cache_control(request_headers):
+            return False
+        if get_header(response_headers, "set-cookie") is not None:
+            return False
+        if any(v.strip() == "*" for k, v in response_headers if k.lower() == "vary"):
+            return False
+        codings = transfer_codings(response_headers)
+        if codings is not None and codings != ["chunked"]:
+            return False
+        if get_header(request_headers, "authorization") is not None and not (
+                {"public", "s-maxage", "must-revalidate"} & response_cc.keys()):
+            return False
+        explicit = ("s-maxage" in response_cc or "max-age" in response_cc
+                    or get_header(response_headers, "expires") is not None)
+        if status in EXPLICIT_STATUSES:
+            return explicit
+        return explicit or get_header(response_headers, "last-modified") is not None or \
+            get_header(response_headers, "etag") is not None
+
+    def store(self, url: str, request_headers: Headers, status_line: str, response_headers: Headers, body: bytes,
+              request_time: float, response_time: float) -> Optional[CacheEntry]:
+        headers = [(k, v) for k, v in response_headers if k.lower() not in ("transfer-encoding", "content-length")]
+        vary = tuple(sorted({t.strip().lower() for k, v in headers if k.lower() == "vary"
+                             for t in v.split(",") if t.strip()}))
+        if self._vary.get(url, ()) != vary:
+            # Variants keyed on other fields can no longer be selected
+            self._drop_url(url)
+            self._vary[url] = vary
+        entry = CacheEntry(url, vary, status_line, headers, body, request_time, response_time,
+                           heuristic_max=self.heuristic_max)
+        if entry.size > self.max_object_bytes:
+            return None
+        self.stats["stores"] += 1
+        self._insert(self._key(url, request_headers), entry)
+        return entry
+
+    def refresh(self, entry: CacheEntry, response_headers: Headers, request_time: float,
+                response_time: float) -> CacheEntry:
+        """Apply a 304 to a stale entry: its header fields replace the stored ones (RFC 9111 section 4.3.4)."""
+        updated = {k.lower() for k, _ in response_headers if k.lower() not in _NOT_UPDATED}
+        headers = [(k, v) for k, v in entry.headers if k.lower() not in updated]
+        headers += [(k, v) for k, v in response_headers if k.lower() in updated]
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+            self._bytes -= entry.size
+        entry.update(headers, request_time, response_time, heuristic_max=self.heuristic_max)
+        entry.on_disk = False
+        self._insert(entry.key, entry)
+        self.stats["revalidated"] += 1
+        self.stats["bytes_saved"] += len(entry.body)
+        return entry
+
+    def invalidate(self, url: str) -> None:
+        if self._drop_url(url):
+            self.stats["invalidations"] += 1
+
+    def _drop_url(self, url: str) -> int:
+        keys = [key for key in self._entries if key[0] == url]
+        for key in keys:
+            self._bytes -= self._entries.pop(key).size
+        if self.disk is not None and url in self._vary:
+            asyncio.get_running_loop().run_in_executor(None, self.disk.remove_url, url)
+        self._vary.pop(url, None)
+        return len(keys)
+
+    def _insert(self, key: Key, entry: CacheEntry) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        entry.key = key
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.memory_bytes and self._entries:
+            victim_key, victim = self._entries.popitem(last=False)
+            self._bytes -= victim.size
+            self.stats["evictions"] += 1
+            if self.disk is not None and not victim.on_disk:
+                self.stats["disk_writes"] += 1
+                asyncio.get_running_loop().run_in_executor(None, self._demote, victim_key, victim)
+
+    def _demote(self, key: Key, entry: CacheEntry) -> None:
+        try:
+            self.disk.write(key, entry)
+        except (OSError, HTTPError):
+            pass
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        lookups = stats["lookups"]
+        served = stats["hits"] + stats["revalidated"]
+        return {
+            **stats,
+            # Lookups answered with a stored body, fresh or after a 304
+            "hit_ratio": round(served / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "memory_bytes": self._bytes,
+            "memory_budget": self.memory_bytes,
+            "inflight": len(self._inflight),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
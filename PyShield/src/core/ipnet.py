@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import ipaddress
+import socket
+from typing import Optional, Tuple
+
+# (version, address as int); bit width is 32 for v4 and 128 for v6
+ParsedIP = Tuple[int, int]
+
+
+def parse_ip(ip: str) -> Optional[ParsedIP]:
+    """Parse an IPv4/IPv6 literal into (version, int) without building ipaddress objects."""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, ValueError):
+        pass
+    try:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip.split("%", 1)[0]), "big")
+    except (OSError, ValueError):
+        return None
+
+
+def bit_width(version: int) -> int:
+    return 32 if version == 4 else 128
+
+
+def network_int(version: int, value: int, length: int) -> int:
+    shift = bit_width(version) - length
+    return (value >> shift) << shift
+
+
+def prefix_key(version: int, value: int, length: int) -> str:
+    """Canonical 'network/length' string, e.g. '203.0.113.0/24'."""
+    net = network_int(version, value, length)
+    addr = ipaddress.IPv4Address(net) if version == 4 else ipaddress.IPv6Address(net)
+    return f"{addr}/{length}"
+
+
+def parse_prefix(key: str) -> Optional[Tuple[int, int, int]]:
+    """Parse 'network/length' into (version, network int, length); None for plain addresses."""
+    if "/" not in key:
+        return None
+    try:
+        net = ipaddress.ip_network(key, strict=False)
+    except ValueError:
+        return None
+    return net.version, int(net.network_address), net.prefixlen
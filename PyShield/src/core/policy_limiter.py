@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .concurrency import StripedLock
+from .config import RoutePolicy
+
+# (group name, cost, per-group limit) for requests that match no route policy
+_DEFAULT_ROUTE: Tuple[Optional[str], float, int] = (None, 1.0, 0)
+
+
+class PolicyLimiter:
+    """
+    Cost-weighted GCRA over three dimensions: per IP, per (IP, route group) and global.
+
+    A request charges its route's cost to every applicable bucket in one call
+    and is admitted only if all of them have room; a rejected request charges
+    nothing. `hit` returns (None, 0) when allowed, otherwise the name of the
+    dimension that refused it ("ip", "route" or "global") and its count.
+    """
+
+    _PATH_CACHE_SIZE = 10_000
+
+    def __init__(self, *, ip_limit: int, window_seconds: int, routes: Sequence[RoutePolicy] = (),
+                 global_limit: int = 0, include_ip: bool = True) -> None:
+        self.window = float(window_seconds)
+        self.include_ip = include_ip
+        self.ip_interval = self.window / max(ip_limit, 1)
+        self.global_interval = self.window / global_limit if global_limit > 0 else 0.0
+        # Longest prefix first so "/api/auth" wins over "/api"
+        self._routes: List[Tuple[str, Tuple[Optional[str], float, int]]] = sorted(
+            ((prefix, (r.group, float(r.cost), int(r.limit))) for r in routes for prefix in r.prefixes),
+            key=lambda item: len(item[0]), reverse=True,
+        )
+        self._route_cache: Dict[str, Tuple[Optional[str], float, int]] = {}
+        self._ip_tat: Dict[str, float] = {}
+        self._route_tat: Dict[Tuple[str, str], float] = {}
+        self._global_tat = 0.0
+        self._locks = StripedLock()
+        self._global_lock = threading.Lock()
+
+    def resolve(self, path: Optional[str]) -> Tuple[Optional[str], float, int]:
+        if not path or not self._routes:
+            return _DEFAULT_ROUTE
+        route = self._route_cache.get(path)
+        if route is None:
+            bare = path.split("?", 1)[0]
+            route = next((r for prefix, r in self._routes if bare.startswith(prefix)), _DEFAULT_ROUTE)
+            if len(self._route_cache) >= self._PATH_CACHE_SIZE:
+                self._route_cache.clear()
+            self._route_cache[path] = route
+        return route
+
+    def hit(self, ip: str, path: Optional[str] = None, now: Optional[float] = None) -> Tuple[Optional[str], int]:
+        t = now if now is not None else time.time()
+        group, cost, group_limit = self.resolve(path)
+        if cost <= 0:
+            return None, 0
+        window = self.window + 1e-9
+        route_key = (ip, group) if group is not None and group_limit > 0 else None
+        with self._locks.for_key(ip):
+            if self.include_ip:
+                ip_tat = self._ip_tat.get(ip, t)
+                ip_tat = (ip_tat if ip_tat > t else t) + cost * self.ip_interval
+                if ip_tat - t > window:
+                    return "ip", math.ceil((ip_tat - t) / self.ip_interval - 1e-9)
+            if route_key is not None:
+                interval = self.window / group_limit
+                route_tat = self._route_tat.get(route_key, t)
+                route_tat = (route_tat if route_tat > t else t) + cost * interval
+                if route_tat - t > window:
+                    return "route", math.ceil((route_tat - t) / interval - 1e-9)
+            if self.global_interval:
+                with self._global_lock:
+                    global_tat = (self._global_tat if self._global_tat > t else t) + cost * self.global_interval
+                    if global_tat - t > window:
+                        return "global", math.ceil((global_tat - t) / self.global_interval - 1e-9)
+                    self._global_tat = global_tat
+            if self.include_ip:
+                self._ip_tat[ip] = ip_tat
+            if route_key is not None:
+                self._route_tat[route_key] = route_tat
+        return None, 0
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop buckets that have fully drained. Returns keys removed."""
+        t = now if now is not None else time.time()
+        removed = 0
+        for key, tat in self._ip_tat.copy().items():
+            if tat <= t:
+                with self._locks.for_key(key):
+                    if self._ip_tat.get(key, t + 1) <= t:
+                        del self._ip_tat[key]
+                        removed += 1
+        for route_key, tat in self._route_tat.copy().items():
+            if tat <= t:
+                with self._locks.for_key(route_key[0]):
+                    if self._route_tat.get(route_key, t + 1) <= t:
+                        del self._route_tat[route_key]
+                        removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._ip_tat) + len(self._route_tat)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .concurrency import StripedLock
+from .ipnet import bit_width, parse_ip, prefix_key
+
+
+class _Node:
+    """One prefix in the tree, carrying a two-bucket sliding window counter."""
+
+    __slots__ = ("children", "idx", "prev", "cur")
+
+    def __init__(self) -> None:
+        self.children: Optional[Dict[int, _Node]] = None
+        self.idx = 0
+        self.prev = 0
+        self.cur = 0
+
+    def add(self, t: float, idx: int, window: float) -> int:
+        if self.idx == idx:
+            self.cur += 1
+        elif self.idx == idx - 1:
+            self.prev, self.cur = self.cur, 1
+        else:
+            self.prev, self.cur = 0, 1
+        self.idx = idx
+        overlap = 1.0 - (t - idx * window) / window
+        return math.ceil(self.prev * overlap + self.cur - 1e-9)
+
+
+class _FamilyTree:
+    """
+    Multibit radix tree for one address family with a node per configured prefix length.
+
+    A hit walks root -> shortest prefix -> ... -> longest prefix, one dict probe
+    per level, and bumps every counter on the way. Because each parent already
+    includes its children's hits, dropping a cold leaf merges it into its
+    parent without losing the aggregate count, and a hit that may not create
+    a node (node budget spent) is still counted by the prefixes above it.
+    """
+
+    def __init__(self, version: int, limits: Dict[int, int]) -> None:
+        bits = bit_width(version)
+        self.version = version
+        self.levels: List[int] = sorted(int(length) for length in limits if 0 < int(length) <= bits)
+        self.limits: List[int] = [int(limits[length]) for length in self.levels]
+        self.shifts: List[int] = [bits - length for length in self.levels]
+        self.masks: List[int] = []
+        prev = 0
+        for length in self.levels:
+            self.masks.append((1 << (length - prev)) - 1)
+            prev = length
+        self.root = _Node()
+        self.root.children = {}
+        # Subtrees under different top-level prefixes are independent
+        self._locks = StripedLock()
+        # Node counts per lock stripe, each only changed under its stripe's lock
+        self._nodes: List[int] = [0] * len(self._locks)
+
+    @property
+    def nodes(self) -> int:
+        return sum(self._nodes)
+
+    def hit(self, value: int, t: float, idx: int, window: float, *, grow: bool = True,
+            grow_top: bool = True) -> Optional[Tuple[int, int]]:
+        """
+        Count one hit. Without `grow` only shortest-prefix nodes are created
+        (and without `grow_top` none are): the walk stops at the deepest
+        prefix already tracked.
+        """
+        exceeded: Optional[Tuple[int, int]] = None
+        first = (value >> self.shifts[0]) & self.masks[0]
+        stripe = self._locks.index(first)
+        with self._locks.at(stripe):
+            node = self.root
+            for i, length in enumerate(self.levels):
+                chunk = first if i == 0 else (value >> self.shifts[i]) & self.masks[i]
+                children = node.children
+                if children is None:
+                    children = node.children = {}
+                child = children.get(chunk)
+                if child is None:
+                    if not (grow if i else grow_top):
+                        break
+                    child = children[chunk] = _Node()
+                    self._nodes[stripe] += 1
+                count = child.add(t, idx, window)
+                if exceeded is None and count > self.limits[i]:
+                    exceeded = (length, count)
+                node = child
+        return exceeded
+
+    def prune(self, idle_idx: int, leaf_idx: int) -> int:
+        """
+        Drop nodes with no hits since window `idle_idx`, and deepest-level
+        leaves with none since `leaf_idx` (>= idle_idx). Returns nodes removed.
+        """
+        removed = 0
+        depth_last = len(self.levels) - 1
+        root_children = self.root.children or {}
+        for chunk in list(root_children):
+            stripe = self._locks.index(chunk)
+            with self._locks.at(stripe):
+                child = root_children.get(chunk)
+                if child is None:
+                    continue
+                dropped = self._prune_node(child, 0, depth_last, idle_idx, leaf_idx)
+                if not child.children and child.idx < (leaf_idx if depth_last == 0 else idle_idx):
+                    del root_children[chunk]
+                    dropped += 1
+                self._nodes[stripe] -= dropped
+            removed += dropped
+        return removed
+
+    def _prune_node(self, node: _Node, depth: int, depth_last: int, idle_idx: int, leaf_idx: int) -> int:
+        children = node.children
+        if not children:
+            return 0
+        removed = 0
+        child_depth = depth + 1
+        cutoff = leaf_idx if child_depth == depth_last else idle_idx
+        for chunk, child in list(children.items()):
+            removed += self._prune_node(child, child_depth, depth_last, idle_idx, leaf_idx)
+            if not child.children and child.idx < cutoff:
+                del children[chunk]
+                removed += 1
+        if not children:
+            node.children = None
+        return removed
+
+
+class PrefixRateLimiter:
+    """
+    Rate limits whole networks (e.g. IPv4 /24 and /16, IPv6 /64 and /48) at once.
+
+    `hit` returns the broadest prefix over its threshold as ('net/len', count),
+    or None. Once the tree holds `max_nodes`, hits stop creating longer
+    prefixes and are counted by the shortest ones (which still grow up to
+    twice the budget); `sweep`, on the limiter's background thread, drops
+    idle prefixes and, while over budget, leaves with no hits in the
+    current window. The request path never compacts, and counts of the
+    current window are never discarded.
+    """
+
+    def __init__(self, *, v4_limits: Optional[Dict[int, int]] = None, v6_limits: Optional[Dict[int, int]] = None,
+                 window_seconds: int = 60, max_nodes: int = 200_000) -> None:
+        self.window = float(window_seconds)
+        self.max_nodes = max_nodes
+        self._trees: Dict[int, _FamilyTree] = {}
+        for version, limits in ((4, v4_limits), (6, v6_limits)):
+            if limits:
+                tree = _FamilyTree(version, limits)
+                if tree.levels:
+                    self._trees[version] = tree
+        self._sweep_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._trees)
+
+    def hit(self, ip: str, now: Optional[float] = None) -> Optional[Tuple[str, int]]:
+        parsed = parse_ip(ip)
+        if parsed is None:
+            return None
+        version, value = parsed
+        tree = self._trees.get(version)
+        if tree is None:
+            return None
+        t = now if now is not None else time.time()
+        nodes = tree.nodes
+        exceeded = tree.hit(value, t, int(t // self.window), self.window,
+                            grow=nodes < self.max_nodes, grow_top=nodes < 2 * self.max_nodes)
+        if exceeded is None:
+            return None
+        length, count = exceeded
+        return prefix_key(version, value, length), count
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Drop prefixes with no hits in the current or previous window, then,
+        while over 90% of max_nodes, merge leaves with no hits in the current
+        window into their parents. Returns nodes removed.
+        """
+        if not self._sweep_lock.acquire(blocking=False):
+            return 0  # Another thread is already sweeping
+        try:
+            t = now if now is not None else time.time()
+            idx = int(t // self.window)
+            removed = sum(tree.prune(idx - 1, idx - 1) for tree in self._trees.values())
+            if len(self) > int(self.max_nodes * 0.9):
+                removed += sum(tree.prune(idx - 1, idx) for tree in self._trees.values())
+            return removed
+        finally:
+            self._sweep_lock.release()
+
+    def __len__(self) -> int:
+        return sum(tree.nodes for tree in self._trees.values())
@@ -6,7 +6,8 @@ Intercepts browser traffic and applies firewall rules
 from __future__ import annotations
 
 import asyncio
-import aiohttp
+import html
+import os
 import socket
 import threading
 import time
@@ -14,8 +15,27 @@ from typing import Optional, Dict, Any
 from urllib.parse import urlparse
 from dataclasses import dataclass
 
+from core.admission import (
+    CONNECTION_LIMIT, HEADER_TIMEOUT, HEADER_TOO_LARGE, PER_IP_LIMIT, REFUSAL_LINGER_BYTES, REFUSAL_LINGER_SECONDS,
+    AdmissionControl,
+)
 from core.config import PyShieldConfig
+from core.http1 import (
+    CHUNKED, NO_BODY, UNTIL_CLOSE, BodyTooLarge, HeadTooLarge, Headers, HTTPError, connection_tokens, get_header, keep_alive,
+    parse_head, read_head, relay_as_chunked, relay_body, request_framing, response_framing, serialize_head,
+    strip_hop_by_hop,
+)
+from core.http_cache import (
+    SAFE_METHODS, BodyCapture, CacheEntry, CacheSlot, ResponseCache, cache_url, has_conditionals,
+)
 from core.logging_system import LoggerFactory
+from core.request_history import HistoryRecord, RequestHistory
+from core.resolver import create_resolver
+from core.rule_pipeline import RuleContext, RuleVerdict, rule_pipeline_for
+from core.tls_hello import ACCESS_DENIED_ALERT, ALPN_OTHER, KNOWN_ALPN, ClientHello, read_client_hello
+from core.tunnel import EarlyDownstream, can_take_over, relay_tunnel
+from core.upstream_pool import UpstreamConnection, UpstreamPool
+from modules.url_blocking import extract_host
 
 
 @dataclass
@@ -32,80 +52,145 @@ class ProxyRequest:
 class HTTPProxyServer:
     """HTTP proxy server that intercepts browser traffic"""
     
-    def __init__(self, cfg: PyShieldConfig, pyshield_instance):
+    def __init__(self, cfg: PyShieldConfig, pyshield_instance, *, reuse_port: bool = False,
+                 worker_index: Optional[int] = None):
         self.cfg = cfg
         self.pyshield = pyshield_instance
         self.logger = LoggerFactory.get_logger("pyshield.proxy")
         self.proxy_port = getattr(cfg.dashboard, 'proxy_port', 8888)
         self.server = None
         self.running = False
-        self.request_history = []
-        self.max_history = 1000
+        # Set in proxy worker processes, which all bind the same port
+        self.reuse_port = reuse_port
+        proxy_cfg = cfg.proxy
+        self.request_history = RequestHistory(proxy_cfg.history_size, proxy_cfg.stats_window_seconds)
+        self.resolver = create_resolver(proxy_cfg)
+        self.upstream_pool: Optional[UpstreamPool] = UpstreamPool(
+            max_per_host=proxy_cfg.upstream_max_per_host,
+            max_idle_per_host=proxy_cfg.upstream_max_idle_per_host,
+            idle_timeout=proxy_cfg.upstream_idle_timeout_seconds,
+            connect_timeout=proxy_cfg.upstream_connect_timeout_seconds,
+            max_requests=proxy_cfg.upstream_max_requests,
+            connector=self.resolver.connect,
+        ) if proxy_cfg.upstream_pool else None
+        self.tunnel_stats: Dict[str, int] = {
+            "tunnels": 0, "upstream_bytes": 0, "downstream_bytes": 0,
+            "client_hellos": 0, "no_client_hello": 0, "sni_missing": 0, "sni_blocked": 0,
+        }
+        # ALPN protocols offered in tunnel ClientHellos: known IDs only, so clients cannot grow the dict
+        self.alpn_stats: Dict[str, int] = {}
+        disk_path, disk_bytes = proxy_cfg.cache_disk_path, proxy_cfg.cache_disk_bytes
+        if disk_path and worker_index is not None:
+            # A disk tier is owned by one process: each worker gets its own directory and share of the budget
+            disk_path = os.path.join(disk_path, f"worker-{worker_index}")
+            disk_bytes //= max(proxy_cfg.workers, 1)
+        self.cache: Optional[ResponseCache] = ResponseCache(
+            memory_bytes=proxy_cfg.cache_memory_bytes,
+            max_object_bytes=proxy_cfg.cache_max_object_bytes,
+            disk_path=disk_path,
+            disk_bytes=disk_bytes,
+            heuristic_max_seconds=proxy_cfg.cache_heuristic_max_seconds,
+            coalesce_timeout=proxy_cfg.cache_coalesce_timeout_seconds,
+        ) if proxy_cfg.cache_enabled else None
+        # Shared with the dashboard middleware
+        self.rules = rule_pipeline_for(pyshield_instance, cfg.rules)
+        bans = getattr(pyshield_instance, 'ban_registry', None)
+        if bans is None:
+            bans = getattr(getattr(pyshield_instance, 'ddos_protector', None), 'bans', None)
+        self.admission = AdmissionControl(proxy_cfg.client_max_connections,
+                                          proxy_cfg.client_max_connections_per_ip, bans=bans)
         
     async def handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
-        """Handle incoming proxy requests"""
+        """Serve proxy requests from one client connection until either side ends it"""
         client_addr = writer.get_extra_info('peername')
         client_ip = client_addr[0] if client_addr else 'unknown'
+        proxy_cfg = self.cfg.proxy
+        served = 0
+        
+        # Decided before reading anything: banned peers and connections over the caps cost no parsing
+        rejected = self.admission.admit(client_ip)
+        if rejected is not None:
+            self.logger.debug(f"Refused connection from {client_ip}: {rejected}")
+            if rejected in (CONNECTION_LIMIT, PER_IP_LIMIT):
+                await self.send_refusal(reader, writer)
+            else:
+                writer.transport.abort()
+            return
         
         try:
-            # Read the HTTP request
-            request_line = await reader.readline()
-            if not request_line:
-                return
+            while True:
+                # Pipelined requests simply wait in the reader's buffer and are served in order.
+                # An idle connection may wait for its next request; once a head has started,
+                # the rest of it has a much shorter deadline (slowloris).
+                try:
+                    first = await asyncio.wait_for(reader.read(1), proxy_cfg.client_idle_timeout_seconds)
+                except asyncio.TimeoutError:
+                    return
+                if not first:
+                    return
+                try:
+                    raw = first + await asyncio.wait_for(read_head(reader), proxy_cfg.client_header_timeout_seconds)
+                except asyncio.TimeoutError:
+                    self.admission.reject(HEADER_TIMEOUT)
+                    self.logger.debug(f"Request head from {client_ip} timed out")
+                    await self.send_error_response(writer, "408 Request Timeout")
+                    return
+                except HeadTooLarge:
+                    self.admission.reject(HEADER_TOO_LARGE)
+                    self.logger.warning(f"Oversized request head from {client_ip}")
+                    await self.send_error_response(writer, "431 Request Header Fields Too Large")
+                    return
                 
-            request_line = request_line.decode('utf-8').strip()
-            if not request_line:
-                return
+                try:
+                    start, headers = parse_head(raw)
+                    parts = start.split(' ')
+                    if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+                        raise HTTPError(f"malformed request line: {start[:64]!r}")
+                    method, url, version = parts
+                    body_framing, _ = request_framing(headers)
+                except HTTPError as e:
+                    self.logger.warning(f"Bad request from {client_ip}: {e}")
+                    await self.send_error_response(writer, "400 Bad Request")
+                    return
+                served += 1
                 
-            # Parse request line
-            parts = request_line.split(' ')
-            if len(parts) < 3:
-                return
+                # Create proxy request record
+                proxy_req = ProxyRequest(
+                    method=method,
+                    url=url,
+                    headers=dict(headers),
+                    client_ip=client_ip,
+                    timestamp=time.time()
+                )
                 
-            method, url, version = parts[0], parts[1], parts[2]
-            
-            # Read headers
-            headers = {}
-            while True:
-                header_line = await reader.readline()
-                if not header_line or header_line == b'\r\n':
-                    break
-                header_line = header_line.decode('utf-8').strip()
-                if ':' in header_line:
-                    key, value = header_line.split(':', 1)
-                    headers[key.strip()] = value.strip()
-            
-            # Create proxy request record
-            proxy_req = ProxyRequest(
-                method=method,
-                url=url,
-                headers=headers,
-                client_ip=client_ip,
-                timestamp=time.time()
-            )
-            
-            # Apply firewall rules
-            blocked, reason = await self.check_firewall_rules(proxy_req)
-            proxy_req.blocked = blocked
-            proxy_req.block_reason = reason
-            
-            # Add to history
-            self.request_history.append(proxy_req)
-            if len(self.request_history) > self.max_history:
-                self.request_history.pop(0)
-            
-            if blocked:
-                # Send blocked response
-                await self.send_blocked_response(writer, reason)
-                self.logger.warning(f"Blocked request to {url} from {client_ip}: {reason}")
-            else:
-                # Forward the request
-                await self.forward_request(reader, writer, method, url, headers)
-                self.logger.info(f"Forwarded request to {url} from {client_ip}")
+                # Apply firewall rules to every request, not just the first on the connection
+                blocked, reason = await self.check_firewall_rules(proxy_req)
+                proxy_req.blocked = blocked
+                proxy_req.block_reason = reason
+                
+                # Add to history
+                self.request_history.append(HistoryRecord(
+                    method, url, client_ip, proxy_req.timestamp, blocked, reason
+                ))
+                
+                persistent = (proxy_cfg.client_keepalive and keep_alive(version, headers)
+                              and served < proxy_cfg.client_max_requests)
+                if blocked:
+                    # An unread request body (or a HEAD, which must not get one back) would desync the connection
+                    persistent = persistent and body_framing == NO_BODY and method != 'HEAD'
+                    await self.send_blocked_response(writer, reason, version=version, persistent=persistent)
+                    self.logger.warning(f"Blocked request to {url} from {client_ip}: {reason}")
+                else:
+                    persistent = await self.forward_request(reader, writer, method, url, headers,
+                                                            version=version, persistent=persistent)
+                    self.logger.info(f"Forwarded request to {url} from {client_ip}")
+                if not persistent:
+                    return
                 
         except Exception as e:
             self.logger.error(f"Error handling proxy request from {client_ip}: {e}")
         finally:
+            self.admission.release(client_ip)
             try:
                 writer.close()
                 await writer.wait_closed()
@@ -114,169 +199,417 @@ class HTTPProxyServer:
     
     async def check_firewall_rules(self, request: ProxyRequest) -> tuple[bool, str]:
         """Check if request should be blocked by firewall rules"""
-        
-        # Check DDoS protection
-        if hasattr(self.pyshield, 'ddos_protector') and self.pyshield.ddos_protector:
-            ddos = self.pyshield.ddos_protector
-            if ddos.cfg.enabled:
-                if ddos.is_banned(request.client_ip):
-                    return True, "IP banned due to DDoS protection"
-                
-                exceeded_count = ddos.register_request(request.client_ip)
-                if exceeded_count:
-                    return True, f"Rate limit exceeded: {exceeded_count} requests"
-        
-        # Check URL blocking
-        if hasattr(self.pyshield, 'url_blocker') and self.pyshield.url_blocker:
-            url_blocker = self.pyshield.url_blocker
-            if url_blocker.cfg.enabled and url_blocker.is_malicious(request.url):
-                self.pyshield.on_url_block(request.url)
-                return True, "Malicious URL blocked"
-        
-        # Check geo-blocking
-        if hasattr(self.pyshield, 'geo_blocker') and self.pyshield.geo_blocker:
-            geo_blocker = self.pyshield.geo_blocker
-            if geo_blocker.cfg.enabled:
-                is_blocked = geo_blocker.is_blocked(request.client_ip)
-                if is_blocked:
-                    return True, "Geographic location blocked"
-        
-        return False, ""
+        verdict = await self.rules.evaluate(RuleContext(
+            client_ip=request.client_ip, url=request.url, host=extract_host(request.url), proxied=True,
+        ))
+        if verdict is None:
+            return False, ""
+        return True, verdict.reason
     
-    async def send_blocked_response(self, writer: asyncio.StreamWriter, reason: str) -> None:
+    async def send_blocked_response(self, writer: asyncio.StreamWriter, reason: str, *,
+                                    version: str = "HTTP/1.1", persistent: bool = False) -> None:
         """Send a blocked response to client"""
-        response = f"""HTTP/1.1 403 Forbidden\r
-Content-Type: text/html\r
-Content-Length: {len(reason) + 100}\r
-Connection: close\r
-\r
-<html><body><h1>403 Forbidden</h1><p>PyShield Firewall: {reason}</p></body></html>"""
-        
-        writer.write(response.encode())
+        body = (f"<html><body><h1>403 Forbidden</h1>"
+                f"<p>PyShield Firewall: {html.escape(reason)}</p></body></html>").encode()
+        headers = [('Content-Type', 'text/html; charset=utf-8'), ('Content-Length', str(len(body)))]
+        headers += self._connection_headers(version, persistent)
+        writer.write(serialize_head("HTTP/1.1 403 Forbidden", headers) + body)
         await writer.drain()
     
+    def _connection_headers(self, version: str, persistent: bool) -> list[tuple[str, str]]:
+        """Connection/Keep-Alive headers for a response to a client speaking `version`"""
+        if not persistent:
+            return [('Connection', 'close')]
+        headers = [('Keep-Alive', f"timeout={int(self.cfg.proxy.client_idle_timeout_seconds)}")]
+        if version == 'HTTP/1.0':
+            headers.append(('Connection', 'keep-alive'))
+        return headers
+    
     async def forward_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, 
-                            method: str, url: str, headers: Dict[str, str]) -> None:
-        """Forward request to destination server"""
+                            method: str, url: str, headers: Headers, *,
+                            version: str = "HTTP/1.1", persistent: bool = False) -> bool:
+        """Forward request to destination server; returns whether the client connection stays open"""
         try:
             # Parse URL
             if url.startswith('http://') or url.startswith('https://'):
                 parsed = urlparse(url)
                 host = parsed.hostname
                 port = parsed.port or (443 if parsed.scheme == 'https' else 80)
-                path = parsed.path + ('?' + parsed.query if parsed.query else '')
+                path = (parsed.path or '/') + ('?' + parsed.query if parsed.query else '')
             else:
                 # Handle CONNECT method for HTTPS
                 if method == 'CONNECT':
-                    host, port = url.split(':')
+                    host, port = url.rsplit(':', 1)
                     port = int(port)
                 else:
-                    host = headers.get('Host', '').split(':')[0]
+                    host = (get_header(headers, 'Host') or '').split(':')[0]
                     port = 80
                     path = url
             
             if method == 'CONNECT':
-                # Handle HTTPS tunnel
+                # Handle HTTPS tunnel; the connection belongs to the tunnel from here on
                 await self.handle_connect(reader, writer, host, int(port))
-            else:
-                # Handle HTTP request
-                await self.handle_http(reader, writer, method, host, port, path, headers)
+                return False
+            # Handle HTTP request
+            return await self.handle_http(reader, writer, method, host, port, path, headers,
+                                          client_version=version, persistent=persistent)
                 
         except Exception as e:
             self.logger.error(f"Error forwarding request: {e}")
             await self.send_error_response(writer, "502 Bad Gateway")
+            return False
     
     async def handle_connect(self, client_reader: asyncio.StreamReader, 
                            client_writer: asyncio.StreamWriter, host: str, port: int) -> None:
         """Handle HTTPS CONNECT tunnel"""
+        mode = self.cfg.proxy.tunnel_relay
+        if mode != "stream" and not can_take_over(client_reader):
+            mode = "stream"  # the socket relays would lose bytes the reader already buffered
+        upstream: Optional[socket.socket] = None
+        established = False
         try:
             # Connect to destination
-            dest_reader, dest_writer = await asyncio.open_connection(host, port)
+            upstream = await self._open_upstream_socket(host, port)
             
             # Send connection established
-            response = "HTTP/1.1 200 Connection Established\r\n\r\n"
-            client_writer.write(response.encode())
+            client_writer.write(b"HTTP/1.1 200 Connection Established\r\n\r\n")
             await client_writer.drain()
+            established = True
             
-            # Start bidirectional data transfer
-            await asyncio.gather(
-                self.transfer_data(client_reader, dest_writer),
-                self.transfer_data(dest_reader, client_writer),
-                return_exceptions=True
-            )
+            # The CONNECT line only names host:port; the ClientHello names the server actually wanted
+            initial = b""
+            if self.cfg.proxy.tunnel_sni_check:
+                # Only client -> upstream waits for the hello; a server that speaks first is relayed meanwhile
+                early = EarlyDownstream(upstream, client_writer)
+                early.start()
+                try:
+                    initial, hello = await read_client_hello(client_reader, self.cfg.proxy.tunnel_sni_timeout_seconds)
+                finally:
+                    self.tunnel_stats["downstream_bytes"] += early.stop()
+                reason = self.check_client_hello(client_writer, host, port, hello)
+                if reason is not None:
+                    client_writer.write(ACCESS_DENIED_ALERT)
+                    await client_writer.drain()
+                    return
+            
+            if mode == "stream":
+                dest_reader, dest_writer = await asyncio.open_connection(sock=upstream)
+                upstream = None
+                try:
+                    if initial:
+                        dest_writer.write(initial)
+                    up, down = await asyncio.gather(
+                        self.transfer_data(client_reader, dest_writer),
+                        self.transfer_data(dest_reader, client_writer),
+                    )
+                finally:
+                    dest_writer.close()
+                self.tunnel_stats["tunnels"] += 1
+                self.tunnel_stats["upstream_bytes"] += len(initial) + up
+                self.tunnel_stats["downstream_bytes"] += down
+            else:
+                sock, upstream = upstream, None
+                stats = await relay_tunnel(client_reader, client_writer, sock, mode=mode, initial=initial)
+                self.tunnel_stats["tunnels"] += 1
+                self.tunnel_stats["upstream_bytes"] += stats.upstream_bytes
+                self.tunnel_stats["downstream_bytes"] += stats.downstream_bytes
             
         except Exception as e:
             self.logger.error(f"Error in CONNECT tunnel to {host}:{port}: {e}")
+            if not established:
+                await self.send_error_response(client_writer, "502 Bad Gateway")
         finally:
-            try:
-                if 'dest_writer' in locals():
-                    dest_writer.close()
-                    await dest_writer.wait_closed()
-            except:
-                pass
+            if upstream is not None:
+                upstream.close()
+    
+    def check_client_hello(self, client_writer: asyncio.StreamWriter, host: str, port: int,
+                           hello: Optional[ClientHello]) -> Optional[str]:
+        """Block reason when a tunnel's ClientHello names a blacklisted server, else None"""
+        stats = self.tunnel_stats
+        if hello is None:
+            stats["no_client_hello"] += 1
+            return None
+        stats["client_hellos"] += 1
+        other = False
+        for protocol in hello.alpn:
+            if protocol in KNOWN_ALPN:
+                self.alpn_stats[protocol] = self.alpn_stats.get(protocol, 0) + 1
+            else:
+                other = True
+        if other:
+            self.alpn_stats[ALPN_OTHER] = self.alpn_stats.get(ALPN_OTHER, 0) + 1
+        name = hello.server_name
+        if name is None:
+            stats["sni_missing"] += 1
+            return None
+        url_blocker = getattr(self.pyshield, 'url_blocker', None)
+        # The CONNECT host itself already went through the rule pipeline
+        if url_blocker is None or not url_blocker.cfg.enabled or name == extract_host(host):
+            return None
+        if not url_blocker.is_malicious_host(name):
+            return None
+        stats["sni_blocked"] += 1
+        client_addr = client_writer.get_extra_info('peername')
+        client_ip = client_addr[0] if client_addr else 'unknown'
+        target = f"{name}:{port}"
+        reason = f"Malicious TLS server name blocked (CONNECT {host}:{port})"
+        self.request_history.append(HistoryRecord("CONNECT", target, client_ip, time.time(), True, reason))
+        hook = getattr(self.pyshield, 'on_url_block', None)
+        self.rules.notify(RuleVerdict("sni", 403, reason, (lambda: hook(target)) if hook is not None else None))
+        self.logger.warning(f"Blocked tunnel to {target} from {client_ip}: {reason}")
+        return reason
+    
+    async def _open_upstream_socket(self, host: str, port: int) -> socket.socket:
+        """Connected non-blocking socket to (host, port) via the caching, Happy Eyeballs resolver"""
+        return await self.resolver.connect(host, port, timeout=self.cfg.proxy.upstream_connect_timeout_seconds)
     
     async def handle_http(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter,
-                         method: str, host: str, port: int, path: str, headers: Dict[str, str]) -> None:
-        """Handle HTTP request"""
+                         method: str, host: str, port: int, path: str, headers: Headers, *,
+                         client_version: str = "HTTP/1.1", persistent: bool = False) -> bool:
+        """
+        Relay one HTTP request and its response, over a pooled upstream
+        connection when possible. Returns whether the client connection can
+        carry another request (`persistent` and the response was framed).
+        """
+        request_headers = headers
+        proxy_cfg = self.cfg.proxy
+        conn: Optional[UpstreamConnection] = None
+        reusable = False
+        responded = False
+        uploaded = False
+        cache = self.cache
+        url = cache_url(host, port, path)
+        slot: Optional[CacheSlot] = None
         try:
-            # Connect to destination
-            dest_reader, dest_writer = await asyncio.open_connection(host, port)
-            
-            # Forward request
-            request_line = f"{method} {path} HTTP/1.1\r\n"
-            dest_writer.write(request_line.encode())
-            
-            # Forward headers
-            for key, value in headers.items():
-                if key.lower() not in ['proxy-connection']:
-                    header_line = f"{key}: {value}\r\n"
-                    dest_writer.write(header_line.encode())
-            
-            dest_writer.write(b"\r\n")
-            
-            # Forward body if present
-            if method in ['POST', 'PUT', 'PATCH']:
-                content_length = headers.get('Content-Length', '0')
-                if content_length.isdigit() and int(content_length) > 0:
-                    body = await client_reader.read(int(content_length))
-                    dest_writer.write(body)
-            
-            await dest_writer.drain()
-            
-            # Forward response back to client
-            while True:
-                data = await dest_reader.read(8192)
-                if not data:
+            body_framing, body_length = request_framing(request_headers)
+            if proxy_cfg.max_request_body_bytes and body_length > proxy_cfg.max_request_body_bytes:
+                # Refused before connecting upstream; a client that sent Expect: 100-continue never sends the body
+                raise BodyTooLarge(proxy_cfg.max_request_body_bytes)
+            upgrade = get_header(request_headers, 'Upgrade') if 'upgrade' in connection_tokens(request_headers) else None
+            forward = strip_hop_by_hop(request_headers)
+            if upgrade:
+                forward += [('Upgrade', upgrade), ('Connection', 'upgrade')]
+            else:
+                forward.append(('Connection', 'keep-alive' if self.upstream_pool else 'close'))
+            if cache is not None and method == 'GET' and body_framing == NO_BODY and not upgrade:
+                slot = await cache.acquire(url, request_headers)
+                if slot.fresh:
+                    responded = True
+                    await self._send_cached(client_writer, slot.entry, request_headers, client_version, persistent)
+                    return persistent
+                if slot.entry is not None and not has_conditionals(request_headers):
+                    # Stale: a 304 lets the stored body be served
+                    forward += slot.entry.validators()
+                else:
+                    # A client's own conditional request is relayed as is
+                    slot.entry = None
+            head = serialize_head(f"{method} {path} HTTP/1.1", forward)
+            request_time = time.time()
+
+            # A request without a body can be replayed once if a reused connection turns out to be stale
+            raw = b""
+            for attempt in range(2):
+                conn = await self._connect_upstream(host, port, fresh=attempt > 0)
+                retriable = conn.reused and body_framing == NO_BODY
+                try:
+                    conn.writer.write(head)
+                    await relay_body(client_reader, conn.writer, body_framing, body_length,
+                                     limit=proxy_cfg.max_request_body_bytes)
+                    await conn.writer.drain()
+                    raw = await read_head(conn.reader)
+                except ConnectionError:
+                    if not retriable:
+                        raise
+                if raw or not retriable:
                     break
-                client_writer.write(data)
+                self._release_upstream(conn, False)
+                conn = None
+            if not raw:
+                raise HTTPError("upstream closed the connection without a response")
+            uploaded = True
+
+            # Interim 1xx responses (e.g. 100 Continue) go to the client as-is
+            start, response_headers = parse_head(raw)
+            version, status = self._parse_status(start)
+            while 100 <= status < 200 and status != 101:
+                client_writer.write(raw)
+                raw = await read_head(conn.reader)
+                if not raw:
+                    raise HTTPError("upstream closed the connection after an interim response")
+                start, response_headers = parse_head(raw)
+                version, status = self._parse_status(start)
+
+            if status == 101:
+                # Protocol switch (e.g. WebSocket): the connection becomes a tunnel
+                client_writer.write(raw)
                 await client_writer.drain()
-                
+                responded = True
+                await asyncio.gather(
+                    self.transfer_data(client_reader, conn.writer),
+                    self.transfer_data(conn.reader, client_writer),
+                    return_exceptions=True
+                )
+                return False
+
+            if cache is not None and method not in SAFE_METHODS and status < 400:
+                cache.invalidate(url)
+            capture: Optional[BodyCapture] = None
+            if slot is not None:
+                if slot.entry is not None and status == 304:
+                    entry = cache.refresh(slot.entry, strip_hop_by_hop(response_headers), request_time, time.time())
+                    reusable = keep_alive(version, response_headers)
+                    responded = True
+                    await self._send_cached(client_writer, entry, request_headers, client_version, persistent)
+                    return persistent
+                cache.miss()
+                if cache.storable(request_headers, status, response_headers):
+                    capture = BodyCapture(client_writer, cache.max_object_bytes)
+            response_time = time.time()
+
+            framing, length = response_framing(method, status, response_headers)
+            response_limit = proxy_cfg.max_response_body_bytes
+            if response_limit and length > response_limit:
+                raise BodyTooLarge(response_limit)
+            forward = strip_hop_by_hop(response_headers)
+            # HTTP/1.0 clients cannot parse chunks; HTTP/1.1 ones can keep the connection across a close-delimited body
+            dechunk = framing == CHUNKED and client_version == 'HTTP/1.0'
+            rechunk = framing == UNTIL_CLOSE and persistent and client_version != 'HTTP/1.0'
+            if dechunk:
+                forward = [(k, v) for k, v in forward if k.lower() != 'transfer-encoding']
+                persistent = False
+            elif rechunk:
+                forward.append(('Transfer-Encoding', 'chunked'))
+            elif framing == UNTIL_CLOSE:
+                persistent = False
+            client_writer.write(serialize_head(start, forward + self._connection_headers(client_version, persistent)))
+            responded = True
+            body_writer = capture if capture is not None else client_writer
+            if rechunk:
+                await relay_as_chunked(conn.reader, body_writer, limit=response_limit)
+            else:
+                await relay_body(conn.reader, body_writer, framing, length, dechunk=dechunk, limit=response_limit)
+            await client_writer.drain()
+            reusable = framing != UNTIL_CLOSE and keep_alive(version, response_headers)
+            if capture is not None and not capture.overflow:
+                body = capture.body(chunked=rechunk or (framing == CHUNKED and not dechunk))
+                cache.store(url, request_headers, start, strip_hop_by_hop(response_headers), body,
+                            request_time, response_time)
+            return persistent
+
+        except BodyTooLarge as e:
+            # The rest of the body is never read, so neither connection can carry another message
+            side = "response" if uploaded else "request"
+            self.logger.warning(f"Refused {side} body for {host}:{port}: {e}")
+            if not responded:
+                status = "502 Bad Gateway" if uploaded else "413 Content Too Large"
+                await self.send_error_response(client_writer, status)
+            return False
         except Exception as e:
             self.logger.error(f"Error in HTTP request to {host}:{port}: {e}")
-            await self.send_error_response(client_writer, "502 Bad Gateway")
+            if not responded:
+                await self.send_error_response(client_writer, "502 Bad Gateway")
+            return False
         finally:
-            try:
-                if 'dest_writer' in locals():
-                    dest_writer.close()
-                    await dest_writer.wait_closed()
-            except:
-                pass
+            if conn is not None:
+                self._release_upstream(conn, reusable)
+            if slot is not None and slot.leader:
+                cache.release(url)
+
+    async def _send_cached(self, writer: asyncio.StreamWriter, entry: CacheEntry, request_headers: Headers,
+                           client_version: str, persistent: bool) -> None:
+        """Answer from the cache: the stored response, or a 304 if the client's conditional request matches it"""
+        not_modified = has_conditionals(request_headers) and entry.not_modified_for(request_headers)
+        start, headers = entry.response_head(time.time(), not_modified=not_modified)
+        writer.write(serialize_head(start, headers + self._connection_headers(client_version, persistent)))
+        if not not_modified:
+            writer.write(entry.body)
+        await writer.drain()
+
+    async def _connect_upstream(self, host: str, port: int, *, fresh: bool = False) -> UpstreamConnection:
+        if self.upstream_pool is not None:
+            return await self.upstream_pool.acquire(host, port, fresh=fresh)
+        sock = await self._open_upstream_socket(host, port)
+        try:
+            reader, writer = await asyncio.open_connection(sock=sock)
+        except BaseException:
+            sock.close()
+            raise
+        return UpstreamConnection((host, port), reader, writer)
+
+    def _release_upstream(self, conn: UpstreamConnection, reusable: bool) -> None:
+        if self.upstream_pool is not None:
+            self.upstream_pool.release(conn, reusable)
+        else:
+            conn.close()
+
+    @staticmethod
+    def _parse_status(start_line: str) -> tuple[str, int]:
+        parts = start_line.split(' ', 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/') or not parts[1].isdigit():
+            raise HTTPError(f"malformed status line: {start_line[:64]!r}")
+        return parts[0], int(parts[1])
     
-    async def transfer_data(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
-        """Transfer data between reader and writer"""
+    async def transfer_data(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> int:
+        """Transfer data between reader and writer; returns the bytes moved"""
+        moved = 0
         try:
             while True:
                 data = await reader.read(8192)
                 if not data:
                     break
                 writer.write(data)
+                moved += len(data)
                 await writer.drain()
+            # Pass the half-close on so the other direction can finish too
+            if writer.can_write_eof():
+                writer.write_eof()
         except:
             pass
+        return moved
+    
+    async def send_refusal(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        503 for a connection over the caps, then a lingering close.
+
+        The client has usually sent its request already; closing with it
+        unread makes the kernel answer with an RST, and the client sees a
+        reset instead of the 503. So half-close our side and discard input
+        for a short while first, bounded in time and bytes. Only so many
+        refusals linger at once; past that the socket is closed right away.
+        """
+        response = (b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\n"
+                    b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+        if not self.admission.start_linger():
+            try:
+                writer.write(response)
+            except Exception:
+                pass
+            writer.close()
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + REFUSAL_LINGER_SECONDS
+        drained = 0
+        try:
+            writer.write(response)
+            if writer.can_write_eof():
+                writer.write_eof()
+            while drained < REFUSAL_LINGER_BYTES:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                chunk = await asyncio.wait_for(reader.read(REFUSAL_LINGER_BYTES), remaining)
+                if not chunk:
+                    break
+                drained += len(chunk)
+        except (asyncio.TimeoutError, OSError):
+            pass
+        finally:
+            self.admission.end_linger()
+            writer.close()
     
     async def send_error_response(self, writer: asyncio.StreamWriter, error: str) -> None:
         """Send error response"""
-        response = f"HTTP/1.1 {error}\r\nConnection: close\r\n\r\n"
+        response = f"HTTP/1.1 {error}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
         writer.write(response.encode())
         await writer.drain()
     
@@ -289,7 +622,9 @@ Connection: close\r
             self.server = await asyncio.start_server(
                 self.handle_request,
                 '127.0.0.1',
-                self.proxy_port
+                self.proxy_port,
+                reuse_port=self.reuse_port or None,
+                limit=self.cfg.proxy.client_max_header_bytes
             )
             self.running = True
             self.logger.info(f"HTTP Proxy server started on 127.0.0.1:{self.proxy_port}")
@@ -307,20 +642,10 @@ Connection: close\r
         self.running = False
         self.server.close()
         await self.server.wait_closed()
+        if self.upstream_pool is not None:
+            self.upstream_pool.close()
         self.logger.info("HTTP Proxy server stopped")
     
     def get_request_history(self, limit: int = 100) -> list[Dict[str, Any]]:
         """Get recent proxy requests for dashboard"""
-        recent_requests = self.request_history[-limit:] if self.request_history else []
-        return [
-            {
-                "method": req.method,
-                "url": req.url,
-                "client_ip": req.client_ip,
-                "timestamp": req.timestamp,
-                "blocked": req.blocked,
-                "block_reason": req.block_reason,
-                "domain": urlparse(req.url).netloc if req.url.startswith(('http://', 'https://')) else req.url
-            }
-            for req in recent_requests
-        ]
\ No newline at end of file
+        return [req.to_dict() for req in self.request_history.recent(limit)]
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+Proxy worker processes sharing one listening port through SO_REUSEPORT.
+
+Each worker is a fork of the main process, so it starts with the same
+modules (config, blacklist index pages, limiters) and runs its own event
+loop and HTTPProxyServer; the kernel spreads new client connections over
+the workers' sockets. Bans and per-IP rate limit counters live in a
+SharedState created before the fork, so they apply across all workers.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing as mp
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict, List, Optional
+
+from core.config import PyShieldConfig
+from core.logging_system import LoggerFactory
+from core.proxy_server import HTTPProxyServer
+from core.shared_state import SharedState
+
+REUSEPORT_AVAILABLE = hasattr(socket, "SO_REUSEPORT") and "fork" in mp.get_all_start_methods()
+
+
+class ProxyWorkerPool:
+    """
+    Forks `workers` proxy processes. Start it before any thread is started:
+    a fork only carries the calling thread, so locks held by others would
+    stay locked in the children.
+    """
+
+    def __init__(self, cfg: PyShieldConfig, pyshield_instance, shared: SharedState, workers: int) -> None:
+        self.cfg = cfg
+        self.pyshield = pyshield_instance
+        self.shared = shared
+        self.workers = workers
+        self.logger = LoggerFactory.get_logger("pyshield.workers")
+        self._processes: List[mp.Process] = []
+        self._stopped = False
+
+    def start(self) -> None:
+        if not REUSEPORT_AVAILABLE:
+            raise RuntimeError("proxy workers need SO_REUSEPORT and the fork start method")
+        ctx = mp.get_context("fork")
+        for index in range(self.workers):
+            process = ctx.Process(target=run_worker, args=(index, self.cfg, self.pyshield, self.shared),
+                                  name=f"pyshield-proxy-{index}", daemon=True)
+            process.start()
+            self._processes.append(process)
+        self.logger.info("Started %s proxy workers on port %s", self.workers, self.cfg.dashboard.proxy_port)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._stopped:
+            return
+        self._stopped = True
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self._processes = []
+        self.shared.close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        totals = self.shared.worker_totals()
+        workers = [
+            {"pid": p.pid, "alive": p.is_alive(), "requests": totals[i][0], "blocked": totals[i][1]}
+            for i, p in enumerate(self._processes)
+        ]
+        return {
+            "workers": len(workers),
+            "alive": sum(1 for w in workers if w["alive"]),
+            "requests": sum(w["requests"] for w in workers),
+            "blocked": sum(w["blocked"] for w in workers),
+            "per_worker": workers,
+            "cache": self.shared.cache_totals() if self.cfg.proxy.cache_enabled else None,
+            "shared": self.shared.snapshot(),
+        }
+
+
+def run_worker(index: int, cfg: PyShieldConfig, pyshield_instance, shared: SharedState) -> None:
+    """Entry point of a forked worker."""
+    # Ctrl+C reaches the whole process group; the parent stops workers with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    shared.detach()
+    bans = getattr(pyshield_instance, "ban_registry", None)
+    if bans is not None:
+        # The parent's listeners (kernel enforcement) learn about worker bans through the shared table
+        bans.clear_listeners()
+    asyncio.run(_serve(index, cfg, pyshield_instance, shared))
+
+
+async def _serve(index: int, cfg: PyShieldConfig, pyshield_instance, shared: SharedState) -> None:
+    logger = LoggerFactory.get_logger("pyshield.workers")
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    proxy = HTTPProxyServer(cfg, pyshield_instance, reuse_port=True, worker_index=index)
+    pyshield_instance.proxy_server = proxy
+    await proxy.start()
+    logger.info("Proxy worker %s (pid %s) accepting", index, os.getpid())
+
+    ddos = getattr(pyshield_instance, "ddos_protector", None)
+    url_blocker = getattr(pyshield_instance, "url_blocker", None)
+    sweep_interval = max(cfg.ddos.sweep_interval_seconds, 1)
+    next_sweep = time.monotonic() + sweep_interval
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), 1.0)
+        except asyncio.TimeoutError:
+            pass
+        stats = proxy.request_history.stats()
+        shared.publish_worker(index, stats["lifetime_requests"], stats["lifetime_blocked"])
+        if proxy.cache is not None:
+            shared.publish_worker_cache(index, {**proxy.cache.stats, "entries": len(proxy.cache)})
+        if time.monotonic() < next_sweep:
+            continue
+        next_sweep = time.monotonic() + sweep_interval
+        try:
+            if ddos is not None:
+                ddos.sweep()
+            if url_blocker is not None:
+                url_blocker.reload_index_file()
+        except Exception as e:  # pragma: no cover
+            logger.exception("Worker maintenance failed: %s", e)
+    await proxy.stop()
+
+
+def create_worker_pool(cfg: PyShieldConfig, pyshield_instance) -> Optional[ProxyWorkerPool]:
+    """
+    Set up shared state and a worker pool if `proxy.workers` asks for more
+    than one process and the platform supports it; None otherwise. Attaches
+    the shared tables to the ban registry and DDoS limiter of `pyshield_instance`.
+    """
+    proxy_cfg = cfg.proxy
+    if proxy_cfg.workers <= 1:
+        return None
+    if not REUSEPORT_AVAILABLE:
+        LoggerFactory.get_logger("pyshield.workers").warning(
+            "proxy.workers=%s needs SO_REUSEPORT and fork; running a single in-process proxy", proxy_cfg.workers)
+        return None
+    shared = SharedState(ban_slots=proxy_cfg.shared_ban_slots, counter_slots=proxy_cfg.shared_counter_slots,
+                         workers=proxy_cfg.workers)
+    bans = getattr(pyshield_instance, "ban_registry", None)
+    if bans is not None:
+        bans.attach_shared(shared.bans)
+    ddos = getattr(pyshield_instance, "ddos_protector", None)
+    if ddos is not None:
+        ddos.share_counters(shared.counters)
+    return ProxyWorkerPool(cfg, pyshield_instance, shared, proxy_cfg.workers)
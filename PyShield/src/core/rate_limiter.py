@@ -1,31 +1,176 @@
 from __future__ import annotations
 
+import asyncio
+import math
 import time
+import weakref
 from collections import deque
-from typing import Deque, Dict, Tuple, Optional, Any
+from typing import Deque, Dict, List, Tuple, Optional, Any
+
+from .concurrency import StripedLock
 
 try:
     import redis  # type: ignore
 except Exception:  # pragma: no cover
     redis = None  # type: ignore
 
+try:
+    import redis.asyncio as aioredis  # type: ignore
+except Exception:  # pragma: no cover
+    aioredis = None  # type: ignore
+
 
 class SlidingWindowRateLimiter:
     def __init__(self, *, limit: int, window_seconds: int) -> None:
         self.limit = limit
         self.window = window_seconds
         self.events: Dict[str, Deque[float]] = {}
+        self._locks = StripedLock()
 
     def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, int]:
         t = now if now is not None else time.time()
-        q = self.events.setdefault(key, deque())
-        q.append(t)
-        # Evict old
+        with self._locks.for_key(key):
+            q = self.events.setdefault(key, deque())
+            q.append(t)
+            # Evict old
+            cutoff = t - self.window
+            while q and q[0] < cutoff:
+                q.popleft()
+            count = len(q)
+        allowed = count <= self.limit
+        return allowed, count
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop keys whose newest event fell out of the window. Returns keys removed."""
+        t = now if now is not None else time.time()
         cutoff = t - self.window
-        while q and q[0] < cutoff:
-            q.popleft()
-        allowed = len(q) <= self.limit
-        return allowed, len(q)
+        removed = 0
+        for key, q in self.events.copy().items():
+            if q and q[-1] >= cutoff:
+                continue
+            with self._locks.for_key(key):
+                q = self.events.get(key)
+                if q is not None and (not q or q[-1] < cutoff):
+                    del self.events[key]
+                    removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+
+class GCRARateLimiter:
+    """
+    Generic Cell Rate Algorithm: one float (theoretical arrival time) per key.
+
+    Allows a burst of `limit` requests, then one request every `window / limit`
+    seconds. A key whose TAT is in the past carries no information and is
+    dropped by `sweep`.
+    """
+
+    def __init__(self, *, limit: int, window_seconds: int) -> None:
+        self.limit = limit
+        self.window = float(window_seconds)
+        self.interval = self.window / max(limit, 1)
+        self.tat: Dict[str, float] = {}
+        self._locks = StripedLock()
+
+    def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, int]:
+        t = now if now is not None else time.time()
+        with self._locks.for_key(key):
+            tat = self.tat.get(key, t)
+            if tat < t:
+                tat = t
+            new_tat = tat + self.interval
+            # Requests "in flight" within the window, including this one
+            count = math.ceil((new_tat - t) / self.interval - 1e-9)
+            if new_tat - t > self.window + 1e-9:
+                return False, count
+            self.tat[key] = new_tat
+        return True, count
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop keys that have fully drained. Returns keys removed."""
+        t = now if now is not None else time.time()
+        removed = 0
+        for key, tat in self.tat.copy().items():
+            if tat > t:
+                continue
+            with self._locks.for_key(key):
+                tat = self.tat.get(key)
+                if tat is not None and tat <= t:
+                    del self.tat[key]
+                    removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self.tat)
+
+
+class SlidingWindowCounterRateLimiter:
+    """
+    Two-bucket sliding window counter: (window index, previous count, current count) per key.
+
+    The previous window's count is weighted by how much of it still overlaps the
+    sliding window, which approximates the exact sliding log closely enough for
+    rate limiting at a fraction of the memory.
+    """
+
+    def __init__(self, *, limit: int, window_seconds: int) -> None:
+        self.limit = limit
+        self.window = float(window_seconds)
+        self.buckets: Dict[str, Tuple[int, int, int]] = {}
+        self._locks = StripedLock()
+
+    def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, int]:
+        t = now if now is not None else time.time()
+        idx = int(t // self.window)
+        with self._locks.for_key(key):
+            state = self.buckets.get(key)
+            if state is None or state[0] < idx - 1:
+                prev, cur = 0, 0
+            elif state[0] == idx - 1:
+                prev, cur = state[2], 0
+            else:
+                prev, cur = state[1], state[2]
+            cur += 1
+            self.buckets[key] = (idx, prev, cur)
+        overlap = 1.0 - (t - idx * self.window) / self.window
+        count = math.ceil(prev * overlap + cur - 1e-9)
+        return count <= self.limit, count
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop keys with no hits in the current or previous window. Returns keys removed."""
+        t = now if now is not None else time.time()
+        idx = int(t // self.window)
+        removed = 0
+        for key, state in self.buckets.copy().items():
+            if state[0] >= idx - 1:
+                continue
+            with self._locks.for_key(key):
+                state = self.buckets.get(key)
+                if state is not None and state[0] < idx - 1:
+                    del self.buckets[key]
+                    removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+
+LIMITER_ALGORITHMS = {
+    "sliding_log": SlidingWindowRateLimiter,
+    "gcra": GCRARateLimiter,
+    "sliding_counter": SlidingWindowCounterRateLimiter,
+}
+
+
+def create_rate_limiter(algorithm: str, *, limit: int, window_seconds: int):
+    try:
+        cls = LIMITER_ALGORITHMS[algorithm]
+    except KeyError:
+        raise ValueError(f"Unknown rate limiter algorithm: {algorithm!r} (expected one of {sorted(LIMITER_ALGORITHMS)})")
+    return cls(limit=limit, window_seconds=window_seconds)
 
 
 class RedisCounter:
@@ -41,3 +186,150 @@ class RedisCounter:
         pipe.expire(redis_key, self.window + 1)
         count, _ = pipe.execute()
         return True, int(count)  # Policy enforcement based on count is done by the caller
+
+    def sweep(self, now: Optional[float] = None) -> int:  # Redis expires keys on its own
+        return 0
+
+
+# Two-bucket sliding window counter evaluated atomically on the Redis server.
+# KEYS[1]: key prefix; ARGV: now (seconds, float), window (seconds), increment.
+# Returns the weighted request count after applying the increment.
+SLIDING_WINDOW_LUA = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local incr = tonumber(ARGV[3])
+local idx = math.floor(now / window)
+local cur_key = KEYS[1] .. ':' .. string.format('%d', idx)
+local prev_key = KEYS[1] .. ':' .. string.format('%d', idx - 1)
+local cur
+if incr > 0 then
+  cur = redis.call('INCRBY', cur_key, incr)
+  redis.call('EXPIRE', cur_key, math.ceil(window * 2))
+else
+  cur = tonumber(redis.call('GET', cur_key) or '0')
+end
+local prev = tonumber(redis.call('GET', prev_key) or '0')
+local overlap = 1 - (now - idx * window) / window
+return math.ceil(prev * overlap + cur - 1e-9)
+"""
+
+
+class AsyncRedisSlidingWindow:
+    """
+    Sliding window counter kept in Redis and updated by one Lua script call per hit.
+
+    A pooled `redis.asyncio` client is created lazily per event loop (the proxy
+    and the dashboard run separate loops). Pass `client` to use a prepared
+    client instead, e.g. `fakeredis.aioredis.FakeRedis()` in tests.
+    """
+
+    def __init__(self, url: Optional[str] = None, *, limit: int, window_seconds: int,
+                 max_connections: int = 20, client: Any = None, prefix: str = "rl") -> None:
+        if client is None and aioredis is None:
+            raise RuntimeError("redis.asyncio is not available")
+        self.url = url or "redis://localhost:6379/0"
+        self.limit = limit
+        self.window = window_seconds
+        self.max_connections = max_connections
+        self.prefix = prefix
+        self._client = client
+        self._scripts: "weakref.WeakKeyDictionary[Any, Tuple[Any, Any]]" = weakref.WeakKeyDictionary()
+
+    def _script(self) -> Any:
+        if self._client is not None:
+            key: Any = self
+            client = self._client
+        else:
+            key = asyncio.get_running_loop()
+            client = None
+        entry = self._scripts.get(key)
+        if entry is None:
+            if client is None:
+                pool = aioredis.ConnectionPool.from_url(self.url, max_connections=self.max_connections,
+                                                        decode_responses=True)
+                client = aioredis.Redis(connection_pool=pool)
+            entry = (client, client.register_script(SLIDING_WINDOW_LUA))
+            self._scripts[key] = entry
+        return entry[1]
+
+    async def hit(self, key: str, now: Optional[float] = None, *, amount: int = 1) -> Tuple[bool, int]:
+        t = now if now is not None else time.time()
+        count = int(await self._script()(keys=[f"{self.prefix}:{{{key}}}"], args=[repr(t), self.window, amount]))
+        return count <= self.limit, count
+
+    async def close(self) -> None:
+        entries = list(self._scripts.values())
+        self._scripts.clear()
+        for client, _ in entries:
+            try:
+                await client.aclose()
+            except AttributeError:  # redis-py < 5.0.1
+                await client.close()
+
+
+class HybridRedisLimiter:
+    """
+    Spends a small local budget per key and reconciles with Redis in batches.
+
+    Each key syncs once `local_budget` hits are pending or `sync_interval`
+    seconds have passed, whichever comes first, so Redis sees roughly one
+    round trip per `local_budget` requests. Between syncs a node may overshoot
+    the global limit by up to `local_budget` requests.
+    """
+
+    def __init__(self, remote: AsyncRedisSlidingWindow, *, limit: int, local_budget: int = 10,
+                 sync_interval: float = 1.0) -> None:
+        self.remote = remote
+        self.limit = limit
+        self.local_budget = max(local_budget, 1)
+        self.sync_interval = sync_interval
+        # key -> [pending hits, last global count, last sync time]
+        self._local: Dict[str, List[float]] = {}
+        self._locks = StripedLock()
+        self.round_trips = 0
+
+    async def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, int]:
+        t = now if now is not None else time.time()
+        with self._locks.for_key(key):
+            entry = self._local.get(key)
+            if entry is None:
+                entry = self._local[key] = [0, 0, t]
+            entry[0] += 1
+            pending, known, last_sync = entry
+            count = int(known + pending)
+            if pending < self.local_budget and t - last_sync < self.sync_interval and count <= self.limit:
+                return True, count
+            entry[0] = 0
+            entry[2] = t
+        self.round_trips += 1
+        try:
+            _, count = await self.remote.hit(key, now=t, amount=int(pending))
+        except Exception:
+            with self._locks.for_key(key):
+                entry[0] += pending  # Keep the hits for the next reconciliation
+            raise
+        with self._locks.for_key(key):
+            entry[1] = count
+            count += int(entry[0])  # Hits spent locally while the sync was in flight
+        return count <= self.limit, count
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop local entries with nothing pending that have not synced for a full window."""
+        t = now if now is not None else time.time()
+        cutoff = t - self.remote.window
+        removed = 0
+        for key, entry in self._local.copy().items():
+            if entry[0] or entry[2] >= cutoff:
+                continue
+            with self._locks.for_key(key):
+                entry = self._local.get(key)
+                if entry is not None and not entry[0] and entry[2] < cutoff:
+                    del self._local[key]
+                    removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    async def close(self) -> None:
+        await self.remote.close()
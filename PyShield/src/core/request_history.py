@@ -0,0 +1,145 @@
+"""
+Bounded proxy request history with incrementally maintained aggregates.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class HistoryRecord:
+    """One proxied request as shown on the dashboard; the domain is derived once, at insert time."""
+
+    __slots__ = ("method", "url", "domain", "client_ip", "timestamp", "blocked", "block_reason")
+
+    def __init__(self, method: str, url: str, client_ip: str, timestamp: float,
+                 blocked: bool = False, block_reason: str = "") -> None:
+        self.method = method
+        self.url = url
+        self.domain = request_domain(url)
+        self.client_ip = client_ip
+        self.timestamp = timestamp
+        self.blocked = blocked
+        self.block_reason = block_reason
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "method": self.method,
+            "url": self.url,
+            "client_ip": self.client_ip,
+            "timestamp": self.timestamp,
+            "blocked": self.blocked,
+            "block_reason": self.block_reason,
+            "domain": self.domain,
+        }
+
+
+def request_domain(url: str) -> str:
+    """Authority of an absolute-form URL ('host:port' as-is for CONNECT and origin-form targets)."""
+    if url.startswith(("http://", "https://")):
+        return url.split("/", 3)[2]
+    return url
+
+
+class RequestHistory:
+    """
+    Fixed-capacity ring of the most recent requests.
+
+    Besides the ring, it keeps (all O(1) per request):
+    - lifetime totals;
+    - totals over the records currently held, adjusted when one is overwritten;
+    - per-second buckets over the last `window_seconds`, with running sums.
+
+    `stats()` therefore never scans the history, whatever its capacity. The
+    proxy loop appends and the dashboard thread reads, so both take a lock.
+    """
+
+    def __init__(self, capacity: int = 1000, window_seconds: int = 60) -> None:
+        self.capacity = max(capacity, 1)
+        self.window_seconds = max(window_seconds, 1)
+        self._ring: List[Optional[HistoryRecord]] = [None] * self.capacity
+        self._next = 0
+        self._size = 0
+        self._held_blocked = 0
+        self._total = 0
+        self._total_blocked = 0
+        # Bucket i counts requests in second `_bucket_second[i]`
+        self._bucket_second = [0] * self.window_seconds
+        self._bucket_total = [0] * self.window_seconds
+        self._bucket_blocked = [0] * self.window_seconds
+        self._window_total = 0
+        self._window_blocked = 0
+        self._last_second = 0
+        self._lock = threading.Lock()
+
+    def append(self, record: HistoryRecord) -> None:
+        second = int(record.timestamp)
+        with self._lock:
+            old = self._ring[self._next]
+            if old is not None and old.blocked:
+                self._held_blocked -= 1
+            self._ring[self._next] = record
+            self._next = (self._next + 1) % self.capacity
+            if self._size < self.capacity:
+                self._size += 1
+            self._total += 1
+            if record.blocked:
+                self._held_blocked += 1
+                self._total_blocked += 1
+
+            self._advance(second)
+            i = second % self.window_seconds
+            if self._bucket_second[i] == second:
+                self._bucket_total[i] += 1
+                self._window_total += 1
+                if record.blocked:
+                    self._bucket_blocked[i] += 1
+                    self._window_blocked += 1
+
+    def _advance(self, second: int) -> None:
+        # Expire every bucket that fell out of the window since the last call; amortized O(1)
+        last = self._last_second
+        if second <= last:
+            return
+        w = self.window_seconds
+        for s in range(max(last + 1, second - w + 1), second + 1):
+            i = s % w
+            self._window_total -= self._bucket_total[i]
+            self._window_blocked -= self._bucket_blocked[i]
+            self._bucket_second[i] = s
+            self._bucket_total[i] = 0
+            self._bucket_blocked[i] = 0
+        self._last_second = second
+
+    def recent(self, limit: int = 100) -> List[HistoryRecord]:
+        """Up to `limit` newest records, oldest first."""
+        with self._lock:
+            n = min(max(limit, 0), self._size)
+            start = (self._next - n) % self.capacity
+            if start + n <= self.capacity:
+                return self._ring[start:start + n]  # type: ignore[return-value]
+            return self._ring[start:] + self._ring[:self._next]  # type: ignore[operator]
+
+    def stats(self, now: Optional[float] = None) -> Dict[str, Any]:
+        with self._lock:
+            self._advance(int(now if now is not None else time.time()))
+            held = self._size
+            blocked = self._held_blocked
+            return {
+                "total_requests": held,
+                "blocked_requests": blocked,
+                "allowed_requests": held - blocked,
+                "block_rate": (blocked / held * 100) if held else 0,
+                "lifetime_requests": self._total,
+                "lifetime_blocked": self._total_blocked,
+                "window_seconds": self.window_seconds,
+                "window_requests": self._window_total,
+                "window_blocked": self._window_blocked,
+                "requests_per_second": self._window_total / self.window_seconds,
+                "history_capacity": self.capacity,
+            }
+
+    def __len__(self) -> int:
+        return self._size
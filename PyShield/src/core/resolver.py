@@ -0,0 +1,366 @@
+"""
+Upstream name resolution and connection setup for the proxy.
+
+`Resolver` caches answers for their TTL (clamped), caches failures for a
+short negative TTL, and shares one in-flight lookup between concurrent
+requests for the same name. `Resolver.connect` races the resolved addresses
+Happy Eyeballs style (RFC 8305): address families are interleaved and a new
+attempt starts whenever the previous one fails or has not finished within
+the attempt delay, so a dead IPv6 route costs a fraction of a second rather
+than a full connect timeout.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import socket
+import time
+import weakref
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .config import ProxyConfig
+from .ipnet import parse_ip
+
+try:
+    import aiodns  # type: ignore
+except Exception:  # pragma: no cover
+    aiodns = None  # type: ignore
+
+# (family, IP) pairs; ports are applied at connect time so one entry serves every port
+Addresses = List[Tuple[int, str]]
+
+_NOT_FOUND = {socket.EAI_NONAME, getattr(socket, "EAI_NODATA", socket.EAI_NONAME)}
+
+
+class _LookupCancelled(socket.gaierror):
+    """The request that started a shared lookup went away; its waiters look up again."""
+
+
+class ResolverBackend:
+    """Source of answers. `lookup` returns (addresses, ttl or None) or raises socket.gaierror."""
+
+    name = "backend"
+
+    async def lookup(self, host: str) -> Tuple[Addresses, Optional[float]]:
+        raise NotImplementedError
+
+
+class SystemBackend(ResolverBackend):
+    """getaddrinfo in the loop's executor; it reports no TTLs, so the resolver's default applies."""
+
+    name = "system"
+
+    async def lookup(self, host: str) -> Tuple[Addresses, Optional[float]]:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        return _dedupe((family, sockaddr[0]) for family, _, _, _, sockaddr in infos), None
+
+
+class AiodnsBackend(ResolverBackend):
+    """A and AAAA queries through c-ares (aiodns), with the record TTLs."""
+
+    name = "aiodns"
+
+    def __init__(self, nameservers: Optional[Sequence[str]] = None, timeout: float = 5.0) -> None:
+        if aiodns is None:
+            raise RuntimeError("aiodns is required for the 'aiodns' resolver backend")
+        self.nameservers = list(nameservers or [])
+        self.timeout = timeout
+        # c-ares channels are bound to the loop that created them
+        self._resolvers: "weakref.WeakKeyDictionary[Any, Any]" = weakref.WeakKeyDictionary()
+
+    def _resolver(self) -> Any:
+        loop = asyncio.get_running_loop()
+        resolver = self._resolvers.get(loop)
+        if resolver is None:
+            resolver = aiodns.DNSResolver(nameservers=self.nameservers or None, timeout=self.timeout, loop=loop)
+            self._resolvers[loop] = resolver
+        return resolver
+
+    async def lookup(self, host: str) -> Tuple[Addresses, Optional[float]]:
+        resolver = self._resolver()
+        answers = await asyncio.gather(resolver.query(host, "AAAA"), resolver.query(host, "A"),
+                                       return_exceptions=True)
+        addresses: Addresses = []
+        ttls: List[float] = []
+        errors: List[BaseException] = []
+        for family, answer in zip((socket.AF_INET6, socket.AF_INET), answers):
+            if isinstance(answer, BaseException):
+                errors.append(answer)
+                continue
+            for record in answer:
+                addresses.append((family, record.host))
+                ttls.append(record.ttl)
+        if not addresses:
+            # Both queries answered "no such name/no data": a cacheable miss; anything else is transient
+            codes = {e.args[0] for e in errors if getattr(e, "args", None)}
+            missing = codes <= {aiodns.error.ARES_ENOTFOUND, aiodns.error.ARES_ENODATA}
+            raise socket.gaierror(socket.EAI_NONAME if missing else socket.EAI_AGAIN,
+                                  f"{host}: {errors[0] if errors else 'no addresses'}")
+        return _dedupe(addresses), min(ttls) if ttls else None
+
+
+class StaticBackend(ResolverBackend):
+    """
+    Fixed name -> IPs table (a local stub resolver), consulted before an
+    optional fallback backend. Useful for pinning hosts and for tests.
+    """
+
+    name = "static"
+
+    def __init__(self, hosts: Dict[str, Iterable[str]], fallback: Optional[ResolverBackend] = None,
+                 ttl: float = 3600.0) -> None:
+        self.hosts: Dict[str, Addresses] = {}
+        for name, ips in hosts.items():
+            entries: Addresses = []
+            for ip in ips:
+                parsed = parse_ip(ip)
+                if parsed is None:
+                    raise ValueError(f"Invalid address for {name}: {ip}")
+                entries.append((socket.AF_INET if parsed[0] == 4 else socket.AF_INET6, ip))
+            self.hosts[name.lower().rstrip(".")] = entries
+        self.fallback = fallback
+        self.ttl = ttl
+
+    async def lookup(self, host: str) -> Tuple[Addresses, Optional[float]]:
+        entries = self.hosts.get(host)
+        if entries is not None:
+            return list(entries), self.ttl
+        if self.fallback is not None:
+            return await self.fallback.lookup(host)
+        raise socket.gaierror(socket.EAI_NONAME, f"{host}: not in static table")
+
+
+def _dedupe(addresses: Iterable[Tuple[int, str]]) -> Addresses:
+    return list(dict.fromkeys(addresses))
+
+
+def interleave(addresses: Addresses) -> Addresses:
+    """Alternate address families, starting with the family of the first answer (RFC 8305 section 4)."""
+    if not addresses:
+        return []
+    first = addresses[0][0]
+    preferred = [a for a in addresses if a[0] == first]
+    other = [a for a in addresses if a[0] != first]
+    out: Addresses = []
+    for i in range(max(len(preferred), len(other))):
+        if i < len(preferred):
+            out.append(preferred[i])
+        if i < len(other):
+            out.append(other[i])
+    return out
+
+
+def _sockaddr(family: int, ip: str, port: int) -> tuple:
+    if family == socket.AF_INET6:
+        ip, _, scope = ip.partition("%")
+        return (ip, port, 0, socket.if_nametoindex(scope) if scope and not scope.isdigit() else int(scope or 0))
+    return (ip, port)
+
+
+class Resolver:
+    """
+    Caching, coalescing resolver in front of a backend.
+
+    Answers are cached for the backend's TTL clamped to [min_ttl, max_ttl],
+    or `default_ttl` when the backend has none; "no such name" failures for
+    `negative_ttl`. Other failures (timeouts, SERVFAIL) are not cached.
+    Concurrent lookups of one name on one event loop share a single backend
+    query.
+    """
+
+    def __init__(self, backend: Optional[ResolverBackend] = None, *, default_ttl: float = 60.0,
+                 min_ttl: float = 5.0, max_ttl: float = 3600.0, negative_ttl: float = 10.0,
+                 timeout: float = 5.0, max_entries: int = 10000, happy_eyeballs_delay: float = 0.25) -> None:
+        self.backend = backend or SystemBackend()
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+        # host -> (addresses or the failure to re-raise, expires at)
+        self._cache: Dict[str, Tuple[Any, float]] = {}
+        # Per event loop: host -> in-flight lookup
+        self._inflight: "weakref.WeakKeyDictionary[Any, Dict[str, asyncio.Future]]" = weakref.WeakKeyDictionary()
+        self.stats: Dict[str, int] = {
+            "hits": 0, "misses": 0, "negative_hits": 0, "coalesced": 0, "errors": 0,
+            "connects": 0, "connect_failures": 0, "fallbacks": 0,
+        }
+
+    async def resolve(self, host: str) -> Addresses:
+        """Addresses for `host` (IP literals are returned as-is); raises socket.gaierror."""
+        host = host.lower().rstrip(".")
+        parsed = parse_ip(host.strip("[]"))
+        if parsed is not None:
+            return [(socket.AF_INET if parsed[0] == 4 else socket.AF_INET6, host.strip("[]"))]
+        entry = self._cache.get(host)
+        if entry is not None:
+            value, expires = entry
+            if expires > time.monotonic():
+                if isinstance(value, BaseException):
+                    self.stats["negative_hits"] += 1
+                    raise value
+                self.stats["hits"] += 1
+                return value
+            self._cache.pop(host, None)
+        self.stats["misses"] += 1
+
+        inflight = self._loop_inflight()
+        pending = inflight.get(host)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except _LookupCancelled:
+                return await self.resolve(host)
+        future = asyncio.get_running_loop().create_future()
+        inflight[host] = future
+        try:
+            addresses = await self._lookup(host)
+        except BaseException as e:
+            inflight.pop(host, None)
+            # Waiters must not inherit our cancellation; they retry instead
+            error = e if isinstance(e, Exception) else _LookupCancelled(socket.EAI_AGAIN, f"{host}: lookup cancelled")
+            future.set_exception(error)
+            future.exception()  # retrieved: no "never retrieved" warning without waiters
+            raise
+        inflight.pop(host, None)
+        future.set_result(addresses)
+        return addresses
+
+    def _loop_inflight(self) -> Dict[str, asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(loop)
+        if inflight is None:
+            inflight = self._inflight[loop] = {}
+        return inflight
+
+    async def _lookup(self, host: str) -> Addresses:
+        try:
+            addresses, ttl = await asyncio.wait_for(self.backend.lookup(host), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["errors"] += 1
+            raise socket.gaierror(socket.EAI_AGAIN, f"{host}: lookup timed out")
+        except socket.gaierror as e:
+            self.stats["errors"] += 1
+            if e.errno in _NOT_FOUND:
+                self._store(host, e, self.negative_ttl)
+            raise
+        if not addresses:
+            error = socket.gaierror(socket.EAI_NONAME, f"{host}: no addresses")
+            self._store(host, error, self.negative_ttl)
+            raise error
+        ttl = self.default_ttl if ttl is None else min(max(ttl, self.min_ttl), self.max_ttl)
+        self._store(host, addresses, ttl)
+        return addresses
+
+    def _store(self, host: str, value: Any, ttl: float) -> None:
+        cache = self._cache
+        if len(cache) >= self.max_entries:
+            now = time.monotonic()
+            for stale in [h for h, (_, exp) in cache.items() if exp <= now]:
+                del cache[stale]
+            if len(cache) >= self.max_entries:
+                # Oldest insertion first
+                for stale in list(cache)[: max(self.max_entries // 10, 1)]:
+                    del cache[stale]
+        cache[host] = (value, time.monotonic() + ttl)
+
+    async def connect(self, host: str, port: int, *, timeout: Optional[float] = None) -> socket.socket:
+        """
+        Connected non-blocking TCP socket to (host, port). `timeout` bounds
+        resolution plus every connection attempt together.
+        """
+        if timeout is None:
+            return await self._connect(host, port)
+        return await asyncio.wait_for(self._connect(host, port), timeout)
+
+    async def _connect(self, host: str, port: int) -> socket.socket:
+        addresses = interleave(await self.resolve(host))
+        self.stats["connects"] += 1
+        try:
+            return await self._race(addresses, port)
+        except OSError:
+            self.stats["connect_failures"] += 1
+            raise
+
+    async def _race(self, addresses: Addresses, port: int) -> socket.socket:
+        loop = asyncio.get_running_loop()
+
+        async def attempt(family: int, ip: str) -> socket.socket:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.setblocking(False)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                await loop.sock_connect(sock, _sockaddr(family, ip, port))
+                return sock
+            except BaseException:
+                sock.close()
+                raise
+
+        remaining = list(addresses)
+        running: Set[asyncio.Task] = set()
+        errors: List[BaseException] = []
+        try:
+            while remaining or running:
+                if remaining:
+                    if running:
+                        self.stats["fallbacks"] += 1
+                    running.add(loop.create_task(attempt(*remaining.pop(0))))
+                # Give the newest attempt the head start; the last one gets all the time it needs
+                done, running = await asyncio.wait(
+                    running, timeout=self.happy_eyeballs_delay if remaining else None,
+                    return_when=asyncio.FIRST_COMPLETED)
+                winner: Optional[socket.socket] = None
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        task.result().close()  # finished in the same tick as the winner
+                if winner is not None:
+                    return winner
+                # Nothing done: the delay expired and the loop starts the next attempt.
+                # Failures also start the next attempt at once.
+        finally:
+            for task in running:
+                task.cancel()
+            for task in running:
+                try:
+                    sock = await task
+                except BaseException:
+                    continue
+                sock.close()  # lost the race after the winner was picked
+        if len(errors) == 1:
+            raise errors[0]
+        raise OSError(f"all {len(errors)} connection attempts failed: " + "; ".join(str(e) for e in errors))
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self.stats)
+        out["cached"] = len(self._cache)
+        out["backend"] = self.backend.name
+        return out
+
+
+def create_resolver(cfg: ProxyConfig) -> Resolver:
+    """Resolver for the proxy's DNS settings."""
+    if cfg.dns_backend == "aiodns":
+        backend: ResolverBackend = AiodnsBackend(cfg.dns_nameservers, timeout=cfg.dns_timeout_seconds)
+    elif cfg.dns_backend == "system":
+        backend = SystemBackend()
+    else:
+        raise ValueError(f"Unknown DNS backend: {cfg.dns_backend}")
+    if cfg.dns_static_hosts:
+        backend = StaticBackend(cfg.dns_static_hosts, fallback=backend)
+    return Resolver(
+        backend,
+        default_ttl=cfg.dns_default_ttl_seconds,
+        min_ttl=cfg.dns_min_ttl_seconds,
+        max_ttl=cfg.dns_max_ttl_seconds,
+        negative_ttl=cfg.dns_negative_ttl_seconds,
+        timeout=cfg.dns_timeout_seconds,
+        max_entries=cfg.dns_max_entries,
+        happy_eyeballs_delay=cfg.happy_eyeballs_delay_seconds,
+    )
@@ -0,0 +1,309 @@
+"""
+Firewall rule pipeline shared by the proxy and the dashboard middleware.
+
+Each check is a `Stage` that declares what it costs and whether it blocks.
+A request runs through the stages until one returns a `RuleVerdict`:
+
+- sync, non-blocking stages (ban lookup, blacklist index, path rules) run
+  inline on the event loop;
+- async stages (Redis limiter, reputation service) are awaited;
+- blocking stages (GeoIP reader, Redis without an async client) run on a
+  bounded thread pool, as do the alert hooks of a verdict.
+
+Every stage counts calls, blocks, errors and time spent. With
+`adaptive_order` the stages are periodically re-sorted by expected cost per
+block (mean latency / block rate), so cheap checks that block often run
+first. The rate limiter counts every request that reaches it, so it is a
+barrier: stages are only reordered among their neighbours on the same side.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Union
+
+from core.config import RulesConfig
+from core.logging_system import LoggerFactory
+
+
+@dataclass
+class RuleContext:
+    client_ip: str
+    url: str
+    host: str
+    # None: path rules match `url` (the proxy only splits it when there are rules)
+    path: Optional[str] = None
+    query: str = ""
+    # Path counted against DDoS route budgets; None counts only the IP and global budgets
+    route: Optional[str] = None
+    # True when the request goes on to `host` (proxy), False when served here (dashboard)
+    proxied: bool = False
+    # False when client_ip was taken from a forwarding header instead of the socket peer
+    peer: bool = True
+
+
+@dataclass
+class RuleVerdict:
+    stage: str
+    # Dashboard response status; the proxy always answers 403
+    status: int
+    reason: str
+    # Reporting side effects (stats, alerts); run on the pipeline's thread pool
+    notify: Optional[Callable[[], None]] = None
+
+
+Check = Callable[[RuleContext], Union[Optional[RuleVerdict], Awaitable[Optional[RuleVerdict]]]]
+
+
+class Stage:
+    """
+    One firewall check. `cost` is its expected latency in microseconds,
+    used until latencies are observed. `blocking` checks do I/O without an
+    async variant and are run on the thread pool. A `barrier` has side
+    effects every request reaching it must go through (counting), so no
+    stage is moved across it.
+    """
+
+    def __init__(self, name: str, check: Check, *, cost: float, blocking: bool = False,
+                 barrier: bool = False) -> None:
+        self.name = name
+        self.check = check
+        self.cost = cost
+        self.blocking = blocking
+        self.barrier = barrier
+        self.is_async = asyncio.iscoroutinefunction(check)
+        self.calls = 0
+        self.hits = 0
+        self.errors = 0
+        self.seconds = 0.0
+        # The proxy loop and the uvicorn thread evaluate concurrently
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, hit: bool, error: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            self.seconds += elapsed
+            if hit:
+                self.hits += 1
+            if error:
+                self.errors += 1
+
+    def mean_latency_us(self) -> float:
+        return self.seconds * 1e6 / self.calls if self.calls else self.cost
+
+    def expected_cost(self) -> float:
+        """Microseconds spent per request this stage blocks (Laplace-smoothed block rate)."""
+        return self.mean_latency_us() * (self.calls + 2) / (self.hits + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "cost_us": self.cost,
+            "blocking": self.blocking,
+            "async": self.is_async,
+            "barrier": self.barrier,
+            "calls": self.calls,
+            "hits": self.hits,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / self.calls, 6) if self.calls else 0.0,
+            "avg_latency_us": round(self.mean_latency_us(), 3),
+        }
+
+
+class RulePipeline:
+    def __init__(self, stages: Iterable[Stage], *, executor_workers: int = 4, adaptive: bool = True,
+                 reorder_every: int = 1000) -> None:
+        self.logger = LoggerFactory.get_logger("pyshield.rules")
+        # Declaration order: barriers partition it, reordering happens within the parts
+        self.stages: List[Stage] = list(stages)
+        self.executor_workers = max(executor_workers, 1)
+        self.adaptive = adaptive
+        self.reorder_every = max(reorder_every, 1)
+        self.evaluations = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._order = tuple(self._sorted(lambda s: s.cost))
+
+    @property
+    def order(self) -> List[str]:
+        return [stage.name for stage in self._order]
+
+    def _sorted(self, key: Callable[[Stage], float]) -> List[Stage]:
+        order: List[Stage] = []
+        part: List[Stage] = []
+        for stage in self.stages:
+            if stage.barrier:
+                order += sorted(part, key=key)
+                order.append(stage)
+                part = []
+            else:
+                part.append(stage)
+        return order + sorted(part, key=key)
+
+    def reorder(self) -> None:
+        """Re-sort by observed cost per block (declared cost when not adaptive)."""
+        self._order = tuple(self._sorted(Stage.expected_cost if self.adaptive else (lambda s: s.cost)))
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Created on first use: a pipeline built before the proxy workers fork has no threads to lose
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.executor_workers,
+                                                        thread_name_prefix="pyshield-rules")
+        return self._executor
+
+    async def evaluate(self, ctx: RuleContext) -> Optional[RuleVerdict]:
+        """The first verdict blocking `ctx`, or None if every stage lets it through."""
+        verdict = None
+        for stage in self._order:
+            start = time.perf_counter()
+            try:
+                if stage.is_async:
+                    verdict = await stage.check(ctx)
+                elif stage.blocking:
+                    verdict = await asyncio.get_running_loop().run_in_executor(self._pool(), stage.check, ctx)
+                else:
+                    verdict = stage.check(ctx)
+            except Exception as e:
+                # A failing check lets the request through, as the middleware always did
+                stage.record(time.perf_counter() - start, False, error=True)
+                self.logger.error("Rule stage %s failed: %s", stage.name, e)
+                verdict = None
+                continue
+            stage.record(time.perf_counter() - start, verdict is not None)
+            if verdict is not None:
+                break
+        self.evaluations += 1
+        if self.adaptive and self.evaluations % self.reorder_every == 0:
+            self.reorder()
+        if verdict is not None:
+            self.notify(verdict)
+        return verdict
+
+    def notify(self, verdict: RuleVerdict) -> None:
+        """Run the reporting hook of `verdict` on the thread pool, also for verdicts reached outside `evaluate`."""
+        if verdict.notify is not None:
+            self._pool().submit(self._notify, verdict)
+
+    def _notify(self, verdict: RuleVerdict) -> None:
+        try:
+            verdict.notify()
+        except Exception as e:
+            self.logger.error("Reporting %s verdict failed: %s", verdict.stage, e)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "order": self.order,
+            "adaptive": self.adaptive,
+            "evaluations": self.evaluations,
+            "executor_workers": self.executor_workers,
+            "stages": [stage.snapshot() for stage in self.stages],
+        }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def build_rule_pipeline(cfg: RulesConfig, pyshield_instance) -> RulePipeline:
+    """Stages for the modules attached to `pyshield_instance`, in the order the proxy used to run them."""
+    stages: List[Stage] = []
+    ddos = getattr(pyshield_instance, 'ddos_protector', None)
+    bans = getattr(pyshield_instance, 'ban_registry', None)
+    if bans is None and ddos is not None:
+        bans = ddos.bans
+    url_blocker = getattr(pyshield_instance, 'url_blocker', None)
+    reputation = getattr(pyshield_instance, 'reputation', None)
+    geo_blocker = getattr(pyshield_instance, 'geo_blocker', None)
+
+    def report(method: str, *args: Any) -> Optional[Callable[[], None]]:
+        hook = getattr(pyshield_instance, method, None)
+        return (lambda: hook(*args)) if hook is not None else None
+
+    if bans is not None:
+        def banned(ctx: RuleContext) -> Optional[RuleVerdict]:
+            # DDoS and IDS share one registry; the ban was reported when it was applied
+            ban = bans.get(ctx.client_ip)
+            if ban is None:
+                return None
+            return RuleVerdict("ban", 429 if ban.source == "ddos" else 403, f"IP banned ({ban.source}: {ban.reason})")
+
+        stages.append(Stage("ban", banned, cost=1.0))
+
+    if ddos is not None:
+        def rate_verdict(ctx: RuleContext, verdict) -> Optional[RuleVerdict]:
+            if verdict is None:
+                return None
+            if verdict.dimension == "ban":
+                return RuleVerdict("rate_limit", 429, "IP temporarily banned")
+            return RuleVerdict("rate_limit", 429,
+                               f"Rate limit exceeded ({verdict.dimension}): {verdict.count} requests",
+                               report("on_ddos_block", ctx.client_ip, verdict.count) if verdict.banned else None)
+
+        if ddos.has_async_backend:
+            async def rate_limit(ctx: RuleContext) -> Optional[RuleVerdict]:
+                if not ddos.cfg.enabled:
+                    return None
+                return rate_verdict(ctx, await ddos.evaluate_async(ctx.client_ip, path=ctx.route, peer=ctx.peer))
+        else:
+            def rate_limit(ctx: RuleContext) -> Optional[RuleVerdict]:
+                if not ddos.cfg.enabled:
+                    return None
+                return rate_verdict(ctx, ddos.evaluate(ctx.client_ip, path=ctx.route, peer=ctx.peer))
+
+        stages.append(Stage("rate_limit", rate_limit, cost=8.0, blocking=ddos.blocking, barrier=True))
+
+    if url_blocker is not None:
+        def malicious_host(ctx: RuleContext) -> Optional[RuleVerdict]:
+            if not url_blocker.cfg.enabled or not url_blocker.is_malicious_host(ctx.host):
+                return None
+            return RuleVerdict("malicious_host", 403, "Malicious URL blocked", report("on_url_block", ctx.url))
+
+        def path_rule(ctx: RuleContext) -> Optional[RuleVerdict]:
+            if not url_blocker.cfg.enabled:
+                return None
+            if ctx.path is not None:
+                rule = url_blocker.match_path(ctx.path, ctx.query)
+            else:
+                rule = url_blocker.match_url(ctx.url)
+            if rule is None:
+                return None
+            return RuleVerdict("path_rule", 403, f"Blocked by path rule: {rule}", report("on_url_block", ctx.url))
+
+        stages.append(Stage("malicious_host", malicious_host, cost=2.0))
+        stages.append(Stage("path_rule", path_rule, cost=4.0))
+
+    if reputation is not None:
+        async def host_reputation(ctx: RuleContext) -> Optional[RuleVerdict]:
+            # Only hosts the proxy is about to contact are worth a lookup
+            if not ctx.proxied or not await reputation.check(ctx.host):
+                return None
+            return RuleVerdict("reputation", 403, "Host flagged by reputation service",
+                               report("on_url_block", ctx.url))
+
+        stages.append(Stage("reputation", host_reputation, cost=6.0))
+
+    if geo_blocker is not None:
+        def geo(ctx: RuleContext) -> Optional[RuleVerdict]:
+            if not geo_blocker.is_blocked(ctx.client_ip):
+                return None
+            return RuleVerdict("geo", 403, "Geographic location blocked")
+
+        stages.append(Stage("geo", geo, cost=50.0 if geo_blocker.blocking else 1.0, blocking=geo_blocker.blocking))
+
+    return RulePipeline(stages, executor_workers=cfg.executor_workers, adaptive=cfg.adaptive_order,
+                        reorder_every=cfg.reorder_every)
+
+
+def rule_pipeline_for(pyshield_instance, cfg: RulesConfig) -> RulePipeline:
+    """The pipeline shared by everything holding `pyshield_instance`, built on first use."""
+    pipeline = getattr(pyshield_instance, 'rule_pipeline', None)
+    if pipeline is None:
+        pipeline = build_rule_pipeline(cfg, pyshield_instance)
+        pyshield_instance.rule_pipeline = pipeline
+    return pipeline
@@ -0,0 +1,428 @@
+"""
+Firewall state shared by forked proxy workers.
+
+`DeadlineTable` maps string keys to a deadline (epoch seconds) in one
+`multiprocessing.shared_memory` block. Like StripedLock it is split into
+segments: writers take their segment's lock, readers take none and retry if
+the segment's sequence number moved while they probed (a bounded number of
+times, then they wait briefly for the lock). An entry whose
+deadline has passed carries no information: lookups ignore it, inserts
+reclaim its slot and `sweep` drops it.
+
+- `SharedBanTable`: ban key -> until, with the key text stored so the
+  creating process can mirror bans issued by its workers.
+- `SharedGCRALimiter`: client IP -> GCRA theoretical arrival time, the same
+  algorithm as GCRARateLimiter with its one float per key.
+
+The tables are handed to workers by fork (the locks and mappings are
+inherited); only the creating process (`owner`) sweeps and unlinks them.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import multiprocessing as mp
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from .ipnet import bit_width, parse_ip, parse_prefix, prefix_key
+
+try:
+    from multiprocessing import shared_memory
+except Exception:  # pragma: no cover
+    shared_memory = None  # type: ignore
+
+R = TypeVar("R")
+
+# Response cache counters each proxy worker publishes; summed across workers for the dashboard
+CACHE_COUNTERS = ("lookups", "hits", "misses", "revalidated", "bytes_saved", "entries")
+
+# Lock-free read attempts before a reader falls back to the segment lock, and how long it waits for that
+READ_SPINS = 1000
+READ_LOCK_TIMEOUT = 0.05
+
+# Longest ban key: a full IPv6 prefix such as 'ffff:...:ffff/128' is 43 characters
+BAN_KEY_SIZE = 48
+
+
+def _hash(key: str) -> int:
+    # Stable across processes, unlike hash(); 0 marks an empty slot
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+
+class DeadlineTable:
+    """
+    Fixed-capacity key -> deadline hash table in shared memory.
+
+    Segments use linear probing with backward-shift deletion, so there are
+    no tombstones and a miss stops at the first empty slot. With `key_size`
+    0 only the 64-bit key hashes are stored; otherwise keys are kept too
+    (truncated to `key_size` bytes) and can be listed with `items`.
+
+    The segment locks are multiprocessing Locks, which are not robust: a
+    process killed inside a write (SIGKILL, the OOM killer) leaves its
+    segment locked and its sequence number odd for good. Readers give up
+    after a bounded wait and report such a segment's keys as absent;
+    writers to it block.
+    """
+
+    def __init__(self, slots: int, *, key_size: int = 0, segments: int = 64, extra: int = 0) -> None:
+        if shared_memory is None:
+            raise RuntimeError("multiprocessing.shared_memory is not available")
+        # Powers of two, so segment and home slot are masks of the key hash
+        self.segments = 1 << (max(segments, 1) - 1).bit_length()
+        self._seg_bits = self.segments.bit_length() - 1
+        self.per_segment = 1 << (max(slots // self.segments, 8) - 1).bit_length()
+        self.slots = self.per_segment * self.segments
+        self.key_size = (key_size + 7) & ~7
+        n, s = self.slots, self.segments
+        # seq, used and overflows per segment | hashes | deadlines | keys | extra
+        size = 24 * s + 16 * n + self.key_size * n + extra
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self.owner = True
+        self._locks = [mp.Lock() for _ in range(s)]
+        # Per process: segment -> odd sequence number a reader already timed out on
+        self._stuck: Dict[int, int] = {}
+        buf = self._shm.buf
+        self._seq = buf[0:8 * s].cast("Q")
+        self._used = buf[8 * s:16 * s].cast("Q")
+        self._overflows = buf[16 * s:24 * s].cast("Q")
+        off = 24 * s
+        self._hashes = buf[off:off + 8 * n].cast("Q")
+        off += 8 * n
+        self._values = buf[off:off + 8 * n].cast("d")
+        off += 8 * n
+        self._keys = buf[off:off + self.key_size * n]
+        off += self.key_size * n
+        self.extra = buf[off:off + extra]
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def _key_bytes(self, key: str) -> bytes:
+        if not self.key_size:
+            return b""
+        return key.encode()[:self.key_size].ljust(self.key_size, b"\0")
+
+    def _locate(self, h: int) -> Tuple[int, int, int]:
+        """(segment, first slot of the segment, home offset within it)"""
+        seg = h & (self.segments - 1)
+        return seg, seg * self.per_segment, (h >> self._seg_bits) & (self.per_segment - 1)
+
+    def _probe(self, h: int, kb: bytes, base: int, home: int) -> int:
+        hashes = self._hashes
+        mask = self.per_segment - 1
+        ks = self.key_size
+        i = home
+        for _ in range(self.per_segment):
+            slot = base + i
+            sh = hashes[slot]
+            if sh == 0:
+                return -1
+            if sh == h and (not ks or self._keys[slot * ks:slot * ks + ks] == kb):
+                return slot
+            i = (i + 1) & mask
+        return -1
+
+    def _write(self, slot: int, h: int, kb: bytes, value: float) -> None:
+        if self.key_size:
+            self._keys[slot * self.key_size:(slot + 1) * self.key_size] = kb
+        self._values[slot] = value
+        self._hashes[slot] = h
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[float]:
+        """Deadline of `key`, or None if absent or already passed. Takes no lock unless a write is stuck."""
+        t = now if now is not None else time.time()
+        h = _hash(key)
+        kb = self._key_bytes(key)
+        seg, base, home = self._locate(h)
+        seq = self._seq
+        for _ in range(READ_SPINS):
+            before = seq[seg]
+            if before & 1:
+                continue  # a writer is inside this segment
+            slot = self._probe(h, kb, base, home)
+            value = self._values[slot] if slot >= 0 else None
+            if seq[seg] == before:
+                break
+        else:
+            value = self._get_locked(h, kb, seg, base, home)
+        if value is None or value <= t:
+            return None
+        return value
+
+    def _get_locked(self, h: int, kb: bytes, seg: int, base: int, home: int) -> Optional[float]:
+        """Slow path of `get` for a segment whose writer is slow or died mid-write: a miss if the lock stays taken."""
+        before = self._seq[seg]
+        if self._stuck.get(seg) == before:
+            return None  # already waited on this very write; do not stall every lookup again
+        lock = self._locks[seg]
+        if not lock.acquire(timeout=READ_LOCK_TIMEOUT):
+            if before & 1 and self._seq[seg] == before:
+                self._stuck[seg] = before
+            return None
+        try:
+            self._stuck.pop(seg, None)
+            slot = self._probe(h, kb, base, home)
+            return self._values[slot] if slot >= 0 else None
+        finally:
+            lock.release()
+
+    def update(self, key: str, fn: Callable[[Optional[float]], Tuple[Optional[float], R]],
+               now: Optional[float] = None) -> R:
+        """
+        Atomically apply `fn` to the current deadline of `key` (None if absent
+        or passed). `fn` returns (new deadline or None to leave it, result);
+        `update` returns the result. If the segment is full of live entries
+        the new deadline is dropped and counted in `overflows`.
+        """
+        t = now if now is not None else time.time()
+        h = _hash(key)
+        kb = self._key_bytes(key)
+        seg, base, home = self._locate(h)
+        with self._locks[seg]:
+            slot = self._probe(h, kb, base, home)
+            current = self._values[slot] if slot >= 0 else None
+            if current is not None and current <= t:
+                current = None
+            value, result = fn(current)
+            if value is None:
+                return result
+            if slot < 0:
+                slot = self._free_slot(base, home, t)
+            if slot < 0:
+                self._overflows[seg] += 1
+                return result
+            self._seq[seg] += 1
+            if self._hashes[slot] == 0:
+                self._used[seg] += 1
+            self._write(slot, h, kb, value)
+            self._seq[seg] += 1
+        return result
+
+    def _free_slot(self, base: int, home: int, t: float) -> int:
+        # An expired entry can be overwritten in place: its slot stays occupied, so no probe chain breaks
+        mask = self.per_segment - 1
+        i = home
+        for _ in range(self.per_segment):
+            slot = base + i
+            if self._hashes[slot] == 0 or self._values[slot] <= t:
+                return slot
+            i = (i + 1) & mask
+        return -1
+
+    def delete(self, key: str) -> bool:
+        h = _hash(key)
+        seg, base, home = self._locate(h)
+        with self._locks[seg]:
+            slot = self._probe(h, self._key_bytes(key), base, home)
+            if slot < 0:
+                return False
+            self._seq[seg] += 1
+            self._remove(base, slot - base)
+            self._used[seg] -= 1
+            self._seq[seg] += 1
+        return True
+
+    def _remove(self, base: int, i: int) -> None:
+        """Backward-shift deletion of segment offset `i`. Call under the segment lock."""
+        hashes, values, ks = self._hashes, self._values, self.key_size
+        mask = self.per_segment - 1
+        j = i
+        while True:
+            j = (j + 1) & mask
+            h = hashes[base + j]
+            if h == 0:
+                break
+            k = (h >> self._seg_bits) & mask
+            # The entry at j may only move back to i if i lies on its probe path from k
+            if (i <= j and i < k <= j) or (i > j and (k > i or k <= j)):
+                continue
+            values[base + i] = values[base + j]
+            hashes[base + i] = h
+            if ks:
+                self._keys[(base + i) * ks:(base + i + 1) * ks] = self._keys[(base + j) * ks:(base + j + 1) * ks]
+            i = j
+        hashes[base + i] = 0
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop entries whose deadline has passed. Returns entries removed."""
+        t = now if now is not None else time.time()
+        removed = 0
+        per = self.per_segment
+        for seg in range(self.segments):
+            base = seg * per
+            if not self._used[seg]:
+                continue
+            with self._locks[seg]:
+                i = 0
+                self._seq[seg] += 1
+                while i < per:
+                    slot = base + i
+                    if self._hashes[slot] and self._values[slot] <= t:
+                        # The shift may pull a later entry into slot i: look at it again
+                        self._remove(base, i)
+                        self._used[seg] -= 1
+                        removed += 1
+                        continue
+                    i += 1
+                self._seq[seg] += 1
+        return removed
+
+    def items(self, now: Optional[float] = None) -> Iterator[Tuple[str, float]]:
+        """Live (key, deadline) pairs; requires stored keys."""
+        t = now if now is not None else time.time()
+        ks = self.key_size
+        per = self.per_segment
+        for seg in range(self.segments):
+            base = seg * per
+            with self._locks[seg]:
+                found = [
+                    (bytes(self._keys[slot * ks:(slot + 1) * ks]).rstrip(b"\0").decode(), self._values[slot])
+                    for slot in range(base, base + per)
+                    if self._hashes[slot] and self._values[slot] > t
+                ]
+            yield from found
+
+    def stats(self) -> Dict[str, int]:
+        return {"slots": self.slots, "used": sum(self._used), "overflows": sum(self._overflows)}
+
+    def __len__(self) -> int:
+        return sum(self._used)
+
+    def close(self) -> None:
+        """Unmap the block; the owner also removes it."""
+        for view in (self._seq, self._used, self._overflows, self._hashes, self._values, self._keys, self.extra):
+            view.release()
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+class SharedBanTable(DeadlineTable):
+    """
+    Ban key -> until. Plain addresses are one probe; prefix bans also set a
+    flag for their (version, length), and while any is set a lookup probes
+    one key per flagged length, like BanRegistry's local prefix index.
+    """
+
+    # One byte per (version, prefix length): v4 lengths 0..32, then v6 lengths 0..128
+    _V6_FLAGS = 33
+
+    def __init__(self, slots: int, *, segments: int = 64) -> None:
+        super().__init__(slots, key_size=BAN_KEY_SIZE, segments=segments, extra=self._V6_FLAGS + 129 + 1)
+        self._flags = self.extra
+
+    def ban(self, key: str, until: float, now: Optional[float] = None) -> None:
+        """Record `key` until `until`; a later deadline already stored is kept."""
+        parsed = parse_prefix(key)
+        if parsed is not None:
+            version, _, length = parsed
+            self._flags[(0 if version == 4 else self._V6_FLAGS) + length] = 1
+            self._flags[-1] = 1
+        self.update(key, lambda current: (until if current is None or current < until else None, None), now=now)
+
+    def unban(self, key: str) -> bool:
+        return self.delete(key)
+
+    def lookup(self, key: str, now: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        """(ban key, until) of the ban covering `key` (the key itself or a banned prefix), if any."""
+        until = self.get(key, now=now)
+        if until is not None:
+            return key, until
+        if not self._flags[-1]:
+            return None
+        parsed = parse_ip(key)
+        if parsed is None:
+            return None
+        version, value = parsed
+        offset = 0 if version == 4 else self._V6_FLAGS
+        for length in range(bit_width(version) + 1):
+            if self._flags[offset + length]:
+                banned = prefix_key(version, value, length)
+                until = self.get(banned, now=now)
+                if until is not None:
+                    return banned, until
+        return None
+
+
+class SharedGCRALimiter:
+    """GCRARateLimiter over a DeadlineTable: every process that holds the table draws on the same budget."""
+
+    def __init__(self, table: DeadlineTable, *, limit: int, window_seconds: int) -> None:
+        self.table = table
+        self.limit = limit
+        self.window = float(window_seconds)
+        self.interval = self.window / max(limit, 1)
+
+    def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, int]:
+        t = now if now is not None else time.time()
+
+        def step(tat: Optional[float]) -> Tuple[Optional[float], Tuple[bool, int]]:
+            new_tat = (tat if tat is not None and tat > t else t) + self.interval
+            count = math.ceil((new_tat - t) / self.interval - 1e-9)
+            if new_tat - t > self.window + 1e-9:
+                return None, (False, count)
+            return new_tat, (True, count)
+
+        return self.table.update(key, step, now=t)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drained keys are reclaimed on insert anyway; only the owner compacts the table."""
+        return self.table.sweep(now=now) if self.table.owner else 0
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+
+class SharedState:
+    """Everything a proxy worker pool shares. Create it in the parent before forking."""
+
+    def __init__(self, *, ban_slots: int, counter_slots: int, workers: int) -> None:
+        self.bans = SharedBanTable(ban_slots)
+        self.counters = DeadlineTable(counter_slots)
+        # Per worker: requests served, requests blocked (each worker writes only its own pair)
+        self.worker_counters = mp.RawArray("Q", max(workers, 1) * 2)
+        # Per worker: its response cache's CACHE_COUNTERS, same single-writer layout
+        self.worker_cache = mp.RawArray("Q", max(workers, 1) * len(CACHE_COUNTERS))
+
+    @property
+    def owner(self) -> bool:
+        return self.bans.owner
+
+    def detach(self) -> None:
+        """Called in a forked worker: leave sweeping and unlinking to the parent."""
+        self.bans.owner = False
+        self.counters.owner = False
+
+    def publish_worker(self, index: int, requests: int, blocked: int) -> None:
+        self.worker_counters[2 * index] = requests
+        self.worker_counters[2 * index + 1] = blocked
+
+    def worker_totals(self) -> List[Tuple[int, int]]:
+        counters = self.worker_counters
+        return [(counters[i], counters[i + 1]) for i in range(0, len(counters), 2)]
+
+    def publish_worker_cache(self, index: int, stats: Dict[str, int]) -> None:
+        base = index * len(CACHE_COUNTERS)
+        for i, name in enumerate(CACHE_COUNTERS):
+            self.worker_cache[base + i] = stats.get(name, 0)
+
+    def cache_totals(self) -> Dict[str, Any]:
+        """CACHE_COUNTERS summed over all workers, with the hit ratio the single-process cache reports."""
+        width = len(CACHE_COUNTERS)
+        counters = self.worker_cache
+        totals = {name: sum(counters[i::width]) for i, name in enumerate(CACHE_COUNTERS)}
+        lookups = totals["lookups"]
+        served = totals["hits"] + totals["revalidated"]
+        totals["hit_ratio"] = round(served / lookups, 4) if lookups else 0.0
+        return totals
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"bans": self.bans.stats(), "counters": self.counters.stats()}
+
+    def close(self) -> None:
+        self.bans.close()
+        self.counters.close()
@@ -0,0 +1,139 @@
+"""
+Server name (SNI) and ALPN from a TLS ClientHello, without terminating TLS.
+
+A CONNECT tunnel only names `host:port`; the hostname the client actually
+wants is in the cleartext ClientHello it sends first. `read_client_hello`
+reads just the handshake records holding it off the client stream and
+returns those bytes so the tunnel relays them unchanged, and
+`parse_client_hello` walks the message with plain offset arithmetic (a few
+microseconds; nothing is decrypted or validated beyond what is needed).
+
+With Encrypted Client Hello the server name found here is the outer,
+public one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+RECORD_HANDSHAKE = 0x16
+HANDSHAKE_CLIENT_HELLO = 0x01
+EXT_SERVER_NAME = 0x0000
+EXT_ALPN = 0x0010
+SNI_HOST_NAME = 0x00
+
+# ALPN protocol IDs counted by name in tunnel stats; anything else a client offers is counted as ALPN_OTHER
+KNOWN_ALPN = frozenset({"h2", "http/1.1", "http/1.0", "h3", "h2c", "spdy/3.1", "acme-tls/1",
+                        "imap", "pop3", "managesieve", "stun.turn", "webrtc", "xmpp-client", "dot", "ntske/1"})
+ALPN_OTHER = "other"
+
+# A ClientHello is at most a few KiB (post-quantum key shares included); stop reading past this
+MAX_HELLO_BYTES = 64 * 1024
+
+# Fatal access_denied alert: clients show a TLS error rather than a reset connection
+ACCESS_DENIED_ALERT = bytes((0x15, 0x03, 0x03, 0x00, 0x02, 0x02, 0x31))
+
+
+class MalformedHello(ValueError):
+    """The bytes are TLS handshake records but not a parseable ClientHello."""
+
+
+@dataclass
+class ClientHello:
+    server_name: Optional[str] = None
+    alpn: List[str] = field(default_factory=list)
+
+
+def _u16(data: bytes, pos: int) -> int:
+    return (data[pos] << 8) | data[pos + 1]
+
+
+def parse_client_hello(message: bytes) -> ClientHello:
+    """Parse a ClientHello handshake message body (after the 4-byte handshake header)."""
+    try:
+        pos = 2 + 32  # legacy_version, random
+        pos += 1 + message[pos]  # legacy_session_id
+        pos += 2 + _u16(message, pos)  # cipher_suites
+        pos += 1 + message[pos]  # legacy_compression_methods
+        hello = ClientHello()
+        if pos == len(message):
+            return hello  # no extensions (SSLv3-era clients)
+        end = pos + 2 + _u16(message, pos)
+        pos += 2
+        if end > len(message):
+            raise MalformedHello("extensions overrun the message")
+        while pos + 4 <= end:
+            ext_type = _u16(message, pos)
+            ext_end = pos + 4 + _u16(message, pos + 2)
+            pos += 4
+            if ext_end > end:
+                raise MalformedHello("extension overruns the extension block")
+            if ext_type == EXT_SERVER_NAME:
+                hello.server_name = _server_name(message, pos + 2, min(pos + 2 + _u16(message, pos), ext_end))
+            elif ext_type == EXT_ALPN:
+                list_end = min(pos + 2 + _u16(message, pos), ext_end)
+                pos += 2
+                while pos < list_end:
+                    size = message[pos]
+                    hello.alpn.append(message[pos + 1:pos + 1 + size].decode("latin-1"))
+                    pos += 1 + size
+            pos = ext_end
+        return hello
+    except IndexError as e:
+        raise MalformedHello("truncated ClientHello") from e
+
+
+def _server_name(message: bytes, pos: int, end: int) -> Optional[str]:
+    while pos + 3 <= end:
+        name_type = message[pos]
+        size = _u16(message, pos + 1)
+        pos += 3
+        if name_type == SNI_HOST_NAME:
+            name = message[pos:pos + size].decode("ascii", "replace").lower().rstrip(".")
+            return name or None
+        pos += size
+    return None
+
+
+async def read_client_hello(reader: asyncio.StreamReader, timeout: float) -> Tuple[bytes, Optional[ClientHello]]:
+    """
+    Read the TLS records carrying the client's first handshake message.
+
+    Returns the bytes taken off `reader` (to be relayed upstream first) and
+    the parsed ClientHello, or None when the client does not speak TLS
+    first, sends a malformed hello, or is silent for `timeout` seconds
+    (server-speaks-first protocols). Bytes past the hello stay buffered.
+    """
+    consumed = bytearray()
+    hello: List[Optional[ClientHello]] = [None]
+
+    async def read() -> None:
+        message = bytearray()
+        needed = None
+        while needed is None or len(message) < needed:
+            header = await reader.readexactly(5)
+            consumed.extend(header)
+            if header[0] != RECORD_HANDSHAKE:
+                return
+            record = await reader.readexactly(_u16(header, 3))
+            consumed.extend(record)
+            message.extend(record)
+            if needed is None and len(message) >= 4:
+                if message[0] != HANDSHAKE_CLIENT_HELLO:
+                    return
+                needed = 4 + int.from_bytes(message[1:4], "big")
+            if len(consumed) > MAX_HELLO_BYTES:
+                return
+        hello[0] = parse_client_hello(bytes(message[4:needed]))
+
+    try:
+        await asyncio.wait_for(read(), timeout)
+    except asyncio.IncompleteReadError as e:
+        # The client half-closed mid-record; what it did send still goes upstream
+        consumed.extend(e.partial)
+    except (asyncio.TimeoutError, MalformedHello):
+        # A timed-out read leaves its partial bytes in the reader for the relay
+        pass
+    return bytes(consumed), hello[0]
@@ -0,0 +1,387 @@
+"""
+Byte relays for CONNECT tunnels.
+
+`relay_tunnel` moves an accepted client connection (still owned by the
+StreamReader/StreamWriter pair asyncio.start_server handed out) and a
+connected upstream socket off the streams API:
+
+- "protocol": both sockets are driven by a BufferedProtocol that receives
+  straight into a preallocated buffer and writes it to the other side, with
+  pause/resume of the reading side whenever the writing side's transport
+  buffer passes the socket's send buffer size.
+- "splice" (Linux): bytes move socket -> pipe -> socket with os.splice and
+  never enter user space; the event loop only sees readiness callbacks.
+
+`EarlyDownstream` relays upstream -> client while the proxy is still
+waiting for the client's first bytes (the TLS ClientHello), so protocols
+where the server speaks first are not held up by that wait.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+from typing import Dict, List, Optional
+
+from .http1 import reader_buffer
+
+try:
+    import fcntl
+except Exception:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+SPLICE_AVAILABLE = hasattr(os, "splice") and hasattr(os, "pipe2")
+
+MIN_BUFFER = 64 * 1024
+MAX_BUFFER = 4 * 1024 * 1024
+
+
+def _sock_buffer(sock, option: int) -> int:
+    """Kernel buffer size of `sock` (SO_RCVBUF / SO_SNDBUF), clamped to a sane relay chunk."""
+    try:
+        size = sock.getsockopt(socket.SOL_SOCKET, option)
+    except OSError:
+        size = MIN_BUFFER
+    return max(MIN_BUFFER, min(size, MAX_BUFFER))
+
+
+class TunnelStats:
+    __slots__ = ("upstream_bytes", "downstream_bytes", "mode")
+
+    def __init__(self, mode: str) -> None:
+        self.mode = mode
+        self.upstream_bytes = 0  # client -> server
+        self.downstream_bytes = 0  # server -> client
+
+
+class _RelayEnd(asyncio.BufferedProtocol):
+    """One socket of a tunnel; what it receives is written to `peer`'s transport."""
+
+    def __init__(self, tunnel: "_ProtocolTunnel", size: int) -> None:
+        self.tunnel = tunnel
+        self.transport: Optional[asyncio.Transport] = None
+        self.peer: Optional["_RelayEnd"] = None
+        self.received = 0
+        self.eof = False
+        self.closed = False
+        self.chained: Optional[asyncio.BaseProtocol] = None
+        self._size = size
+        self._view = memoryview(bytearray(size))
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore[assignment]
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._view
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self.received += nbytes
+        out = self.peer.transport
+        out.write(self._view[:nbytes])
+        if out.get_write_buffer_size():
+            # The transport may hold on to the unsent tail of our view; never overwrite it
+            self._view = memoryview(bytearray(self._size))
+
+    def eof_received(self) -> bool:
+        self.eof = True
+        self.tunnel.end_eof(self)
+        return True  # keep our side writable for the other direction
+
+    def pause_writing(self) -> None:
+        # Our socket is backed up: stop reading from the side that feeds it
+        self.peer.transport.pause_reading()
+
+    def resume_writing(self) -> None:
+        self.peer.transport.resume_reading()
+
+    def connection_lost(self, exc: Optional[BaseException]) -> None:
+        self.closed = True
+        self.tunnel.end_lost(self)
+        if self.chained is not None:
+            self.chained.connection_lost(exc)
+
+
+class _ProtocolTunnel:
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.done = loop.create_future()
+        self.ends: List[_RelayEnd] = []
+
+    def end_eof(self, end: _RelayEnd) -> None:
+        out = end.peer.transport
+        if end.peer.eof or not out.can_write_eof():
+            self.close()
+        else:
+            out.write_eof()  # sent once the buffered data is flushed
+
+    def end_lost(self, end: _RelayEnd) -> None:
+        if not end.peer.closed:
+            end.peer.transport.close()  # flushes what is buffered, then closes
+        elif not self.done.done():
+            self.done.set_result(None)
+
+    def close(self) -> None:
+        for end in self.ends:
+            if end.transport is not None and not end.closed:
+                end.transport.close()
+
+
+class EarlyDownstream:
+    """
+    Upstream -> client relay for the time before `relay_tunnel` takes over.
+
+    Driven by a reader callback that recvs and writes synchronously, so
+    `stop()` never loses bytes in flight: whatever was received is already
+    in the client transport. Reading pauses while that transport holds more
+    than `limit` bytes. An upstream EOF or error just stops the relay; the
+    socket reports it again to whichever relay comes next.
+    """
+
+    def __init__(self, upstream: socket.socket, client_writer: asyncio.StreamWriter,
+                 limit: int = MAX_BUFFER) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.upstream = upstream
+        self.writer = client_writer
+        self.limit = limit
+        self.bytes = 0
+        self._reading = False
+        self._stopped = False
+        self._drain: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.upstream.setblocking(False)
+        self._resume()
+
+    def stop(self) -> int:
+        """Stop relaying; returns the bytes relayed so far."""
+        self._stopped = True
+        self._pause()
+        if self._drain is not None:
+            self._drain.cancel()
+        return self.bytes
+
+    def _resume(self) -> None:
+        if not self._stopped and not self._reading:
+            self.loop.add_reader(self.upstream.fileno(), self._readable)
+            self._reading = True
+
+    def _pause(self) -> None:
+        if self._reading:
+            self.loop.remove_reader(self.upstream.fileno())
+            self._reading = False
+
+    def _readable(self) -> None:
+        try:
+            data = self.upstream.recv(MIN_BUFFER)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.stop()
+            return
+        if not data:
+            self.stop()
+            return
+        self.bytes += len(data)
+        self.writer.write(data)
+        if self.writer.transport.get_write_buffer_size() >= self.limit:
+            self._pause()
+            self._drain = self.loop.create_task(self._wait_drained())
+
+    async def _wait_drained(self) -> None:
+        try:
+            await self.writer.drain()
+        except OSError:
+            self.stop()
+            return
+        self._drain = None
+        self._resume()
+
+
+async def _relay_protocol(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter,
+                          upstream: socket.socket, initial: bytes, stats: TunnelStats) -> None:
+    loop = asyncio.get_running_loop()
+    tunnel = _ProtocolTunnel(loop)
+    client_transport = client_writer.transport
+    client_sock = client_writer.get_extra_info("socket")
+    client = _RelayEnd(tunnel, _sock_buffer(client_sock, socket.SO_RCVBUF))  # client -> upstream
+    server = _RelayEnd(tunnel, _sock_buffer(upstream, socket.SO_RCVBUF))  # upstream -> client
+    client.peer, server.peer = server, client
+    tunnel.ends = [client, server]
+
+    # Nothing may be read from the client until the upstream transport exists
+    client_transport.pause_reading()
+    # The stream protocol still has to learn about the close, or StreamWriter.wait_closed() never returns
+    client.chained = client_transport.get_protocol()
+    client_transport.set_protocol(client)
+    client.transport = client_transport
+    client_transport.set_write_buffer_limits(high=_sock_buffer(client_sock, socket.SO_SNDBUF))
+    server_transport, _ = await loop.create_connection(lambda: server, sock=upstream)
+    server_transport.set_write_buffer_limits(high=_sock_buffer(upstream, socket.SO_SNDBUF))
+
+    if initial:
+        server_transport.write(initial)
+    if client_reader.at_eof():
+        client.eof_received()
+    client_transport.resume_reading()
+    try:
+        await tunnel.done
+    finally:
+        tunnel.close()
+        stats.upstream_bytes = client.received + len(initial)
+        stats.downstream_bytes = server.received
+
+
+class _SpliceDirection:
+    """src fd -> pipe -> dst fd, driven by readiness callbacks on the loop."""
+
+    FLAGS = getattr(os, "SPLICE_F_MOVE", 0) | getattr(os, "SPLICE_F_NONBLOCK", 0)
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, src, dst, size: int, done: asyncio.Future) -> None:
+        self.loop = loop
+        self.src = src.fileno()
+        self.dst = dst.fileno()
+        self.dst_sock = dst
+        self.size = size
+        self.done = done
+        self.bytes = 0
+        self.pending = 0
+        self.eof = False
+        self.finished = False
+        self.rpipe, self.wpipe = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fcntl is not None and hasattr(fcntl, "F_SETPIPE_SZ"):
+            try:
+                fcntl.fcntl(self.wpipe, fcntl.F_SETPIPE_SZ, size)
+            except OSError:
+                pass  # above /proc/sys/fs/pipe-max-size; the default 64 KiB pipe still works
+
+    def start(self) -> None:
+        self.loop.add_reader(self.src, self._readable)
+
+    def _readable(self) -> None:
+        try:
+            n = os.splice(self.src, self.wpipe, self.size, flags=self.FLAGS)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.finish(e)
+            return
+        if n == 0:
+            self.eof = True
+            self.loop.remove_reader(self.src)
+        self.pending += n
+        self._flush()
+
+    def _writable(self) -> None:
+        self.loop.remove_writer(self.dst)
+        self._flush()
+        if not self.pending and not self.eof and not self.finished:
+            self.loop.add_reader(self.src, self._readable)
+
+    def _flush(self) -> None:
+        while self.pending:
+            try:
+                n = os.splice(self.rpipe, self.dst, self.pending, flags=self.FLAGS)
+            except (BlockingIOError, InterruptedError):
+                # Destination is full: stop reading until it drains
+                self.loop.remove_reader(self.src)
+                self.loop.add_writer(self.dst, self._writable)
+                return
+            except OSError as e:
+                self.finish(e)
+                return
+            self.pending -= n
+            self.bytes += n
+        if self.eof:
+            try:
+                self.dst_sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            self.finish(None)
+
+    def finish(self, exc: Optional[BaseException]) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        self.loop.remove_reader(self.src)
+        self.loop.remove_writer(self.dst)
+        for fd in (self.rpipe, self.wpipe):
+            os.close(fd)
+        if not self.done.done():
+            self.done.set_result(exc)
+
+
+async def _relay_splice(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter,
+                        upstream: socket.socket, initial: bytes, stats: TunnelStats) -> None:
+    loop = asyncio.get_running_loop()
+    client_transport = client_writer.transport
+    # The transport must let go of the socket: no reader, nothing left to write
+    client_transport.pause_reading()
+    while client_transport.get_write_buffer_size():
+        await asyncio.sleep(0.001)
+    # The loop refuses readers on a transport's fd, so drive a duplicate of it
+    client_sock = socket.socket(fileno=os.dup(client_writer.get_extra_info("socket").fileno()))
+    client_sock.setblocking(False)
+    upstream.setblocking(False)
+    if initial:
+        await loop.sock_sendall(upstream, initial)
+
+    up_done = loop.create_future()
+    down_done = loop.create_future()
+    up = _SpliceDirection(loop, client_sock, upstream, _sock_buffer(client_sock, socket.SO_RCVBUF), up_done)
+    down = _SpliceDirection(loop, upstream, client_sock, _sock_buffer(upstream, socket.SO_RCVBUF), down_done)
+    try:
+        if client_reader.at_eof():
+            upstream.shutdown(socket.SHUT_WR)
+            up.finish(None)
+        else:
+            up.start()
+        down.start()
+        pending = {up_done, down_done}
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(f.result() is not None for f in finished):
+                break  # a reset on either side ends the tunnel
+    finally:
+        up.finish(None)
+        down.finish(None)
+        client_sock.close()
+        upstream.close()
+        stats.upstream_bytes = up.bytes + len(initial)
+        stats.downstream_bytes = down.bytes
+
+
+async def relay_tunnel(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter,
+                       upstream: socket.socket, *, mode: str = "protocol", initial: bytes = b"") -> TunnelStats:
+    """
+    Relay between a client stream pair and a connected, non-blocking upstream
+    socket until both directions are done. `initial` (client bytes the caller
+    already read, e.g. a peeked ClientHello), then bytes still buffered in
+    `client_reader`, are sent upstream first. `mode` is "protocol" or "splice"
+    (falls back to "protocol" where os.splice is unavailable); check
+    `can_take_over` first. The caller still closes `client_writer`; the
+    upstream socket is closed here.
+    """
+    if mode == "splice" and not SPLICE_AVAILABLE:
+        mode = "protocol"
+    # Anything the client sent right after CONNECT (e.g. an eager TLS ClientHello) is already buffered
+    buffered = reader_buffer(client_reader)
+    if buffered is None:
+        raise RuntimeError("cannot take over a StreamReader whose buffered bytes are not visible")
+    if buffered:
+        initial += bytes(buffered)
+        buffered.clear()
+    stats = TunnelStats(mode)
+    if mode == "splice":
+        await _relay_splice(client_reader, client_writer, upstream, initial, stats)
+    else:
+        await _relay_protocol(client_reader, client_writer, upstream, initial, stats)
+    return stats
+
+
+def can_take_over(client_reader: asyncio.StreamReader) -> bool:
+    """Whether `relay_tunnel` can take the connection off `client_reader` without losing buffered bytes."""
+    return reader_buffer(client_reader) is not None
+
+
+def tunnel_modes() -> Dict[str, bool]:
+    return {"stream": True, "protocol": True, "splice": SPLICE_AVAILABLE}
@@ -0,0 +1,220 @@
+"""
+Keep-alive connection pool for the proxy's plain-HTTP upstreams.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import socket
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from .http1 import reader_buffer
+
+Key = Tuple[str, int]
+# Opens a connected socket to (host, port), e.g. Resolver.connect
+Connector = Callable[[str, int], Awaitable[socket.socket]]
+
+
+class UpstreamConnection:
+    """One upstream socket plus the bookkeeping the pool needs to decide on reuse."""
+
+    __slots__ = ("key", "reader", "writer", "created", "last_used", "requests")
+
+    def __init__(self, key: Key, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.created = self.last_used = time.monotonic()
+        self.requests = 0
+
+    @property
+    def reused(self) -> bool:
+        return self.requests > 0
+
+    def alive(self) -> bool:
+        """
+        Cheap liveness check for an idle connection: the transport is open,
+        the peer has not closed it, and it sent nothing unsolicited (a server
+        may write a 408 before closing an idle connection).
+        """
+        if self.writer.transport.is_closing() or self.reader.at_eof() or self.reader.exception() is not None:
+            return False
+        # Any unread byte belongs to no request of ours; if we cannot tell, do not reuse
+        buffered = reader_buffer(self.reader)
+        return buffered is not None and not buffered
+
+    def close(self) -> None:
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class _HostPool:
+    __slots__ = ("idle", "slots", "users")
+
+    def __init__(self, max_per_host: int) -> None:
+        self.idle: Deque[UpstreamConnection] = deque()
+        # Bounds connections in use at once; idle ones hold no slot
+        self.slots = asyncio.Semaphore(max_per_host)
+        # Callers holding or waiting for a slot; the entry is dropped once unused
+        self.users = 0
+
+
+class UpstreamPool:
+    """
+    Per-(host, port) pool of idle upstream connections for one event loop.
+
+    `acquire` hands out the most recently used live idle connection or opens
+    a new one, waiting while `max_per_host` connections to that upstream are
+    in use. `release` puts a connection back only when the caller knows the
+    last response was fully read and both sides allow persistence; at most
+    `max_idle_per_host` are kept, each for `idle_timeout` seconds. A reaper
+    task closes expired or dead idle connections so unvisited upstreams do
+    not hold sockets.
+    """
+
+    def __init__(self, *, max_per_host: int = 32, max_idle_per_host: int = 32, idle_timeout: float = 30.0,
+                 connect_timeout: float = 10.0, max_requests: int = 1000, connector: Optional[Connector] = None) -> None:
+        self.connector = connector
+        self.max_per_host = max(max_per_host, 1)
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.max_requests = max_requests
+        self._hosts: Dict[Key, _HostPool] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {
+            "opened": 0, "reused": 0, "released": 0, "discarded": 0, "expired": 0, "waits": 0,
+        }
+
+    async def acquire(self, host: str, port: int, *, fresh: bool = False) -> UpstreamConnection:
+        """Connection to (host, port); `fresh` skips idle ones (e.g. to retry after a stale reuse)."""
+        key = (host, port)
+        hp = self._hosts.get(key)
+        if hp is None:
+            hp = self._hosts[key] = _HostPool(self.max_per_host)
+        hp.users += 1
+        try:
+            if hp.slots.locked():
+                self.stats["waits"] += 1
+            await hp.slots.acquire()
+        except BaseException:
+            self._unuse(key, hp)
+            raise
+        try:
+            if not fresh:
+                conn = self._pop_idle(hp)
+                if conn is not None:
+                    self.stats["reused"] += 1
+                    return conn
+            reader, writer = await asyncio.wait_for(self._open(host, port), self.connect_timeout)
+        except BaseException:
+            hp.slots.release()
+            self._unuse(key, hp)
+            raise
+        self.stats["opened"] += 1
+        self._ensure_reaper()
+        return UpstreamConnection(key, reader, writer)
+
+    async def _open(self, host: str, port: int) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if self.connector is None:
+            return await asyncio.open_connection(host, port)
+        sock = await self.connector(host, port)
+        try:
+            return await asyncio.open_connection(sock=sock)
+        except BaseException:
+            sock.close()
+            raise
+
+    def release(self, conn: UpstreamConnection, reusable: bool) -> None:
+        """Return an acquired connection; it is closed unless `reusable` and the pool has room."""
+        hp = self._hosts.get(conn.key)
+        conn.requests += 1
+        conn.last_used = time.monotonic()
+        keep = (reusable and hp is not None and len(hp.idle) < self.max_idle_per_host
+                and conn.requests < self.max_requests and conn.alive())
+        if keep:
+            hp.idle.append(conn)
+            self.stats["released"] += 1
+        else:
+            conn.close()
+            self.stats["discarded"] += 1
+        if hp is not None:
+            hp.slots.release()
+            self._unuse(conn.key, hp)
+
+    def _pop_idle(self, hp: _HostPool) -> Optional[UpstreamConnection]:
+        # Most recently used first: it is the least likely to have been closed by the server
+        deadline = time.monotonic() - self.idle_timeout
+        while hp.idle:
+            conn = hp.idle.pop()
+            if conn.last_used > deadline and conn.alive():
+                return conn
+            conn.close()
+            self.stats["expired"] += 1
+        return None
+
+    def _unuse(self, key: Key, hp: _HostPool) -> None:
+        hp.users -= 1
+        if not hp.users and not hp.idle and self._hosts.get(key) is hp:
+            del self._hosts[key]
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._loop = asyncio.get_running_loop()
+            self._reaper = self._loop.create_task(self._reap_loop())
+
+    async def _reap_loop(self) -> None:
+        interval = max(min(self.idle_timeout / 2, 10.0), 0.5)
+        while self._hosts:
+            await asyncio.sleep(interval)
+            self.reap()
+
+    def reap(self) -> int:
+        """Close idle connections that expired or died; returns how many."""
+        deadline = time.monotonic() - self.idle_timeout
+        closed = 0
+        for key, hp in list(self._hosts.items()):
+            keep = deque(c for c in hp.idle if c.last_used > deadline and c.alive())
+            for conn in hp.idle:
+                if conn not in keep:
+                    conn.close()
+                    closed += 1
+            hp.idle = keep
+            if not hp.users and not hp.idle:
+                del self._hosts[key]
+        self.stats["expired"] += closed
+        return closed
+
+    def snapshot(self) -> Dict[str, int]:
+        out = dict(self.stats)
+        out["hosts"] = len(self._hosts)
+        out["idle"] = sum(len(hp.idle) for hp in self._hosts.values())
+        return out
+
+    def close(self) -> None:
+        """Close every idle connection; safe to call from a thread other than the pool's loop."""
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is not loop:
+                loop.call_soon_threadsafe(self._close_now)
+                return
+        self._close_now()
+
+    def _close_now(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for hp in self._hosts.values():
+            while hp.idle:
+                conn = hp.idle.pop()
+                conn.close()
+        self._hosts.clear()
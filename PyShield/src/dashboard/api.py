@@ -31,10 +31,7 @@ def create_app(pyshield: PyShield, cfg: PyShieldConfig,
     app.add_middleware(
         FirewallMiddleware,
         pyshield=pyshield,
-        ddos=getattr(pyshield, 'ddos_protector', None),
-        url_blocker=getattr(pyshield, 'url_blocker', None),
-        ids=getattr(pyshield, 'intrusion_detector', None),
-        geo_blocker=getattr(pyshield, 'geo_blocker', None)
+        ids=getattr(pyshield, 'intrusion_detector', None)
     )
 
     def auth(credentials: HTTPBasicCredentials = Depends(security)) -> None:
@@ -55,12 +52,7 @@ def create_app(pyshield: PyShield, cfg: PyShieldConfig,
 
     @app.get("/stats")
     def stats(_: None = Depends(auth)) -> Dict[str, Any]:
-        return {
-            "blocked_ips": pyshield.stats.blocked_ips,
-            "blocked_urls": pyshield.stats.blocked_urls,
-            "blocked_ports": sorted(list(pyshield.stats.blocked_ports)),
-            "active_attacks": pyshield.stats.active_attacks,
-        }
+        return pyshield.stats.snapshot()
 
     @app.post("/ports/block")
     def block_ports(body: Dict[str, Iterable[int]], _: None = Depends(auth)) -> Dict[str, Any]:
@@ -80,13 +72,19 @@ def create_app(pyshield: PyShield, cfg: PyShieldConfig,
         port_blocker.unblock_ports(ports)
         return {"status": "ok", "unblocked": ports}
 
+    def _sync_workers() -> Dict[str, Any]:
+        """Proxy workers only see blacklist edits through the index file they reload"""
+        if getattr(pyshield, 'proxy_workers', None) is None:
+            return {}
+        return {"workers_synced": url_blocker.save()}
+
     @app.post("/urls/add")
     def add_urls(body: Dict[str, Iterable[str]], _: None = Depends(auth)) -> Dict[str, Any]:
         if not url_blocker:
             raise HTTPException(400, "URL blocker not configured")
         items = list(body.get("items", []))
         url_blocker.add(items)
-        return {"status": "ok", "added": items}
+        return {"status": "ok", "added": items, **_sync_workers()}
 
     @app.post("/urls/remove")
     def remove_urls(body: Dict[str, Iterable[str]], _: None = Depends(auth)) -> Dict[str, Any]:
@@ -94,7 +92,38 @@ def create_app(pyshield: PyShield, cfg: PyShieldConfig,
             raise HTTPException(400, "URL blocker not configured")
         items = list(body.get("items", []))
         url_blocker.remove(items)
-        return {"status": "ok", "removed": items}
+        return {"status": "ok", "removed": items, **_sync_workers()}
+
+    @app.get("/urls/cache")
+    def url_cache_stats(_: None = Depends(auth)) -> Dict[str, Any]:
+        if not url_blocker:
+            raise HTTPException(400, "URL blocker not configured")
+        return url_blocker.cache_stats()
+
+    @app.get("/reputation")
+    def reputation_stats(_: None = Depends(auth)) -> Dict[str, Any]:
+        reputation = getattr(pyshield, 'reputation', None)
+        return reputation.snapshot() if reputation is not None else {"enabled": False}
+
+    @app.get("/rules")
+    def rule_stats(_: None = Depends(auth)) -> Dict[str, Any]:
+        """Per-stage calls, blocks and latency of the firewall rule pipeline, in current order"""
+        pipeline = getattr(pyshield, 'rule_pipeline', None)
+        return pipeline.snapshot() if pipeline is not None else {"order": [], "stages": []}
+
+    @app.get("/bans")
+    def list_bans(_: None = Depends(auth)) -> Dict[str, Any]:
+        bans = getattr(pyshield, 'ban_registry', None)
+        return {"bans": bans.snapshot() if bans is not None else []}
+
+    @app.post("/bans/remove")
+    def remove_bans(body: Dict[str, Iterable[str]], _: None = Depends(auth)) -> Dict[str, Any]:
+        bans = getattr(pyshield, 'ban_registry', None)
+        if bans is None:
+            raise HTTPException(400, "Ban registry not configured")
+        items = list(body.get("items", []))
+        removed = [ip for ip in items if bans.unban(ip)]
+        return {"status": "ok", "removed": removed}
 
     @app.post("/settings/ddos")
     def update_ddos_settings(body: Dict[str, Any], _: None = Depends(auth)) -> Dict[str, Any]:
@@ -114,6 +143,15 @@ def create_app(pyshield: PyShield, cfg: PyShieldConfig,
     @app.get("/proxy/requests")
     def get_proxy_requests(_: None = Depends(auth)) -> Dict[str, Any]:
         """Get recent proxy requests for dashboard"""
+        workers = getattr(pyshield, 'proxy_workers', None)
+        if workers is not None:
+            # Each worker keeps its own history; the parent's proxy never serves
+            return {
+                "requests": [],
+                "history_available": False,
+                "proxy_enabled": workers.snapshot()["alive"] > 0,
+                "proxy_port": cfg.dashboard.proxy_port
+            }
         if hasattr(pyshield, 'proxy_server') and pyshield.proxy_server:
             return {
                 "requests": pyshield.proxy_server.get_request_history(limit=100),
@@ -129,17 +167,40 @@ def create_app(pyshield: PyShield, cfg: PyShieldConfig,
     @app.get("/proxy/stats")
     def get_proxy_stats(_: None = Depends(auth)) -> Dict[str, Any]:
         """Get proxy statistics"""
+        workers = getattr(pyshield, 'proxy_workers', None)
+        if workers is not None:
+            # Only request and cache counters are shared by the workers; other per-process stats are not
+            pool = workers.snapshot()
+            total, blocked = pool["requests"], pool["blocked"]
+            return {
+                "total_requests": total,
+                "blocked_requests": blocked,
+                "allowed_requests": total - blocked,
+                "block_rate": (blocked / total * 100) if total else 0,
+                "lifetime_requests": total,
+                "lifetime_blocked": blocked,
+                "proxy_running": pool["alive"] > 0,
+                "per_process_stats": False,
+                "upstream_pool": None,
+                "tunnels": None,
+                "resolver": None,
+                "cache": pool["cache"],
+                "admission": None,
+                "workers": pool
+            }
         if hasattr(pyshield, 'proxy_server') and pyshield.proxy_server:
-            history = pyshield.proxy_server.request_history
-            total_requests = len(history)
-            blocked_requests = sum(1 for req in history if req.blocked)
-            
+            proxy_server = pyshield.proxy_server
             return {
-                "total_requests": total_requests,
-                "blocked_requests": blocked_requests,
-                "allowed_requests": total_requests - blocked_requests,
-                "block_rate": (blocked_requests / total_requests * 100) if total_requests > 0 else 0,
-                "proxy_running": pyshield.proxy_server.running
+                **proxy_server.request_history.stats(),
+                "proxy_running": proxy_server.running,
+                "upstream_pool": proxy_server.upstream_pool.snapshot()
+                if proxy_server.upstream_pool is not None else None,
+                "tunnels": {**proxy_server.tunnel_stats, "alpn": dict(proxy_server.alpn_stats)},
+                "resolver": proxy_server.resolver.snapshot(),
+                "cache": proxy_server.cache.snapshot() if proxy_server.cache is not None else None,
+                "admission": proxy_server.admission.snapshot(),
+                "per_process_stats": True,
+                "workers": None
             }
         return {
             "total_requests": 0,
@@ -490,6 +490,23 @@ function updateProxyStats(data) {
     document.getElementById('allowedRequests').textContent = data.allowed_requests || 0;
     document.getElementById('blockedRequests').textContent = data.blocked_requests || 0;
     document.getElementById('blockRate').textContent = (data.block_rate || 0).toFixed(1) + '%';
+
+    const cache = data.cache;
+    // With proxy workers these are the workers' caches summed
+    document.getElementById('cacheHitRatio').textContent = cache ? (cache.hit_ratio * 100).toFixed(1) + '%' : 'off';
+    document.getElementById('cacheBytesSaved').textContent = formatBytes(cache ? cache.bytes_saved : 0);
+    document.getElementById('cacheEntries').textContent = cache ? cache.entries : 0;
+    document.getElementById('cacheRevalidated').textContent = cache ? cache.revalidated : 0;
+}
+
+function formatBytes(bytes) {
+    const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+    let i = 0;
+    while (bytes >= 1024 && i < units.length - 1) {
+        bytes /= 1024;
+        i++;
+    }
+    return (i ? bytes.toFixed(1) : bytes) + ' ' + units[i];
 }
 
 function updateProxyStatus(enabled, port) {
@@ -8,16 +8,20 @@ import threading
 
 import uvicorn
 
+from core.bans import BanRegistry
 from core.config import ConfigLoader
 from core.firewall import PyShield
 from core.logging_system import LoggerFactory
 from modules.ddos_protection import DDoSProtector
 from modules.url_blocking import URLBlocker
+from modules.reputation import create_reputation_service
 from modules.port_blocking import PortBlocker
+from modules.ban_enforcement import KernelBanEnforcer
 from modules.intrusion_detection import IntrusionDetector
 from modules.inspection import PacketInspector
 from dashboard.api import create_app
 from core.proxy_server import HTTPProxyServer
+from core.proxy_workers import create_worker_pool
 
 
 def run_dashboard(pyshield: PyShield, cfg, url_blocker, port_blocker):
@@ -46,10 +50,13 @@ def main(argv=None):
                                      max_mb=cfg.logging.max_mb, backups=cfg.logging.backups)
 
     # Initialize all modules
+    bans = BanRegistry()
     url_blocker = URLBlocker(cfg.url_blocking)
     port_blocker = PortBlocker(cfg.port_blocking)
-    ids = IntrusionDetector(cfg.ids)
-    ddos = DDoSProtector(cfg.ddos)
+    ids = IntrusionDetector(cfg.ids, bans=bans)
+    ddos = DDoSProtector(cfg.ddos, cfg.redis, bans=bans)
+    enforcer = KernelBanEnforcer(cfg.ban_enforcement, bans)
+    reputation = create_reputation_service(cfg.reputation, api_key=cfg.url_blocking.virustotal_api_key)
     
     # Initialize PyShield with references to modules
     pyshield = PyShield(cfg)
@@ -57,6 +64,8 @@ def main(argv=None):
     pyshield.port_blocker = port_blocker
     pyshield.intrusion_detector = ids
     pyshield.ddos_protector = ddos
+    pyshield.ban_registry = bans
+    pyshield.reputation = reputation
     pyshield.geo_blocker = None  # Optional module
     
     # Initialize proxy server
@@ -65,13 +74,23 @@ def main(argv=None):
     
     inspector = PacketInspector(cfg.inspection, on_portscan_detected=lambda kind, info: pyshield.on_attack_detected(kind, info))
 
+    # Proxy worker processes are forked before any thread starts
+    proxy_workers = None
+    if getattr(cfg.dashboard, 'enable_proxy', False):
+        proxy_workers = create_worker_pool(cfg, pyshield)
+        if proxy_workers is not None:
+            proxy_workers.start()
+    pyshield.proxy_workers = proxy_workers
+
     pyshield.start()
     url_blocker.start()
+    ddos.start()
+    enforcer.start()
     inspector.start()
 
     # Start proxy server in background
     proxy_thread = None
-    if hasattr(cfg.dashboard, 'enable_proxy') and cfg.dashboard.enable_proxy:
+    if proxy_workers is None and hasattr(cfg.dashboard, 'enable_proxy') and cfg.dashboard.enable_proxy:
         def run_proxy():
             import asyncio
             loop = asyncio.new_event_loop()
@@ -95,6 +114,8 @@ def main(argv=None):
         logger.info("Shutting down...")
         stop_event.set()
         url_blocker.stop()
+        ddos.stop()
+        enforcer.stop()
         inspector.stop()
         pyshield.stop()
         if proxy_thread:
@@ -103,6 +124,9 @@ def main(argv=None):
                 asyncio.run(proxy_server.stop())
             except:
                 pass
+        if proxy_workers is not None:
+            proxy_workers.stop()
+        proxy_server.rules.close()
         if dash_thread:
             # uvicorn will stop on signal
             pass
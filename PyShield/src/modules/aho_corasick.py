@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class AhoCorasick:
+    """
+    Literal multi-pattern matcher: one pass over the text, whatever the number of patterns.
+
+    Failure links are folded into each state's transition dict (except the
+    root's transitions, which every state shares), so a step is at most two
+    dict probes and never walks a failure chain at match time.
+    """
+
+    __slots__ = ("patterns", "_root", "_delta", "_out")
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns: List[str] = list(dict.fromkeys(p for p in patterns if p))
+        goto: List[Dict[str, int]] = [{}]
+        # Ids of every pattern ending at each state, including via failure links
+        out: List[Tuple[int, ...]] = [()]
+        for pid, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            out[state] = (pid,)
+
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [{} for _ in goto]
+        queue = deque(goto[0].values())
+        for state in queue:
+            delta[state] = goto[state]
+        while queue:
+            parent = queue.popleft()
+            for ch, state in goto[parent].items():
+                queue.append(state)
+                f = fail[parent]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[state] = target if target != state else 0
+                f = fail[state]
+                if f:
+                    # Inherit the failure state's transitions; own edges win
+                    merged = dict(delta[f])
+                    merged.update(goto[state])
+                    delta[state] = merged
+                    if out[f]:
+                        out[state] += out[f]
+                else:
+                    delta[state] = goto[state]
+        self._root = goto[0]
+        self._delta = delta
+        self._out = out
+
+    def search(self, text: str) -> int:
+        """Index in `patterns` of a pattern occurring in `text`, or -1."""
+        root, delta, out = self._root, self._delta, self._out
+        state = 0
+        for ch in text:
+            # Goto targets are never the root (0), so `or` falls back to restarting from the root
+            state = delta[state].get(ch) or root.get(ch, 0)
+            if out[state]:
+                return out[state][0]
+        return -1
+
+    def search_all(self, text: str) -> Set[int]:
+        """Indexes in `patterns` of every pattern occurring in `text`."""
+        root, delta, out = self._root, self._delta, self._out
+        found: Set[int] = set()
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch) or root.get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+    def __len__(self) -> int:
+        return len(self.patterns)
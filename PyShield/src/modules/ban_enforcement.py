@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import ipaddress
+import math
+import platform
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from core.bans import BanEntry, BanRegistry
+from core.config import BanEnforcementConfig
+from core.logging_system import LoggerFactory
+
+# An ipset/nft call that has not returned by then is treated as failed and retried
+COMMAND_TIMEOUT_SECONDS = 10.0
+# Flushes a single key's change may fail on its own before it is dropped
+MAX_ATTEMPTS = 3
+
+
+class KernelBanEnforcer:
+    """
+    Mirrors the BanRegistry into a kernel ipset or nftables set with timeouts.
+
+    Ban changes are queued and written as one `ipset restore` / `nft -f`
+    transaction per flush interval. Natural expiry is left to the kernel set
+    timeout; only early unbans generate deletes. When a transaction fails,
+    each key's change is applied on its own; the ones that still fail are
+    queued again and dropped after MAX_ATTEMPTS flushes.
+
+    Only bans keyed on a socket peer address are mirrored: a key taken from
+    X-Forwarded-For is client-supplied, and dropping its packets would let
+    one forged header cut the host off from any address. Keys overlapping
+    loopback or `never_ban` are never mirrored either.
+    """
+
+    def __init__(self, cfg: BanEnforcementConfig, bans: BanRegistry):
+        self.cfg = cfg
+        self.bans = bans
+        self.logger = LoggerFactory.get_logger("pyshield.enforce")
+        # key -> until (add) or None (delete); last change within a flush interval wins
+        self._pending: Dict[str, Optional[float]] = {}
+        # Keys we believe are present in the kernel set, with their deadline
+        self._installed: Dict[str, float] = {}
+        # key -> consecutive failed attempts to apply its change on its own
+        self._failures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._bg: Optional[threading.Thread] = None
+        self.last_script: str = ""
+        self._never_ban = self._parse_networks(["127.0.0.0/8", "::1/128", *cfg.never_ban])
+
+    @property
+    def set_v4(self) -> str:
+        return self.cfg.set_name
+
+    @property
+    def set_v6(self) -> str:
+        return f"{self.cfg.set_name}6"
+
+    def _run(self, cmd: List[str], script: str = "") -> Tuple[int, str, str]:
+        if self.cfg.dry_run:
+            self.logger.info("[dry-run] %s\n%s", " ".join(cmd), script.rstrip())
+            return 0, "", ""
+        try:
+            proc = subprocess.run(cmd, input=script or None, capture_output=True, text=True,
+                                  timeout=COMMAND_TIMEOUT_SECONDS)
+        except subprocess.TimeoutExpired:
+            return -1, "", f"{cmd[0]} timed out after {COMMAND_TIMEOUT_SECONDS:g}s"
+        except OSError as e:
+            # Missing sudo/ipset/nft or not permitted: a failed run, so the batch is queued again
+            return -1, "", str(e)
+        return proc.returncode, proc.stdout, proc.stderr
+
+    def start(self) -> None:
+        if not self.cfg.enabled or self._bg is not None:
+            return
+        if platform.system() != "Linux" and not self.cfg.dry_run:
+            self.logger.warning("Kernel ban enforcement requires Linux; disabled")
+            return
+        self._setup()
+        # Only now: with nothing flushing, queued changes would pile up for good
+        self.bans.subscribe(self._on_ban_event)
+        for entry in self.bans.active():
+            self._on_ban_event("ban", entry)
+        self._bg = threading.Thread(target=self._flush_loop, daemon=True)
+        self._bg.start()
+        self.logger.info("Kernel ban enforcement started (%s set %s)", self.cfg.backend, self.cfg.set_name)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._bg:
+            self._bg.join(timeout=2)
+            self.flush()
+
+    def _setup(self) -> None:
+        if self.cfg.backend == "nftables":
+            cmd, script = ["sudo", "nft", "-f", "-"], self.build_nft_setup()
+        else:
+            cmd, script = ["sudo", "ipset", "restore", "-exist"], self.build_ipset_setup()
+        rc, out, err = self._run(cmd, script)
+        if rc != 0:
+            self.logger.error("Kernel ban set setup failed: %s %s", out, err)
+        if self.cfg.backend != "nftables":
+            for binary, name in (("iptables", self.set_v4), ("ip6tables", self.set_v6)):
+                rule = ["INPUT", "-m", "set", "--match-set", name, "src", "-j", "DROP"]
+                rc, _, _ = self._run(["sudo", binary, "-C", *rule])
+                if rc != 0 or self.cfg.dry_run:
+                    self._run(["sudo", binary, "-I", *rule])
+
+    def _parse_networks(self, items: List[str]) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+        networks = []
+        for item in items:
+            try:
+                networks.append(ipaddress.ip_network(item, strict=False))
+            except ValueError:
+                self.logger.warning("Ignoring invalid never_ban network %r", item)
+        return networks
+
+    def is_protected(self, key: str) -> bool:
+        """Whether `key` (address or prefix) overlaps loopback or a `never_ban` network."""
+        try:
+            network = ipaddress.ip_network(key, strict=False)
+        except ValueError:
+            return True
+        return any(network.version == allowed.version and network.overlaps(allowed) for allowed in self._never_ban)
+
+    def _on_ban_event(self, event: str, entry: BanEntry) -> None:
+        if self._family(entry.key) is None:
+            return
+        if event == "ban" and (not entry.peer or self.is_protected(entry.key)):
+            self.logger.debug("Not mirroring ban of %s into the kernel set (peer=%s)", entry.key, entry.peer)
+            return
+        with self._lock:
+            if event == "ban":
+                self._pending[entry.key] = entry.until
+            elif event == "unban":
+                self._pending[entry.key] = None
+            elif event == "expire":
+                # The kernel timeout already removed it
+                self._installed.pop(entry.key, None)
+
+    def _flush_loop(self) -> None:
+        interval = max(self.cfg.flush_interval_ms, 10) / 1000.0
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:  # pragma: no cover
+                self.logger.exception("Kernel ban flush failed: %s", e)
+
+    def flush(self, now: Optional[float] = None) -> int:
+        """Apply queued changes in one transaction. Returns the number of set operations."""
+        t = now if now is not None else time.time()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            adds: List[Tuple[str, int]] = []
+            deletes: List[str] = []
+            for key, until in pending.items():
+                if until is None:
+                    if self._installed.get(key, 0) > t:
+                        deletes.append(key)
+                elif until > t:
+                    # Re-adding does not refresh an nftables element timeout; replace it instead
+                    if self._installed.get(key, 0) > t:
+                        deletes.append(key)
+                    adds.append((key, max(1, math.ceil(until - t))))
+            adds = self._drop_covered(adds, pending, t)
+        if not adds and not deletes:
+            return 0
+        rc, out, err = self._apply(adds, deletes)
+        if rc == 0:
+            self._settle(pending, adds)
+            return len(adds) + len(deletes)
+        self.logger.error("Kernel ban flush failed: %s %s", out, err)
+        if rc < 0:
+            # The command did not run at all: nothing to learn from single operations, retry as is
+            self._requeue(pending, count=False)
+            return 0
+        # One bad operation (say, deleting an element nft already merged away) fails the whole
+        # transaction: apply each key's operations alone so the others still reach the kernel
+        applied = 0
+        for key, until in pending.items():
+            key_adds = [(k, seconds) for k, seconds in adds if k == key]
+            key_deletes = [k for k in deletes if k == key]
+            if key_adds or key_deletes:
+                rc, out, err = self._apply(key_adds, key_deletes)
+                if rc != 0:
+                    self._requeue({key: until}, count=rc > 0, detail=f"{out} {err}".strip())
+                    continue
+                applied += len(key_adds) + len(key_deletes)
+            self._settle({key: until}, key_adds)
+        return applied
+
+    def _apply(self, adds: List[Tuple[str, int]], deletes: List[str]) -> Tuple[int, str, str]:
+        if self.cfg.backend == "nftables":
+            cmd, script = ["sudo", "nft", "-f", "-"], self.build_nft_script(adds, deletes)
+        else:
+            cmd, script = ["sudo", "ipset", "restore", "-exist"], self.build_ipset_script(adds, deletes)
+        self.last_script = script
+        return self._run(cmd, script)
+
+    def _settle(self, pending: Dict[str, Optional[float]], adds: List[Tuple[str, int]]) -> None:
+        """Record applied changes in `_installed`."""
+        added = {key for key, _ in adds}
+        with self._lock:
+            for key, until in pending.items():
+                self._failures.pop(key, None)
+                if until is None:
+                    self._installed.pop(key, None)
+                elif key in added:
+                    self._installed[key] = until
+
+    def _requeue(self, pending: Dict[str, Optional[float]], *, count: bool, detail: str = "") -> None:
+        """Queue failed changes again, unless a newer change for the key was queued meanwhile."""
+        with self._lock:
+            for key, until in pending.items():
+                if count:
+                    failures = self._failures.get(key, 0) + 1
+                    if failures >= MAX_ATTEMPTS:
+                        self._failures.pop(key, None)
+                        if until is None:
+                            self._installed.pop(key, None)  # most likely already gone from the set
+                        self.logger.error("Giving up on kernel set %s of %s after %s attempts: %s",
+                                          "delete" if until is None else "add", key, failures, detail)
+                        continue
+                    self._failures[key] = failures
+                self._pending.setdefault(key, until)
+
+    def _drop_covered(self, adds: List[Tuple[str, int]], pending: Dict[str, Optional[float]],
+                      t: float) -> List[Tuple[str, int]]:
+        """Adds minus keys inside a prefix ban (installed or in this batch) that outlasts them."""
+        prefixes = {key: until for key, until in self._installed.items() if "/" in key and until > t}
+        prefixes.update((key, until) for key, until in pending.items() if "/" in key and until is not None)
+        for key in pending:
+            if pending[key] is None:
+                prefixes.pop(key, None)
+        if not prefixes:
+            return adds
+        networks = [(ipaddress.ip_network(key, strict=False), until) for key, until in prefixes.items()]
+        kept = []
+        for key, seconds in adds:
+            network = ipaddress.ip_network(key, strict=False)
+            if any(network != prefix and network.version == prefix.version and network.subnet_of(prefix)
+                   and until >= t + seconds for prefix, until in networks):
+                continue
+            kept.append((key, seconds))
+        return kept
+
+    def _family(self, key: str) -> Optional[int]:
+        try:
+            # Keys are single addresses or network prefixes
+            return ipaddress.ip_network(key, strict=False).version
+        except ValueError:
+            return None
+
+    def build_ipset_setup(self) -> str:
+        return (
+            f"create {self.set_v4} hash:net family inet timeout 0\n"
+            f"create {self.set_v6} hash:net family inet6 timeout 0\n"
+        )
+
+    def build_ipset_script(self, adds: List[Tuple[str, int]], deletes: List[str]) -> str:
+        lines = []
+        for key in deletes:
+            family = self._family(key)
+            if family is not None:
+                name = self.set_v4 if family == 4 else self.set_v6
+                lines.append(f"del {name} {key}")
+        for key, seconds in adds:
+            family = self._family(key)
+            if family is not None:
+                name = self.set_v4 if family == 4 else self.set_v6
+                lines.append(f"add {name} {key} timeout {seconds}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def build_nft_setup(self) -> str:
+        return (
+            "add table inet pyshield\n"
+            # auto-merge: an address inside a banned prefix (or a prefix over banned addresses) is an
+            # overlapping interval, which nft otherwise rejects along with the whole transaction
+            f"add set inet pyshield {self.set_v4} {{ type ipv4_addr; flags interval, timeout; auto-merge; }}\n"
+            f"add set inet pyshield {self.set_v6} {{ type ipv6_addr; flags interval, timeout; auto-merge; }}\n"
+            "add chain inet pyshield input { type filter hook input priority -10; policy accept; }\n"
+            "flush chain inet pyshield input\n"
+            f"add rule inet pyshield input ip saddr @{self.set_v4} drop\n"
+            f"add rule inet pyshield input ip6 saddr @{self.set_v6} drop\n"
+        )
+
+    def build_nft_script(self, adds: List[Tuple[str, int]], deletes: List[str]) -> str:
+        by_set: Dict[Tuple[str, str], List[str]] = {}
+        for key in deletes:
+            family = self._family(key)
+            if family is not None:
+                name = self.set_v4 if family == 4 else self.set_v6
+                by_set.setdefault(("delete", name), []).append(key)
+        for key, seconds in adds:
+            family = self._family(key)
+            if family is not None:
+                name = self.set_v4 if family == 4 else self.set_v6
+                by_set.setdefault(("add", name), []).append(f"{key} timeout {seconds}s")
+        lines = [f"{op} element inet pyshield {name} {{ {', '.join(items)} }}"
+                 for (op, name), items in by_set.items()]
+        return "\n".join(lines) + "\n" if lines else ""
@@ -1,11 +1,23 @@
 from __future__ import annotations
 
+import threading
 import time
-from typing import Dict, Optional
+from dataclasses import dataclass
+from typing import Optional
 
-from core.config import DDoSConfig
-from core.rate_limiter import SlidingWindowRateLimiter, RedisCounter
+from core.bans import BanRegistry
+from core.config import DDoSConfig, RedisConfig
+from core.policy_limiter import PolicyLimiter
+from core.prefix_limiter import PrefixRateLimiter
+from core.rate_limiter import (
+    AsyncRedisSlidingWindow,
+    HybridRedisLimiter,
+    RedisCounter,
+    aioredis,
+    create_rate_limiter,
+)
 from core.logging_system import LoggerFactory
+from core.shared_state import DeadlineTable, SharedGCRALimiter
 
 try:
     import redis  # type: ignore
@@ -13,45 +25,203 @@ except Exception:  # pragma: no cover
     redis = None  # type: ignore
 
 
+@dataclass
+class RateVerdict:
+    # ban (already banned) | ip | network | route | global
+    dimension: str
+    count: int
+    # True when this request triggered a new ban
+    banned: bool = False
+
+
 class DDoSProtector:
-    def __init__(self, cfg: DDoSConfig):
+    def __init__(self, cfg: DDoSConfig, redis_cfg: Optional[RedisConfig] = None,
+                 bans: Optional[BanRegistry] = None):
         self.cfg = cfg
+        self.redis_cfg = redis_cfg or RedisConfig()
         self.logger = LoggerFactory.get_logger("pyshield.ddos")
-        self.banned_until: Dict[str, float] = {}
+        self.bans = bans if bans is not None else BanRegistry()
+        self._stop = threading.Event()
+        self._bg: Optional[threading.Thread] = None
+        # Always available: used directly when Redis is off and as fallback when it is unreachable
+        self._local = create_rate_limiter(self.cfg.algorithm, limit=self.cfg.request_limit,
+                                          window_seconds=self.cfg.window_seconds)
+        self._prefixes = PrefixRateLimiter(v4_limits=self.cfg.prefix_limits_v4, v6_limits=self.cfg.prefix_limits_v6,
+                                           window_seconds=self.cfg.window_seconds,
+                                           max_nodes=self.cfg.prefix_max_nodes)
+        self._async_backend = None
         if self.cfg.use_redis and redis is not None and self._can_use_redis():
             self._backend = RedisCounter(self._redis_client(), window_seconds=self.cfg.window_seconds)
             self._use_redis = True
+            if aioredis is not None:
+                self._async_backend = self._async_redis_backend()
         else:
-            self._backend = SlidingWindowRateLimiter(limit=self.cfg.request_limit, window_seconds=self.cfg.window_seconds)
+            self._backend = self._local
             self._use_redis = False
+        self._policy: Optional[PolicyLimiter] = None
+        if self.cfg.route_policies or self.cfg.global_limit > 0:
+            # With gcra the policy limiter also owns the per-IP budget, so all dimensions are one call and
+            # route costs weigh on it; other algorithms keep counting each request once in the backend
+            include_ip = not self._use_redis and self.cfg.algorithm == "gcra"
+            self._policy = PolicyLimiter(ip_limit=self.cfg.request_limit, window_seconds=self.cfg.window_seconds,
+                                         routes=self.cfg.route_policies, global_limit=self.cfg.global_limit,
+                                         include_ip=include_ip)
+            if not include_ip and not self._use_redis and any(r.cost != 1 for r in self.cfg.route_policies):
+                self.logger.info("Route costs do not apply to the per-IP budget with algorithm %s (gcra only)",
+                                 self.cfg.algorithm)
+
+    def share_counters(self, table: DeadlineTable) -> None:
+        """
+        Keep the per-IP budget in `table`, shared with forked proxy workers,
+        instead of in process memory. The shared counters are GCRA whatever
+        `algorithm` says; route, global and network budgets stay per process.
+        With Redis enabled, Redis stays authoritative and this is its fallback.
+        """
+        if self.cfg.algorithm != "gcra":
+            self.logger.info("Shared rate limit counters use gcra instead of %s", self.cfg.algorithm)
+        self._local = SharedGCRALimiter(table, limit=self.cfg.request_limit, window_seconds=self.cfg.window_seconds)
+        if not self._use_redis:
+            self._backend = self._local
+        if self._policy is not None:
+            # As with Redis: the per-IP budget is counted by the backend, the policy keeps routes and global
+            self._policy.include_ip = False
+
+    @property
+    def has_async_backend(self) -> bool:
+        """True when `evaluate_async` awaits Redis instead of calling `evaluate`."""
+        return self._async_backend is not None
+
+    @property
+    def blocking(self) -> bool:
+        """True when `evaluate` waits on Redis (no async client available)."""
+        return self._use_redis and self._async_backend is None
 
     def _can_use_redis(self) -> bool:
         return True  # Attempt; connection errors handled at runtime
 
     def _redis_client(self):  # pragma: no cover
         assert redis is not None
-        return redis.from_url("redis://localhost:6379/0", decode_responses=True)
+        return redis.from_url(self.redis_cfg.url, decode_responses=True)
 
-    def is_banned(self, ip: str, now: Optional[float] = None) -> bool:
+    def _async_redis_backend(self):
+        remote = AsyncRedisSlidingWindow(self.redis_cfg.url, limit=self.cfg.request_limit,
+                                         window_seconds=self.cfg.window_seconds,
+                                         max_connections=self.redis_cfg.max_connections)
+        if not self.cfg.redis_hybrid:
+            return remote
+        return HybridRedisLimiter(remote, limit=self.cfg.request_limit,
+                                  local_budget=self.cfg.redis_local_budget,
+                                  sync_interval=self.cfg.redis_sync_interval_ms / 1000.0)
+
+    def start(self) -> None:
+        if self.cfg.sweep_interval_seconds <= 0 or self._bg is not None:
+            return
+        self._bg = threading.Thread(target=self._sweep_loop, daemon=True)
+        self._bg.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._bg:
+            self._bg.join(timeout=2)
+
+    def _sweep_loop(self) -> None:
+        while not self._stop.wait(self.cfg.sweep_interval_seconds):
+            try:
+                self.sweep()
+            except Exception as e:  # pragma: no cover
+                self.logger.exception("Limiter sweep failed: %s", e)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Evict idle limiter keys and expired bans. Returns entries removed."""
         t = now if now is not None else time.time()
-        until = self.banned_until.get(ip, 0)
-        if until and until > t:
-            return True
-        if until and until <= t:
-            self.banned_until.pop(ip, None)
-        return False
+        removed = self._local.sweep(now=t)
+        removed += self._prefixes.sweep(now=t)
+        if self._policy is not None:
+            removed += self._policy.sweep(now=t)
+        if isinstance(self._async_backend, HybridRedisLimiter):
+            removed += self._async_backend.sweep(now=t)
+        removed += self.bans.expire(now=t)
+        removed += self.bans.sync_shared(now=t)
+        if removed:
+            self.logger.debug("Limiter sweep removed %s idle entries (tracked=%s)", removed, self.tracked_keys())
+        return removed
+
+    def tracked_keys(self) -> int:
+        return len(self._local)
 
-    def register_request(self, ip: str, now: Optional[float] = None) -> Optional[int]:
+    def is_banned(self, ip: str, now: Optional[float] = None) -> bool:
+        return self.bans.is_banned(ip, now=now)
+
+    def register_request(self, ip: str, now: Optional[float] = None, *, path: Optional[str] = None) -> Optional[int]:
         """
         Returns current request count in window if limit exceeded, else None.
         """
+        verdict = self.evaluate(ip, now=now, path=path)
+        return verdict.count if verdict is not None else None
+
+    async def register_request_async(self, ip: str, now: Optional[float] = None, *,
+                                     path: Optional[str] = None) -> Optional[int]:
+        verdict = await self.evaluate_async(ip, now=now, path=path)
+        return verdict.count if verdict is not None else None
+
+    def evaluate(self, ip: str, now: Optional[float] = None, *, path: Optional[str] = None,
+                 peer: bool = True) -> Optional[RateVerdict]:
+        """
+        Count one request; returns why it must be rejected, or None if it is allowed.
+        `peer` is False when `ip` comes from a forwarding header; bans then stay out of the kernel set.
+        """
         if self.is_banned(ip, now=now):
-            return self.cfg.request_limit + 1
-        allowed, count = self._backend.hit(ip, now=now)
-        # With RedisCounter, allowed is always True; enforce policy here
-        if count > self.cfg.request_limit:
-            t = now if now is not None else time.time()
-            self.banned_until[ip] = t + self.cfg.ban_seconds
+            return RateVerdict("ban", self.cfg.request_limit + 1)
+        if self._policy is not None and self._policy.include_ip:
+            dimension, count = self._policy.hit(ip, path, now)
+        else:
+            allowed, count = self._backend.hit(ip, now=now)
+            # With RedisCounter, allowed is always True; enforce policy here
+            dimension = "ip" if count > self.cfg.request_limit else None
+        return self._apply_policy(ip, path, dimension, count, now, peer)
+
+    async def evaluate_async(self, ip: str, now: Optional[float] = None, *,
+                             path: Optional[str] = None, peer: bool = True) -> Optional[RateVerdict]:
+        """
+        Same contract as `evaluate`, without blocking the event loop on Redis.
+        Falls back to the local limiter if Redis is unreachable.
+        """
+        if self._async_backend is None:
+            return self.evaluate(ip, now=now, path=path, peer=peer)
+        if self.is_banned(ip, now=now):
+            return RateVerdict("ban", self.cfg.request_limit + 1)
+        try:
+            allowed, count = await self._async_backend.hit(ip, now=now)
+        except Exception as e:
+            self.logger.debug("Redis limiter unavailable, using local limiter: %s", e)
+            allowed, count = self._local.hit(ip, now=now)
+        dimension = "ip" if count > self.cfg.request_limit else None
+        return self._apply_policy(ip, path, dimension, count, now, peer)
+
+    def _apply_policy(self, ip: str, path: Optional[str], dimension: Optional[str], count: int,
+                      now: Optional[float], peer: bool = True) -> Optional[RateVerdict]:
+        if dimension == "ip":
+            self.bans.ban(ip, self.cfg.ban_seconds, reason=f"rate limit exceeded ({count} requests)",
+                          source="ddos", now=now, peer=peer)
             self.logger.warning("DDoS ban applied to %s for %ss (count=%s)", ip, self.cfg.ban_seconds, count)
-            return count
+            return RateVerdict("ip", count, banned=True)
+        if dimension is None and self._policy is not None and not self._policy.include_ip:
+            dimension, count = self._policy.hit(ip, path, now)
+        if dimension is not None:
+            # Route and global budgets shed load without banning the client
+            return RateVerdict(dimension, count)
+        if self._prefixes.enabled:
+            exceeded = self._prefixes.hit(ip, now=now)
+            if exceeded is not None:
+                prefix, prefix_count = exceeded
+                self.bans.ban(prefix, self.cfg.ban_seconds,
+                              reason=f"network rate limit exceeded ({prefix_count} requests)",
+                              source="ddos", now=now, peer=peer)
+                self.logger.warning("DDoS ban applied to network %s for %ss (count=%s)",
+                                    prefix, self.cfg.ban_seconds, prefix_count)
+                return RateVerdict("network", prefix_count, banned=True)
         return None
+
+    async def close(self) -> None:
+        if self._async_backend is not None:
+            await self._async_backend.close()
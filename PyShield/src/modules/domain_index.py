@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from functools import partial
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Sequence
+
+if TYPE_CHECKING:  # pragma: no cover
+    from modules.index_file import BloomFilter
+
+
+def reverse_domain(domain: str) -> str:
+    """'ads.example.com' -> 'moc.elpmaxe.sda.' (the trailing dot marks a label boundary)."""
+    return ("." + domain)[::-1]
+
+
+def unreverse_domain(key: str) -> str:
+    return key[-2::-1]
+
+
+class DomainIndex:
+    """
+    Immutable, sorted array of reversed domains searched with bisect.
+
+    Reversing puts every domain next to its subdomains: a listed parent of a
+    host is a prefix of the host's key and sorts just before it, so a lookup
+    is usually a single bisect plus a `startswith`, with no per-suffix string
+    joins. Instances are never mutated: writers build a new index and swap
+    the reference, so readers need no lock.
+
+    `keys` may be any sorted sequence, including one mapped from an index
+    file; an optional Bloom filter then answers most misses without
+    touching the keys at all.
+    """
+
+    __slots__ = ("_keys", "_bloom", "_bisect_left", "_bisect_right")
+
+    def __init__(self, keys: Sequence[str] = (), bloom: Optional["BloomFilter"] = None) -> None:
+        # Must be sorted and unique reversed keys; use build() for raw domains
+        self._keys = keys
+        self._bloom = bloom
+        # Sequences that know a faster search than probing item by item (mapped files) provide their own
+        self._bisect_left = getattr(keys, "bisect_left", None) or partial(bisect_left, keys)
+        self._bisect_right = getattr(keys, "bisect_right", None) or partial(bisect_right, keys)
+
+    @classmethod
+    def build(cls, domains: Iterable[str]) -> "DomainIndex":
+        return cls(sorted({reverse_domain(d) for d in domains if d}))
+
+    def match(self, host: str) -> Optional[str]:
+        """Return the listed domain covering `host` (itself or a parent), if any."""
+        keys = self._keys
+        if not keys or not host:
+            return None
+        q = ("." + host)[::-1]
+        if self._bloom is not None and not self._bloom.may_match(q):
+            return None
+        hi = self._bisect_right(q)
+        while hi:
+            key = keys[hi - 1]
+            if q.startswith(key):
+                return key[-2::-1]
+            # Any listed parent is a label prefix shared by `key` and `q`; narrow to it and retry
+            common = ""
+            pos = q.find(".")
+            while pos != -1 and key.startswith(q[:pos + 1]):
+                common = q[:pos + 1]
+                pos = q.find(".", pos + 1)
+            if not common:
+                return None
+            hi = self._bisect_right(common, 0, hi - 1)
+        return None
+
+    def contains(self, host: str) -> bool:
+        return self.match(host) is not None
+
+    def __contains__(self, domain: object) -> bool:
+        """Exact membership, without parent matching."""
+        if not isinstance(domain, str) or not domain:
+            return False
+        return self._has_key(reverse_domain(domain))
+
+    def _has_key(self, key: str) -> bool:
+        keys = self._keys
+        i = self._bisect_left(key)
+        return i < len(keys) and keys[i] == key
+
+    def with_changes(self, add: Iterable[str] = (), remove: Iterable[str] = ()) -> "DomainIndex":
+        """Return a new index with `add` inserted and `remove` deleted."""
+        removed = {reverse_domain(d) for d in remove if d}
+        added = {reverse_domain(d) for d in add if d} - removed
+        keys = self._keys
+        if removed:
+            keys = _merge(keys, sorted(removed), insert=False)
+        bloom = self._bloom
+        if added:
+            merged = _merge(keys, sorted(added), insert=True)
+            if merged is not keys:
+                # A Bloom filter stays valid after removals (no false negatives), not after inserts
+                keys, bloom = merged, None
+        if keys is self._keys:
+            return self
+        return DomainIndex(keys, bloom=bloom)
+
+    @property
+    def keys(self) -> Sequence[str]:
+        """The sorted reversed keys."""
+        return self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self) -> Iterator[str]:
+        return (unreverse_domain(k) for k in self._keys)
+
+
+def _merge(keys: Sequence[str], edits: List[str], *, insert: bool) -> Sequence[str]:
+    """
+    Insert or delete the sorted `edits` into `keys`, copying the untouched runs
+    between edits slice by slice. Unlike one big sort, this gives up the GIL
+    between slices, so lookups on other threads are not stalled while a large
+    feed is merged. Returns `keys` itself when nothing changes.
+    """
+    out: List[str] = []
+    start = 0
+    n = len(keys)
+    changed = False
+    for key in edits:
+        i = bisect_left(keys, key, start)
+        present = i < n and keys[i] == key
+        if present == insert:
+            continue  # Already listed / not listed
+        out.extend(keys[start:i])
+        if insert:
+            out.append(key)
+            start = i
+        else:
+            start = i + 1
+        changed = True
+    if not changed:
+        return keys
+    out.extend(keys[start:])
+    return out
@@ -22,6 +22,11 @@ class GeoBlocker:
             except Exception as e:
                 self.logger.error("GeoIP DB load failed: %s", e)
 
+    @property
+    def blocking(self) -> bool:
+        """True when lookups read the GeoIP database (file I/O on every miss)."""
+        return self._reader is not None
+
     def country_code(self, ip: str) -> Optional[str]:
         if not self._reader:
             return None
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import abc
+from typing import Dict, Iterable, List, Optional, Sequence
+from zlib import adler32, crc32
+
+MAGIC = b"PSDX"
+FORMAT_VERSION = 1
+# magic, format version, byte order, bloom hash count, key count, blob bytes, bloom bytes, metadata bytes
+_HEADER = struct.Struct("<4sHBBQQQQ")
+_BYTEORDER = {"little": 0, "big": 1}[sys.byteorder]
+# Source masks are 32 bits wide: bit 0 is the manual list, bits 1..31 are feeds
+MAX_SOURCES = 32
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class BloomFilter:
+    """
+    Bloom filter over reversed-domain keys, checked before the sorted array.
+
+    `may_match` tests every label prefix of a reversed host (i.e. the host
+    and each of its parents). Hashes are crc32/adler32 double hashing, both
+    stable across processes and computed incrementally label by label.
+    """
+
+    __slots__ = ("_bits", "_m", "_k")
+
+    def __init__(self, bits: Sequence[int], k: int) -> None:
+        self._bits = bits
+        self._m = len(bits) * 8
+        self._k = k
+
+    @classmethod
+    def build(cls, keys: Iterable[bytes], count: int, bits_per_key: int) -> "BloomFilter":
+        m = max(_align(count * bits_per_key), 64)
+        k = max(1, min(16, round(bits_per_key * 0.693)))
+        bits = bytearray(m // 8)
+        for data in keys:
+            h1 = crc32(data)
+            h2 = adler32(data) | 1
+            for i in range(k):
+                pos = (h1 + i * h2) % m
+                bits[pos >> 3] |= 1 << (pos & 7)
+        return cls(bits, k)
+
+    def may_match(self, key: str) -> bool:
+        """False if neither the host behind reversed `key` nor any parent can be listed."""
+        bits, m, k = self._bits, self._m, self._k
+        data = key.encode("utf-8")
+        h1, h2 = 0, 1
+        start = 0
+        end = data.find(b".")
+        while end != -1:
+            label = data[start:end + 1]
+            h1 = crc32(label, h1)
+            h2 = adler32(label, h2)
+            step = h2 | 1
+            for i in range(k):
+                pos = (h1 + i * step) % m
+                if not bits[pos >> 3] & (1 << (pos & 7)):
+                    break
+            else:
+                return True
+            start = end + 1
+            end = data.find(b".", start)
+        return False
+
+    @property
+    def bits(self) -> Sequence[int]:
+        return self._bits
+
+    @property
+    def k(self) -> int:
+        return self._k
+
+
+class _MappedKeys(abc.Sequence):
+    """
+    Read-only str sequence over the offsets and blob of a mapped index file.
+
+    Every FENCE_STRIDE-th key is decoded once into an in-memory list, so a
+    bisect runs at C speed over the fences and only decodes a handful of
+    keys from the mapping to finish inside one block.
+    """
+
+    __slots__ = ("_mm", "_base", "_offsets", "_n", "_fences")
+
+    FENCE_STRIDE = 32
+
+    def __init__(self, mm: mmap.mmap, base: int, offsets: memoryview) -> None:
+        self._mm = mm
+        self._base = base
+        self._offsets = offsets
+        self._n = len(offsets) - 1
+        self._fences = [self._key(i) for i in range(0, self._n, self.FENCE_STRIDE)]
+
+    def _key(self, i: int) -> str:
+        base, o = self._base, self._offsets
+        return self._mm[base + o[i]:base + o[i + 1]].decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._key(j) for j in range(*i.indices(self._n))]
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError("index out of range")
+        return self._key(i)
+
+    def _search(self, x: str, right: bool) -> int:
+        # Fences narrow to one block; finish with a byte-wise bisect of the mapping (UTF-8 keeps str order)
+        stride = self.FENCE_STRIDE
+        j = (bisect_right if right else bisect_left)(self._fences, x)
+        if not j:
+            return 0
+        lo, hi = (j - 1) * stride, min(j * stride, self._n)
+        target = x.encode("utf-8")
+        mm, base, o = self._mm, self._base, self._offsets
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            key = mm[base + o[mid]:base + o[mid + 1]]
+            if key < target or (right and key == target):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # For a sorted sequence, bisect with lo/hi equals the unbounded result clamped to [lo, hi]
+    def bisect_left(self, x: str, lo: int = 0, hi: Optional[int] = None) -> int:
+        return min(max(self._search(x, False), lo), self._n if hi is None else hi)
+
+    def bisect_right(self, x: str, lo: int = 0, hi: Optional[int] = None) -> int:
+        return min(max(self._search(x, True), lo), self._n if hi is None else hi)
+
+
+class IndexFile:
+    """
+    A compiled blacklist mapped read-only from disk.
+
+    Layout: header | metadata JSON | offsets (u64, n + 1) | source masks
+    (u32, n) | Bloom bits | key blob, with 8-byte aligned sections. Keys are
+    the sorted reversed domains of DomainIndex, so `keys` can back an index
+    directly; pages are shared by every process mapping the same file.
+    """
+
+    def __init__(self, path: str, mm: mmap.mmap, keys: _MappedKeys, masks: memoryview,
+                 bloom: Optional[BloomFilter], meta: Dict[str, object]) -> None:
+        self.path = path
+        self.keys = keys
+        self.masks = masks
+        self.bloom = bloom
+        self.meta = meta
+        self._mm = mm
+
+    @classmethod
+    def open(cls, path: str) -> Optional["IndexFile"]:
+        """Map `path`. Returns None if it does not exist; raises ValueError if it is not a usable index."""
+        try:
+            fh = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        with fh:
+            size = os.fstat(fh.fileno()).st_size
+            if size < _HEADER.size:
+                raise ValueError("truncated index file")
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, byteorder, k, n, blob_len, bloom_len, meta_len = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"unsupported index file (magic={magic!r}, version={version})")
+        if byteorder != _BYTEORDER:
+            raise ValueError("index file was written on a machine with a different byte order")
+        pos = _HEADER.size
+        meta = json.loads(bytes(mm[pos:pos + meta_len]).decode("utf-8")) if meta_len else {}
+        pos = _align(pos + meta_len)
+        view = memoryview(mm)
+        offsets = view[pos:pos + (n + 1) * 8].cast("Q")
+        pos += (n + 1) * 8
+        masks = view[pos:pos + n * 4].cast("I")
+        pos = _align(pos + n * 4)
+        bloom = BloomFilter(view[pos:pos + bloom_len], k) if bloom_len else None
+        pos += bloom_len
+        if pos + blob_len != size or (n and offsets[n] != blob_len):
+            raise ValueError("corrupt index file (section sizes do not match)")
+        return cls(path, mm, _MappedKeys(mm, pos, offsets), masks, bloom, meta)
+
+
+def write_index_file(path: str, keys: Sequence[str], masks: Sequence[int],
+                     meta: Dict[str, object], *, bloom_bits_per_key: int = 0) -> None:
+    """
+    Write sorted reversed `keys` with per-key source `masks` to `path`.
+
+    The file is written next to the target and renamed over it, so readers
+    either map the old file or the complete new one.
+    """
+    encoded: List[bytes] = [k.encode("utf-8") for k in keys]
+    offsets = array("Q", [0])
+    total = 0
+    for data in encoded:
+        total += len(data)
+        offsets.append(total)
+    mask_arr = array("I", masks)
+    if len(mask_arr) != len(encoded):
+        raise ValueError("one source mask per key is required")
+    bloom = BloomFilter.build(encoded, len(encoded), bloom_bits_per_key) if bloom_bits_per_key > 0 else None
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    bloom_len = len(bloom.bits) if bloom is not None else 0
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp, "wb") as out:
+            out.write(_HEADER.pack(MAGIC, FORMAT_VERSION, _BYTEORDER, bloom.k if bloom else 0,
+                                   len(encoded), total, bloom_len, len(meta_bytes)))
+            out.write(meta_bytes)
+            _pad(out)
+            offsets.tofile(out)
+            mask_arr.tofile(out)
+            _pad(out)
+            if bloom is not None:
+                out.write(bloom.bits)
+            out.write(b"".join(encoded))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _pad(out) -> None:
+    pos = out.tell()
+    out.write(b"\0" * (_align(pos) - pos))
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional, Set, Tuple
+
+from core.config import ReputationConfig
+from core.ipnet import parse_ip
+from core.logging_system import LoggerFactory
+
+try:
+    import aiohttp  # type: ignore
+except Exception:  # pragma: no cover
+    aiohttp = None  # type: ignore
+
+
+class ReputationProvider:
+    """
+    Source of host reputation. `lookup` returns True (malicious), False
+    (clean) or None (unknown / not answered); it may raise on transport
+    errors. Implementations must be usable from several event loops.
+    """
+
+    name = "provider"
+
+    async def lookup(self, host: str) -> Optional[bool]:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        return None
+
+
+class VirusTotalProvider(ReputationProvider):
+    """VirusTotal v3 domain/IP reports; a host is malicious once `threshold` engines flag it."""
+
+    name = "virustotal"
+
+    def __init__(self, api_key: str, *, base_url: str = "https://www.virustotal.com/api/v3",
+                 timeout_seconds: float = 5.0, threshold: int = 1) -> None:
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required for reputation lookups")
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout_seconds = timeout_seconds
+        self.threshold = threshold
+        # One session per event loop (the proxy and the dashboard run separate loops)
+        self._sessions: "weakref.WeakKeyDictionary[Any, Any]" = weakref.WeakKeyDictionary()
+
+    def _session(self) -> Any:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                headers={"x-apikey": self.api_key},
+                timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+            )
+            self._sessions[loop] = session
+        return session
+
+    async def lookup(self, host: str) -> Optional[bool]:
+        kind = "ip_addresses" if parse_ip(host) is not None else "domains"
+        async with self._session().get(f"{self.base_url}/{kind}/{host}") as resp:
+            if resp.status == 404:
+                return False  # Never seen by any engine
+            if resp.status != 200:
+                raise RuntimeError(f"HTTP {resp.status}")
+            data = await resp.json()
+        stats = (data.get("data") or {}).get("attributes", {}).get("last_analysis_stats") or {}
+        return int(stats.get("malicious", 0)) >= self.threshold
+
+    async def close(self) -> None:
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` banked."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, now: Optional[float] = None) -> bool:
+        t = now if now is not None else time.monotonic()
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + (t - self._updated) * self.rate)
+            self._updated = t
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class ReputationService:
+    """
+    Caches and rate limits reputation lookups so they stay off the request path.
+
+    Results are cached per host: malicious ones for `positive_ttl`, clean ones
+    for `negative_ttl`; unknown answers and errors are not cached. Concurrent
+    checks of the same host on one event loop share a single lookup, and
+    lookups beyond the token-bucket budget are skipped (treated as unknown).
+
+    With `blocking=False`, `check` never waits on the provider: a cache miss
+    returns None at once and resolves in the background, so the first request
+    to a host passes and later ones see the verdict.
+    """
+
+    def __init__(self, provider: ReputationProvider, *, positive_ttl: float = 86400, negative_ttl: float = 3600,
+                 requests_per_minute: float = 4, burst: int = 4, blocking: bool = False,
+                 max_entries: int = 100_000) -> None:
+        self.provider = provider
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.blocking = blocking
+        self.max_entries = max_entries
+        self.logger = LoggerFactory.get_logger("pyshield.reputation")
+        self._bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        # host -> (verdict, expires at)
+        self._cache: Dict[str, Tuple[bool, float]] = {}
+        # Per event loop: host -> in-flight lookup
+        self._inflight: "weakref.WeakKeyDictionary[Any, Dict[str, asyncio.Future]]" = weakref.WeakKeyDictionary()
+        # Keeps fire-and-forget lookups alive until they finish
+        self._background: Set[asyncio.Task] = set()
+        self.stats: Dict[str, int] = {
+            "hits": 0, "misses": 0, "lookups": 0, "coalesced": 0, "throttled": 0, "errors": 0,
+        }
+
+    def cached(self, host: str, now: Optional[float] = None) -> Optional[bool]:
+        """Cached verdict for `host` if still fresh, else None. Never does I/O."""
+        entry = self._cache.get(host)
+        if entry is None:
+            return None
+        verdict, expires = entry
+        if expires <= (now if now is not None else time.time()):
+            self._cache.pop(host, None)
+            return None
+        return verdict
+
+    async def check(self, host: str) -> Optional[bool]:
+        """True if `host` is known malicious, False if known clean, None if unknown (yet)."""
+        if not host:
+            return None
+        verdict = self.cached(host)
+        if verdict is not None:
+            self.stats["hits"] += 1
+            return verdict
+        self.stats["misses"] += 1
+        if self.blocking:
+            return await self._lookup(host)
+        if host not in self._loop_inflight():
+            task = asyncio.get_running_loop().create_task(self._lookup(host))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        return None
+
+    def _loop_inflight(self) -> Dict[str, asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(loop)
+        if inflight is None:
+            inflight = self._inflight[loop] = {}
+        return inflight
+
+    async def _lookup(self, host: str) -> Optional[bool]:
+        inflight = self._loop_inflight()
+        pending = inflight.get(host)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        inflight[host] = future
+        verdict: Optional[bool] = None
+        try:
+            verdict = await self._fetch(host)
+            return verdict
+        finally:
+            # Waiters get None if this lookup was cancelled
+            inflight.pop(host, None)
+            future.set_result(verdict)
+
+    async def _fetch(self, host: str) -> Optional[bool]:
+        if not self._bucket.take():
+            self.stats["throttled"] += 1
+            return None
+        self.stats["lookups"] += 1
+        try:
+            verdict = await self.provider.lookup(host)
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.logger.warning("Reputation lookup failed for %s (%s): %s", host, self.provider.name, e)
+            return None
+        if verdict is not None:
+            self._store(host, verdict)
+        return verdict
+
+    def _store(self, host: str, verdict: bool) -> None:
+        cache = self._cache
+        if len(cache) >= self.max_entries:
+            # Oldest insertion first; entries are short-lived anyway
+            for stale in list(cache)[: max(self.max_entries // 10, 1)]:
+                cache.pop(stale, None)
+        ttl = self.positive_ttl if verdict else self.negative_ttl
+        cache[host] = (verdict, time.time() + ttl)
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self.stats)
+        out["cached"] = len(self._cache)
+        out["provider"] = self.provider.name
+        return out
+
+    async def close(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        await self.provider.close()
+
+
+def create_reputation_service(cfg: ReputationConfig, api_key: Optional[str] = None) -> Optional[ReputationService]:
+    """Build the configured service, or None when disabled or not configured."""
+    if not cfg.enabled:
+        return None
+    key = cfg.api_key or api_key
+    if cfg.provider != "virustotal":
+        raise ValueError(f"Unknown reputation provider: {cfg.provider}")
+    if not key:
+        return None
+    provider = VirusTotalProvider(key, base_url=cfg.base_url, timeout_seconds=cfg.timeout_seconds,
+                                  threshold=cfg.malicious_threshold)
+    return ReputationService(provider, positive_ttl=cfg.positive_ttl_seconds, negative_ttl=cfg.negative_ttl_seconds,
+                             requests_per_minute=cfg.requests_per_minute, burst=cfg.burst,
+                             blocking=cfg.blocking, max_entries=cfg.max_entries)
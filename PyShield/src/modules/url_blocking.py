@@ -1,30 +1,310 @@
 from __future__ import annotations
 
+import os
 import re
 import threading
 import time
-from typing import Iterable, List, Optional, Set
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import unquote, unquote_plus, urlsplit
 
-import requests
 
 from core.config import URLBlockingConfig
 from core.logging_system import LoggerFactory
+from modules.aho_corasick import AhoCorasick
+from modules.domain_index import DomainIndex, unreverse_domain
+from modules.feeds import FeedPipeline, FeedState, parse_rule_line
+from modules.index_file import MAX_SOURCES, IndexFile, write_index_file
 
 
-DOMAIN_RE = re.compile(r"https?://([^/]+)")
+def extract_host(item: str) -> str:
+    """
+    Host part of a URL, CONNECT authority ('host:443') or bare domain,
+    lowercased, without scheme, userinfo, port, path, query or trailing dot.
+    """
+    item = item.strip().lower()
+    scheme = item.find("://")
+    if scheme != -1:
+        item = item[scheme + 3:]
+    for sep in "/?#":
+        cut = item.find(sep)
+        if cut != -1:
+            item = item[:cut]
+    at = item.rfind("@")
+    if at != -1:
+        item = item[at + 1:]
+    if item.startswith("["):
+        # IPv6 literal, optionally with a port
+        end = item.find("]")
+        return item[1:end] if end != -1 else item[1:]
+    if item.count(":") == 1:
+        item = item.split(":", 1)[0]
+    return item.rstrip(".")
+
+
+REGEX_RULE_PREFIX = "re:"
+# Shortest literal worth using as a regex prefilter
+MIN_ANCHOR = 3
+_QUANTIFIERS = "?*+{"
+# Numbered or named backreferences and group conditionals: such a regex is matched on its own
+_GROUP_REFERENCE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+
+
+def rule_target(path: str, query: str = "") -> str:
+    """The string path rules are matched against: percent-decoded, lowercased 'path?query'."""
+    target = unquote(path)
+    if query:
+        target += "?" + unquote_plus(query)
+    return target.lower()
+
+
+def required_literal(pattern: str) -> str:
+    """
+    Longest literal run every match of `pattern` must contain, or '' if none is found.
+
+    Conservative: only top-level text outside groups and classes counts,
+    a character followed by a quantifier is dropped, and patterns with a
+    top-level '|' have no required literal.
+    """
+    if re.search(r"\(\?[a-zA-Z]*x", pattern):
+        return ""  # Verbose mode: whitespace and comments are not literals
+    runs: List[str] = []
+    run: List[str] = []
+    depth = 0
+    i, n = 0, len(pattern)
+    while i < n:
+        ch = pattern[i]
+        literal = None
+        if ch == "\\" and i + 1 < n:
+            nxt = pattern[i + 1]
+            i += 2
+            if not nxt.isalnum() and depth == 0:
+                literal = nxt
+            elif nxt in "xuU":
+                i += {"x": 2, "u": 4, "U": 8}[nxt]
+            elif nxt == "N" and i < n and pattern[i] == "{":
+                i = pattern.find("}", i) + 1 or n
+            elif nxt.isdigit():
+                while i < n and pattern[i].isdigit():
+                    i += 1
+        elif ch == "{":
+            # Repetition count such as {2,5}
+            i = pattern.find("}", i) + 1 or n
+        elif ch == "[":
+            # Skip the class; a ']' right after '[' or '[^' is a member
+            j = i + 1
+            if j < n and pattern[j] == "^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 2 if pattern[j] == "\\" else 1
+            i = j + 1
+        elif ch == "(":
+            depth += 1
+            i += 1
+        elif ch == ")":
+            depth -= 1
+            i += 1
+        elif ch == "|" and depth == 0:
+            return ""
+        else:
+            i += 1
+            if ch not in ".^$?*+}|" and depth == 0:
+                literal = ch
+        if literal is not None and not (i < n and pattern[i] in _QUANTIFIERS):
+            run.append(literal)
+        else:
+            runs.append("".join(run))
+            run = []
+    runs.append("".join(run))
+    return max(runs, key=len)
+
+
+class PathRuleSet:
+    """
+    Compiled path/query rules, matched against `rule_target(path, query)`.
+
+    Plain rules ('/wp-login.php', '/.env') are case-insensitive substrings,
+    all searched in one Aho-Corasick pass. Rules prefixed with 're:' are
+    regexes. Python's re has no DFA, so a big alternation costs one branch
+    per rule at every position; instead, each regex's required literal goes
+    into a second automaton and only regexes whose literal occurs are run.
+    Regexes without one are joined into a single alternation of named
+    groups, except those that refer to their own groups or cannot share a
+    pattern with the others (global inline flags, repeated group names),
+    which are run one by one. Immutable: rebuild and swap.
+    """
+
+    def __init__(self, rules: Iterable[str] = ()) -> None:
+        self.rules = frozenset(r.strip() for r in rules if r and r.strip())
+        self.invalid: List[str] = []
+        literal_rules: Dict[str, str] = {}
+        anchored: Dict[str, List[str]] = {}
+        unanchored: List[str] = []
+        for rule in sorted(self.rules):
+            if rule.startswith(REGEX_RULE_PREFIX):
+                pattern = rule[len(REGEX_RULE_PREFIX):]
+                try:
+                    re.compile(pattern)
+                except re.error:
+                    self.invalid.append(rule)
+                    continue
+                anchor = required_literal(pattern).lower()
+                if len(anchor) >= MIN_ANCHOR:
+                    anchored.setdefault(anchor, []).append(rule)
+                else:
+                    unanchored.append(rule)
+            else:
+                literal_rules.setdefault(rule.lower(), rule)
+        self._literals = AhoCorasick(literal_rules) if literal_rules else None
+        self._literal_rules = [literal_rules[p] for p in self._literals.patterns] if self._literals else []
+        self._anchors = AhoCorasick(anchored) if anchored else None
+        self._anchored_rules = [anchored[p] for p in self._anchors.patterns] if self._anchors else []
+        # Compiled on first use: only regexes whose literal has shown up in traffic
+        self._compiled: Dict[str, re.Pattern] = {}
+        # Backreferences would point at another rule's groups inside the alternation
+        solo = [rule for rule in unanchored if _GROUP_REFERENCE.search(rule)]
+        combined = [rule for rule in unanchored if not _GROUP_REFERENCE.search(rule)]
+        self._unanchored = combined
+        self._regex = None
+        if combined:
+            try:
+                self._regex = re.compile("|".join(
+                    f"(?P<r{i}>{rule[len(REGEX_RULE_PREFIX):]})" for i, rule in enumerate(combined)
+                ), re.IGNORECASE)
+            except re.error:
+                # Valid alone, not together: global inline flags past the start, or repeated group names
+                solo = unanchored
+                self._unanchored = []
+        self._solo = [(rule, re.compile(rule[len(REGEX_RULE_PREFIX):], re.IGNORECASE)) for rule in solo]
+        self._count = len(self._literal_rules) + sum(map(len, self._anchored_rules)) + len(unanchored)
+
+    def match(self, target: str) -> Optional[str]:
+        """The first rule matching `target`, or None."""
+        if self._literals is not None:
+            i = self._literals.search(target)
+            if i != -1:
+                return self._literal_rules[i]
+        if self._anchors is not None:
+            for i in self._anchors.search_all(target):
+                for rule in self._anchored_rules[i]:
+                    compiled = self._compiled.get(rule)
+                    if compiled is None:
+                        compiled = self._compiled[rule] = re.compile(rule[len(REGEX_RULE_PREFIX):], re.IGNORECASE)
+                    if compiled.search(target):
+                        return rule
+        if self._regex is not None:
+            m = self._regex.search(target)
+            if m is not None:
+                return self._unanchored[int(m.lastgroup[1:])]
+        for rule, compiled in self._solo:
+            if compiled.search(target):
+                return rule
+        return None
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class VerdictCache:
+    """
+    Bounded host -> verdict cache with CLOCK eviction and generation-based invalidation.
+
+    Each entry remembers the blacklist generation it was computed under, so
+    bumping the generation invalidates everything in O(1); stale entries are
+    simply recomputed on their next lookup. The dict's insertion order is
+    the CLOCK ring: on eviction the oldest entry gets a second chance if it
+    was hit since it was last considered. Reads take no lock.
+    """
+
+    def __init__(self, capacity: int = 4096) -> None:
+        self.capacity = capacity
+        # host -> [generation, verdict, referenced]
+        self._entries: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, host: str, generation: int) -> Optional[bool]:
+        entry = self._entries.get(host)
+        if entry is None or entry[0] != generation:
+            self.misses += 1
+            return None
+        entry[2] = True
+        self.hits += 1
+        return entry[1]
+
+    def put(self, host: str, generation: int, verdict: bool) -> None:
+        if self.capacity <= 0:
+            return
+        entries = self._entries
+        with self._lock:
+            entry = entries.get(host)
+            if entry is not None:
+                entry[0], entry[1] = generation, verdict
+                return
+            while len(entries) >= self.capacity:
+                oldest = next(iter(entries))
+                victim = entries.pop(oldest)
+                if victim[2] and victim[0] == generation:
+                    victim[2] = False
+                    entries[oldest] = victim
+                else:
+                    self.evictions += 1
+            entries[host] = [generation, verdict, False]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
 
 
 class URLBlocker:
     def __init__(self, cfg: URLBlockingConfig):
         self.cfg = cfg
         self.logger = LoggerFactory.get_logger("pyshield.url")
-        self._blacklist: Set[str] = set(map(self._normalize, cfg.blacklist or []))
-        self._lock = threading.RLock()
+        # Entries from config and the dashboard; feed diffs never remove these
+        self._manual: Set[str] = set(map(self._normalize, cfg.blacklist or []))
+        # Immutable; writers publish a new index by swapping this reference, readers take no lock
+        self._index = DomainIndex.build(self._manual)
+        self._feeds = FeedPipeline(concurrency=cfg.feed_concurrency, timeout_seconds=cfg.feed_timeout_seconds)
+        # Serialises writers only
+        self._write_lock = threading.Lock()
+        # Mapped index file whose per-source masks are not yet read back into feed states
+        self._restore_from: Optional[IndexFile] = None
+        # Changes not yet written to the index file
+        self._dirty = False
+        # Bumped after every content change of _index; cached verdicts from older generations are ignored
+        self._generation = 0
+        self._verdicts = VerdictCache(cfg.verdict_cache_size)
+        # Path/query rules from config plus rule feeds; swapped as a whole like the domain index
+        self._manual_rules: Set[str] = set(cfg.path_rules or [])
+        self._rule_feeds = FeedPipeline(concurrency=cfg.feed_concurrency, timeout_seconds=cfg.feed_timeout_seconds,
+                                        line_parser=parse_rule_line)
+        self._path_rules = self._compile_rules(self._manual_rules)
         self._stop = threading.Event()
         self._bg: Optional[threading.Thread] = None
+        # mtime of the index file the current index was mapped from (or written to)
+        self._index_mtime: Optional[int] = None
+        if cfg.index_path:
+            self._load_index_file(cfg.index_path)
 
     def start(self) -> None:
-        if self.cfg.feeds and self.cfg.auto_update_minutes > 0 and self._bg is None:
+        if (self.cfg.feeds or self.cfg.path_rule_feeds) and self.cfg.auto_update_minutes > 0 and self._bg is None:
             self._bg = threading.Thread(target=self._auto_update_loop, daemon=True)
             self._bg.start()
 
@@ -32,71 +312,273 @@ class URLBlocker:
         self._stop.set()
         if self._bg:
             self._bg.join(timeout=2)
+        if self._dirty:
+            self._persist()
 
     def _auto_update_loop(self) -> None:
         while not self._stop.is_set():
             try:
-                self.update_from_feeds(self.cfg.feeds)
+                if self.cfg.feeds:
+                    self.update_from_feeds(self.cfg.feeds)
+                if self.cfg.path_rule_feeds:
+                    self.update_rule_feeds(self.cfg.path_rule_feeds)
             except Exception as e:  # pragma: no cover
                 self.logger.exception("Feed update failed: %s", e)
             self._stop.wait(self.cfg.auto_update_minutes * 60)
 
     def _normalize(self, item: str) -> str:
-        item = item.strip().lower()
-        item = item.rstrip('/')
         # domain only
-        m = DOMAIN_RE.match(item)
-        if m:
-            item = m.group(1)
-        return item
+        return extract_host(item)
+
+    def _publish(self, index: DomainIndex) -> None:
+        """Swap in a new index, then invalidate cached verdicts. Call under _write_lock."""
+        if index is not self._index:
+            self._index = index
+            self._generation += 1
 
     def add(self, items: Iterable[str]) -> None:
-        with self._lock:
-            for it in items:
-                self._blacklist.add(self._normalize(it))
+        new_items = {self._normalize(it) for it in items}
+        with self._write_lock:
+            self._restore_sources()
+            self._manual |= new_items
+            self._publish(self._index.with_changes(add=new_items))
+            self._dirty = True
 
     def remove(self, items: Iterable[str]) -> None:
-        with self._lock:
-            for it in items:
-                self._blacklist.discard(self._normalize(it))
+        old_items = {self._normalize(it) for it in items}
+        with self._write_lock:
+            self._restore_sources()
+            self._manual -= old_items
+            self._publish(self._index.with_changes(remove=old_items))
+            self._dirty = True
+
+    def save(self) -> bool:
+        """
+        Write pending changes to cfg.index_path now rather than on the next
+        feed update, so processes polling `reload_index_file` pick them up.
+        Returns False if there is no index file to write.
+        """
+        if not self.cfg.index_path:
+            return False
+        if self._dirty or self._index_mtime is None:
+            self._persist()
+        return not self._dirty
 
     def is_malicious(self, url: str) -> bool:
-        host = self._normalize(url)
-        with self._lock:
-            if host in self._blacklist:
-                return True
-            # subdomain match
-            parts = host.split('.')
-            for i in range(1, len(parts)):
-                if '.'.join(parts[i:]) in self._blacklist:
-                    return True
-        return False
+        return self.is_malicious_host(extract_host(url))
+
+    def is_malicious_host(self, host: str) -> bool:
+        """Whether `host` (already extracted and lowercased) or any parent domain is listed."""
+        # Read the generation before the index: a verdict is never cached under a newer generation than its index
+        generation = self._generation
+        verdict = self._verdicts.get(host, generation)
+        if verdict is None:
+            verdict = self._index.contains(host)
+            self._verdicts.put(host, generation, verdict)
+        return verdict
+
+    def match_path(self, path: str, query: str = "") -> Optional[str]:
+        """The path/query rule blocking this request, or None."""
+        rules = self._path_rules
+        if not len(rules):
+            return None
+        return rules.match(rule_target(path, query))
+
+    def match_url(self, url: str) -> Optional[str]:
+        """`match_path` for an absolute or origin-form URL; authorities (CONNECT) have no path."""
+        if not len(self._path_rules) or ("://" not in url and not url.startswith("/")):
+            return None
+        parts = urlsplit(url)
+        return self.match_path(parts.path, parts.query)
+
+    def _compile_rules(self, rules: Iterable[str]) -> PathRuleSet:
+        compiled = PathRuleSet(rules)
+        for rule in compiled.invalid:
+            self.logger.warning("Ignoring invalid path rule %r", rule)
+        return compiled
+
+    def update_rule_feeds(self, feeds: List[str]) -> int:
+        """Fetch changed path rule feeds and recompile the rule set. Returns the number of rules."""
+        try:
+            diffs = self._rule_feeds.refresh_sync(feeds)
+        except RuntimeError as e:
+            self.logger.warning("Rule feed update skipped: %s", e)
+            return len(self._path_rules)
+        for diff in diffs:
+            if diff.error:
+                self.logger.warning("Rule feed fetch failed %s: %s", diff.url, diff.error)
+        if any(diff.added or diff.removed for diff in diffs):
+            rules = set(self._manual_rules)
+            for domains in self._rule_feeds.domains():
+                rules |= domains
+            # Compiled on this thread; requests keep matching against the previous set meanwhile
+            self._path_rules = self._compile_rules(rules)
+            self.logger.info("Path rules updated (total=%s)", len(self._path_rules))
+        return len(self._path_rules)
+
+    def cache_stats(self) -> Dict[str, object]:
+        stats = self._verdicts.stats()
+        stats["generation"] = self._generation
+        return stats
+
+    def __len__(self) -> int:
+        return len(self._index)
 
     def update_from_feeds(self, feeds: List[str]) -> int:
-        added = 0
-        new_items: Set[str] = set()
-        for url in feeds:
-            try:
-                resp = requests.get(url, timeout=10)
-                if resp.status_code == 200:
-                    lines = [line.strip() for line in resp.text.splitlines() if line.strip() and not line.startswith('#')]
-                    new_items.update(lines)
-            except Exception as e:  # pragma: no cover
-                self.logger.warning("Feed fetch failed %s: %s", url, e)
-        before = len(self._blacklist)
-        self.add(new_items)
-        added = len(self._blacklist) - before
-        if added:
-            self.logger.info("Blacklist updated: +%s entries (total=%s)", added, len(self._blacklist))
+        """Fetch changed feeds and apply their add/remove diffs. Returns the number of entries added."""
+        with self._write_lock:
+            # Restores the feeds' validators, so a warm restart costs 304s
+            self._restore_sources()
+        try:
+            diffs = self._feeds.refresh_sync(feeds)
+        except RuntimeError as e:
+            self.logger.warning("Feed update skipped: %s", e)
+            return 0
+        to_add: Set[str] = set()
+        to_remove: Set[str] = set()
+        for diff in diffs:
+            if diff.error:
+                self.logger.warning("Feed fetch failed %s: %s", diff.url, diff.error)
+                continue
+            to_add |= diff.added
+            to_remove |= diff.removed
+        if to_remove:
+            # Keep entries that another feed still lists
+            remaining = list(self._feeds.domains())
+            to_remove = {d for d in to_remove - to_add if not any(d in s for s in remaining)}
+        # The new index is built on this (background) thread; lookups keep using the old one meanwhile
+        with self._write_lock:
+            old = self._index
+            to_remove = {d for d in to_remove - self._manual if d in old}
+            index = old.with_changes(add=to_add, remove=to_remove)
+            self._publish(index)
+        total = len(index)
+        removed = len(to_remove)
+        added = total - len(old) + removed
+        if added or removed:
+            self.logger.info("Blacklist updated: +%s -%s entries (total=%s)", added, removed, total)
+            self._dirty = True
+        else:
+            self.logger.debug("Feeds unchanged (total=%s)", total)
+        if self._dirty:
+            self._persist()
         return added
 
-    def virustotal_check(self, url: str, api_key: Optional[str]) -> Optional[bool]:  # pragma: no cover (network)
-        if not api_key:
-            return None
+    def _load_index_file(self, path: str) -> None:
+        started = time.perf_counter()
         try:
-            # Simple URL scanning endpoint (v3) placeholder
-            headers = {"x-apikey": api_key}
-            resp = requests.get("https://www.virustotal.com/api/v3/urls", headers=headers, timeout=10)
-            return None if resp.status_code >= 400 else None
-        except Exception:
+            loaded = IndexFile.open(path)
+        except (OSError, ValueError) as e:
+            self.logger.warning("Ignoring blacklist index %s: %s", path, e)
+            return
+        if loaded is None:
+            return
+        self._index_mtime = self._file_mtime(path)
+        mapped = DomainIndex(loaded.keys, bloom=loaded.bloom)
+        self._index = mapped.with_changes(add=self._manual)
+        # Config entries missing from the file: rewrite it on the next update
+        self._dirty = self._index is not mapped
+        self._restore_from = loaded
+        self.logger.info("Loaded %s blacklist entries from %s in %.1f ms",
+                         len(self._index), path, (time.perf_counter() - started) * 1000)
+
+    @staticmethod
+    def _file_mtime(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
             return None
+
+    def reload_index_file(self) -> bool:
+        """
+        Map cfg.index_path again if another process rewrote it since this one
+        loaded it, e.g. in proxy workers after the parent refreshed the feeds.
+        Returns True if a new index was published.
+        """
+        path = self.cfg.index_path
+        mtime = self._file_mtime(path) if path else None
+        if mtime is None or mtime == self._index_mtime:
+            return False
+        try:
+            loaded = IndexFile.open(path)
+        except (OSError, ValueError) as e:
+            self.logger.warning("Ignoring blacklist index %s: %s", path, e)
+            return False
+        if loaded is None:
+            return False
+        with self._write_lock:
+            self._index_mtime = mtime
+            # The writer's manual entries are in the file already; re-adding ours would undo its removals
+            self._publish(DomainIndex(loaded.keys, bloom=loaded.bloom))
+        self.logger.info("Reloaded %s blacklist entries from %s", len(self._index), path)
+        return True
+
+    def _restore_sources(self) -> None:
+        """Rebuild feed states and manual entries from the loaded file's source masks. Call under _write_lock."""
+        loaded, self._restore_from = self._restore_from, None
+        if loaded is None:
+            return
+        feeds = list(loaded.meta.get("feeds") or [])[:MAX_SOURCES - 1]
+        sources: List[Set[str]] = [set() for _ in range(len(feeds) + 1)]
+        orphans: Set[str] = set()
+        keys = loaded.keys
+        for i, mask in enumerate(loaded.masks):
+            domain = unreverse_domain(keys[i])
+            if not mask:
+                orphans.add(domain)
+            bit = 0
+            while mask and bit < len(sources):
+                if mask & 1:
+                    sources[bit].add(domain)
+                mask >>= 1
+                bit += 1
+        self._manual |= sources[0]
+        for feed, domains in zip(feeds, sources[1:]):
+            url = feed.get("url")
+            if url and url not in self._feeds.states:
+                self._feeds.states[url] = FeedState(url=url, etag=feed.get("etag"),
+                                                    last_modified=feed.get("last_modified"),
+                                                    domains=domains, fetched_at=feed.get("fetched_at") or 0.0)
+        if orphans:
+            # Listed by no known source any more (e.g. feeds past the mask width); their feeds re-add them
+            self._publish(self._index.with_changes(remove=orphans - self._manual))
+            self._dirty = True
+
+    def _persist(self) -> None:
+        """Write the index to cfg.index_path and serve lookups from the mapped copy."""
+        path = self.cfg.index_path
+        if not path:
+            return
+        with self._write_lock:
+            index = self._index
+            manual = set(self._manual)
+            states = list(self._feeds.states.values())[:MAX_SOURCES - 1]
+            self._dirty = False
+        sources = [manual] + [state.domains for state in states]
+        masks = []
+        for domain in index:
+            mask = 0
+            for bit, domains in enumerate(sources):
+                if domain in domains:
+                    mask |= 1 << bit
+            masks.append(mask)
+        meta: Dict[str, object] = {
+            "created": time.time(),
+            "feeds": [
+                {"url": s.url, "etag": s.etag, "last_modified": s.last_modified, "fetched_at": s.fetched_at}
+                for s in states
+            ],
+        }
+        try:
+            write_index_file(path, index.keys, masks, meta, bloom_bits_per_key=self.cfg.bloom_bits_per_key)
+            loaded = IndexFile.open(path)
+        except (OSError, ValueError) as e:
+            self.logger.warning("Could not write blacklist index %s: %s", path, e)
+            self._dirty = True
+            return
+        with self._write_lock:
+            # Unless a writer got in meanwhile, switch to the mapped pages shared with other processes
+            if loaded is not None and self._index is index:
+                self._index = DomainIndex(loaded.keys, bloom=loaded.bloom)
+            self._index_mtime = self._file_mtime(path)
+        self.logger.info("Wrote blacklist index %s (%s entries)", path, len(index))
@@ -0,0 +1,23 @@
+from core.admission import CONNECTION_LIMIT, PER_IP_LIMIT, AdmissionControl
+
+
+def test_caps_and_release():
+    admission = AdmissionControl(max_connections=3, max_per_ip=2)
+    assert admission.admit("192.0.2.1") is None
+    assert admission.admit("192.0.2.1") is None
+    assert admission.admit("192.0.2.1") == PER_IP_LIMIT
+    assert admission.admit("192.0.2.2") is None
+    assert admission.admit("192.0.2.3") == CONNECTION_LIMIT
+    admission.release("192.0.2.1")
+    assert admission.admit("192.0.2.3") is None
+    assert admission.snapshot()["rejected"][CONNECTION_LIMIT] == 1
+
+
+def test_lingering_refusals_are_capped():
+    admission = AdmissionControl(max_connections=1, max_lingering=2)
+    assert admission.start_linger() and admission.start_linger()
+    assert not admission.start_linger()
+    admission.end_linger()
+    assert admission.start_linger()
+    snapshot = admission.snapshot()
+    assert (snapshot["lingering"], snapshot["unlingered"]) == (2, 1)
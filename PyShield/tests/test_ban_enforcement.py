@@ -0,0 +1,140 @@
+import subprocess
+
+import pytest
+
+from core.bans import BanRegistry
+from core.config import BanEnforcementConfig
+from modules.ban_enforcement import KernelBanEnforcer
+
+NOW = 1_000_000.0
+
+
+@pytest.fixture
+def make_enforcer():
+    started = []
+
+    def make(**kwargs):
+        bans = BanRegistry()
+        # The flush thread never fires during a test; the tests flush by hand
+        cfg = BanEnforcementConfig(enabled=True, flush_interval_ms=3_600_000, **kwargs)
+        enforcer = KernelBanEnforcer(cfg, bans)
+        if cfg.dry_run:
+            enforcer.start()
+        else:
+            bans.subscribe(enforcer._on_ban_event)  # start() would run real setup commands
+        started.append(enforcer)
+        return bans, enforcer
+
+    yield make
+    for enforcer in started:
+        enforcer._stop.set()
+
+
+def test_ipset_script_adds_and_deletes_per_family(make_enforcer):
+    bans, enforcer = make_enforcer()
+    bans.ban("203.0.113.7", 60, reason="ddos", source="test", now=NOW)
+    bans.ban("2001:db8::1", 30, reason="ddos", source="test", now=NOW)
+    assert enforcer.flush(now=NOW) == 2
+    assert enforcer.last_script == (
+        "add pyshield_bans 203.0.113.7 timeout 60\n"
+        "add pyshield_bans6 2001:db8::1 timeout 30\n"
+    )
+    bans.unban("203.0.113.7")
+    assert enforcer.flush(now=NOW + 1) == 1
+    assert enforcer.last_script == "del pyshield_bans 203.0.113.7\n"
+
+
+def test_nft_script_groups_elements_per_set(make_enforcer):
+    bans, enforcer = make_enforcer(backend="nftables")
+    bans.ban("203.0.113.7", 60, reason="ddos", source="test", now=NOW)
+    bans.ban("198.51.100.0/24", 120, reason="prefix", source="test", now=NOW)
+    assert enforcer.flush(now=NOW) == 2
+    assert enforcer.last_script == (
+        "add element inet pyshield pyshield_bans { 203.0.113.7 timeout 60s, 198.51.100.0/24 timeout 120s }\n"
+    )
+    # Re-banning an installed key replaces the element so its timeout is refreshed
+    bans.ban("203.0.113.7", 300, reason="ddos", source="test", now=NOW + 10)
+    assert enforcer.flush(now=NOW + 10) == 2
+    assert enforcer.last_script == (
+        "delete element inet pyshield pyshield_bans { 203.0.113.7 }\n"
+        "add element inet pyshield pyshield_bans { 203.0.113.7 timeout 300s }\n"
+    )
+
+
+def test_setup_scripts(make_enforcer):
+    _, enforcer = make_enforcer(set_name="blocked")
+    assert enforcer.build_ipset_setup() == (
+        "create blocked hash:net family inet timeout 0\n"
+        "create blocked6 hash:net family inet6 timeout 0\n"
+    )
+    _, enforcer = make_enforcer(backend="nftables", set_name="blocked")
+    setup = enforcer.build_nft_setup()
+    assert "add set inet pyshield blocked { type ipv4_addr; flags interval, timeout; auto-merge; }\n" in setup
+    assert "add rule inet pyshield input ip6 saddr @blocked6 drop\n" in setup
+
+
+def test_forwarded_and_protected_keys_are_not_mirrored(make_enforcer):
+    bans, enforcer = make_enforcer(never_ban=["10.0.0.0/8"])
+    bans.ban("198.51.100.9", 60, reason="xff", source="test", now=NOW, peer=False)
+    bans.ban("10.1.2.3", 60, reason="ddos", source="test", now=NOW)
+    bans.ban("127.0.0.1", 60, reason="ddos", source="test", now=NOW)
+    assert enforcer.flush(now=NOW) == 0
+
+
+def test_failed_command_requeues_the_batch(make_enforcer, monkeypatch):
+    bans, enforcer = make_enforcer(dry_run=False)
+
+    def missing(*args, **kwargs):
+        raise FileNotFoundError(2, "No such file or directory", "sudo")
+
+    monkeypatch.setattr(subprocess, "run", missing)
+    bans.ban("203.0.113.7", 60, reason="ddos", source="test", now=NOW)
+    assert enforcer.flush(now=NOW) == 0
+
+    def hangs(cmd, **kwargs):
+        raise subprocess.TimeoutExpired(cmd, kwargs.get("timeout"))
+
+    monkeypatch.setattr(subprocess, "run", hangs)
+    assert enforcer.flush(now=NOW + 1) == 0
+
+    def succeeds(cmd, **kwargs):
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+    monkeypatch.setattr(subprocess, "run", succeeds)
+    assert enforcer.flush(now=NOW + 2) == 1
+    assert enforcer.last_script == "add pyshield_bans 203.0.113.7 timeout 58\n"
+
+
+def test_disabled_enforcer_queues_nothing():
+    bans = BanRegistry()
+    enforcer = KernelBanEnforcer(BanEnforcementConfig(enabled=False), bans)
+    enforcer.start()
+    for i in range(100):
+        bans.ban(f"203.0.113.{i}", 60, reason="ddos", source="test", now=NOW)
+    assert enforcer._pending == {}
+
+
+def test_one_failing_operation_does_not_block_the_others(make_enforcer, monkeypatch):
+    bans, enforcer = make_enforcer(dry_run=False)
+    scripts = []
+
+    def rejects_poisoned(cmd, input=None, **kwargs):
+        scripts.append(input)
+        rc = 1 if "198.51.100.66" in input else 0
+        return subprocess.CompletedProcess(cmd, rc, "", "ipset v7: element cannot be added" if rc else "")
+
+    monkeypatch.setattr(subprocess, "run", rejects_poisoned)
+    bans.ban("198.51.100.66", 60, reason="ddos", source="test", now=NOW)
+    bans.ban("203.0.113.7", 60, reason="ddos", source="test", now=NOW)
+    # The batch fails, then each key is tried alone: only the good one lands
+    assert enforcer.flush(now=NOW) == 1
+    assert scripts[1:] == ["add pyshield_bans 198.51.100.66 timeout 60\n", "add pyshield_bans 203.0.113.7 timeout 60\n"]
+    assert list(enforcer._pending) == ["198.51.100.66"]
+
+    bans.ban("192.0.2.1", 60, reason="ddos", source="test", now=NOW)
+    assert enforcer.flush(now=NOW + 1) == 1
+    assert list(enforcer._pending) == ["198.51.100.66"]
+    # Third failure of the same operation: dropped
+    assert enforcer.flush(now=NOW + 2) == 0
+    assert enforcer._pending == {}
+    assert enforcer.flush(now=NOW + 3) == 0
@@ -0,0 +1,21 @@
+import pytest
+
+from core.http1 import HTTPError, request_framing, response_framing
+
+
+def test_content_length_framing():
+    assert request_framing([("Content-Length", " 42 ")])[1] == 42
+    assert response_framing("GET", 200, [("content-length", "0")])[1] == 0
+
+
+@pytest.mark.parametrize("value", ["\xb2", "1٣", "-1", "+5", "0x10", "1 2", ""])
+def test_invalid_content_length_is_an_http_error(value):
+    with pytest.raises(HTTPError):
+        request_framing([("Content-Length", value)])
+    with pytest.raises(HTTPError):
+        response_framing("GET", 200, [("Content-Length", value)])
+
+
+def test_conflicting_content_lengths():
+    with pytest.raises(HTTPError):
+        request_framing([("Content-Length", "1"), ("Content-Length", "2")])
@@ -0,0 +1,99 @@
+import random
+import re
+
+from modules.url_blocking import PathRuleSet, required_literal
+
+ALPHABET = "abcx/.-_?=&"
+ATOMS = [
+    "a", "b", "x", "/", "-", "_", "=", "ab", "/x", r"\.", r"\?", r"\-", r"\/", r"\.\.", r"\-\/", r"\d", r"\w", r"\b", ".",
+    "[a-c]", "[^/]", r"[.\]]", "^", "$",
+]
+QUANTIFIERS = ["", "", "", "?", "*", "+", "{2}", "{1,3}", "*?"]
+GROUPS = ["({})", "(?:{})", "(?={})", "(?!{})", "(?<=a)({})", "(?P<g>{})", "({}|{})", "(?i:{})"]
+
+
+def random_pattern(rnd: random.Random, depth: int = 0) -> str:
+    parts = []
+    for _ in range(rnd.randint(1, 8)):
+        if depth < 2 and rnd.random() < 0.2:
+            template = rnd.choice(GROUPS)
+            inner = random_pattern(rnd, depth + 1)
+            part = template.format(inner, random_pattern(rnd, depth + 1)) if "|" in template else template.format(inner)
+        else:
+            part = rnd.choice(ATOMS)
+        if part not in "^$":
+            part += rnd.choice(QUANTIFIERS)
+        parts.append(part)
+    pattern = "".join(parts)
+    if depth == 0 and rnd.random() < 0.1:
+        pattern += "|" + random_pattern(rnd, 1)
+    return pattern
+
+
+def random_target(rnd: random.Random, pattern: str) -> str:
+    # Mostly pieces of the pattern's own text, so regexes actually match now and then
+    text = "".join(c for c in pattern if c in ALPHABET) or ALPHABET
+    parts = []
+    for _ in range(rnd.randint(0, 4)):
+        if rnd.random() < 0.7:
+            start = rnd.randrange(len(text))
+            parts.append(text[start:start + rnd.randint(1, 6)])
+        else:
+            parts.append("".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(1, 4))))
+    return "".join(parts)
+
+
+def test_escaped_literal_inside_group_is_not_required():
+    assert required_literal(r"^/x(?!\.\.\.\.)") == "/x"
+    rules = PathRuleSet([r"re:^/x(?!\.\.\.\.)"])
+    assert rules.match("/x") == r"re:^/x(?!\.\.\.\.)"
+
+
+def test_required_literal_keeps_top_level_escapes():
+    assert required_literal(r"/\.env\.bak") == "/.env.bak"
+    assert required_literal(r"/wp-(admin|login)\.php") == "/wp-"
+
+
+def test_match_agrees_with_re_search():
+    rnd = random.Random(1234)
+    checked = 0
+    while checked < 3000:
+        pattern = random_pattern(rnd)
+        try:
+            compiled = re.compile(pattern, re.IGNORECASE)
+        except re.error:
+            continue
+        checked += 1
+        rule = "re:" + pattern
+        rules = PathRuleSet([rule])
+        for _ in range(8):
+            target = random_target(rnd, pattern)
+            expected = rule if compiled.search(target) else None
+            assert rules.match(target) == expected, (pattern, target, required_literal(pattern))
+        # A target built to match: a matching string must also satisfy the prefilter
+        literal = required_literal(pattern).lower()
+        assert rules.match(target + literal) == (rule if compiled.search(target + literal) else None), pattern
+
+
+def test_backreferences_keep_their_own_group_numbers():
+    rules = PathRuleSet([r"re:^/x(\d)\1", r"re:^/y(a)(b)\2", "re:^/w"])
+    assert rules.match("/w") == "re:^/w"
+    assert rules.match("/x11") == r"re:^/x(\d)\1"
+    assert rules.match("/x12") is None
+    assert rules.match("/yabb") == r"re:^/y(a)(b)\2"
+    named = PathRuleSet([r"re:(?P<d>\d)(?P=d)", r"re:^/z(a)?(?(1)b|c)"])
+    assert named.match("/77") == r"re:(?P<d>\d)(?P=d)"
+    assert named.match("/zab") == r"re:^/z(a)?(?(1)b|c)"
+    assert named.match("/zc") == r"re:^/z(a)?(?(1)b|c)"
+
+
+def test_rules_that_cannot_share_one_pattern():
+    flags = PathRuleSet(["re:(?i)^/a", "re:(?s)^/c.x", "re:^/d+$"])
+    assert flags.match("/admin") == "re:(?i)^/a"
+    assert flags.match("/c\nx") == "re:(?s)^/c.x"
+    assert flags.match("/dd") == "re:^/d+$"
+    names = PathRuleSet([r"re:^/a(?P<n>\d)", r"re:^/b(?P<n>\d)"])
+    assert names.match("/a1") == r"re:^/a(?P<n>\d)"
+    assert names.match("/b2") == r"re:^/b(?P<n>\d)"
+    assert names.match("/c3") is None
+    assert len(names) == 2
@@ -0,0 +1,34 @@
+import threading
+
+from core.prefix_limiter import PrefixRateLimiter
+
+
+def count_nodes(node):
+    return sum(1 + count_nodes(child) for child in (node.children or {}).values())
+
+
+def test_node_count_matches_the_tree_under_concurrent_inserts():
+    limiter = PrefixRateLimiter(v4_limits={16: 10**9, 24: 10**9, 32: 10**9}, max_nodes=10**7)
+
+    def insert(worker):
+        for i in range(3000):
+            limiter.hit(f"10.{(worker * 37 + i) % 256}.{i % 256}.{(i * 7 + worker) % 256}", now=100.0)
+
+    threads = [threading.Thread(target=insert, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    tree = limiter._trees[4]
+    assert len(limiter) == tree.nodes == count_nodes(tree.root)
+
+    removed = limiter.sweep(now=100.0 + 3 * limiter.window)
+    assert removed > 0
+    assert len(limiter) == count_nodes(tree.root) == 0
+
+
+def test_prefix_over_its_limit_is_reported():
+    limiter = PrefixRateLimiter(v4_limits={24: 3}, window_seconds=60)
+    results = [limiter.hit(f"198.51.100.{i}", now=100.0) for i in range(4)]
+    assert results[:3] == [None, None, None]
+    assert results[3] == ("198.51.100.0/24", 4)
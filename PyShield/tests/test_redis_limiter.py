@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from core.rate_limiter import AsyncRedisSlidingWindow, HybridRedisLimiter
+
+
+def fake_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # fakeredis runs Lua scripts through lupa
+    return fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+
+def test_sliding_window_limits_within_a_window():
+    limiter = AsyncRedisSlidingWindow(client=fake_client(), limit=3, window_seconds=10)
+
+    async def run():
+        results = [await limiter.hit("203.0.113.7", now=100.0) for _ in range(4)]
+        other = await limiter.hit("198.51.100.1", now=100.0)
+        await limiter.close()
+        return results, other
+
+    results, other = asyncio.run(run())
+    assert results == [(True, 1), (True, 2), (True, 3), (False, 4)]
+    assert other == (True, 1)
+
+
+def test_sliding_window_weights_the_previous_bucket():
+    limiter = AsyncRedisSlidingWindow(client=fake_client(), limit=3, window_seconds=10)
+
+    async def run():
+        for _ in range(4):
+            await limiter.hit("203.0.113.7", now=95.0)
+        # Halfway through the next window the previous bucket counts half: 4 * 0.5 + 1
+        halfway = await limiter.hit("203.0.113.7", now=105.0)
+        # A window on, the 95.0 hits are out and the one at 105.0 weighs 0.9: ceil(0.9 + 1)
+        later = await limiter.hit("203.0.113.7", now=111.0)
+        await limiter.close()
+        return halfway, later
+
+    assert asyncio.run(run()) == ((True, 3), (True, 2))
+
+
+def test_hybrid_syncs_once_per_local_budget():
+    remote = AsyncRedisSlidingWindow(client=fake_client(), limit=100, window_seconds=10)
+    limiter = HybridRedisLimiter(remote, limit=100, local_budget=10, sync_interval=60.0)
+
+    async def run():
+        for _ in range(25):
+            allowed, _ = await limiter.hit("203.0.113.7", now=100.0)
+            assert allowed
+        global_count = await remote.hit("203.0.113.7", now=100.0, amount=0)
+        await limiter.close()
+        return global_count
+
+    assert asyncio.run(run()) == (True, 20)
+    assert limiter.round_trips == 2
+
+
+class FailingRemote:
+    window = 10
+
+    def __init__(self) -> None:
+        self.fail = True
+        self.amounts = []
+
+    async def hit(self, key, now=None, *, amount=1):
+        if self.fail:
+            raise ConnectionError("redis down")
+        self.amounts.append(amount)
+        return True, amount
+
+
+def test_hybrid_keeps_hits_when_a_sync_fails():
+    remote = FailingRemote()
+    limiter = HybridRedisLimiter(remote, limit=100, local_budget=2, sync_interval=60.0)
+
+    async def run():
+        await limiter.hit("203.0.113.7", now=100.0)
+        with pytest.raises(ConnectionError):
+            await limiter.hit("203.0.113.7", now=100.0)
+        remote.fail = False
+        return await limiter.hit("203.0.113.7", now=100.0)
+
+    assert asyncio.run(run()) == (True, 3)
+    assert remote.amounts == [3]
@@ -0,0 +1,197 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+from core import resolver as resolver_module
+from core.resolver import Resolver, StaticBackend
+
+
+class CountingBackend(StaticBackend):
+    """StaticBackend that counts lookups and can answer slowly."""
+
+    def __init__(self, hosts, *, delay: float = 0.0, ttl: float = 3600.0) -> None:
+        super().__init__(hosts, ttl=ttl)
+        self.delay = delay
+        self.lookups = 0
+
+    async def lookup(self, host):
+        self.lookups += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return await super().lookup(host)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resolver_module.time, "monotonic", clock)
+    return clock
+
+
+def test_answers_are_cached_for_the_clamped_ttl(clock):
+    backend = CountingBackend({"example.test": ["192.0.2.1", "2001:db8::1"]}, ttl=1.0)
+    resolver = Resolver(backend, min_ttl=5.0, max_ttl=60.0)
+
+    async def run():
+        first = await resolver.resolve("Example.Test.")
+        assert first == [(socket.AF_INET, "192.0.2.1"), (socket.AF_INET6, "2001:db8::1")]
+        clock.now += 4.9
+        assert await resolver.resolve("example.test") == first
+        assert backend.lookups == 1
+        clock.now += 0.2  # past min_ttl, which the backend's 1 s TTL was raised to
+        await resolver.resolve("example.test")
+        assert backend.lookups == 2
+
+    asyncio.run(run())
+    assert resolver.stats["hits"] == 1 and resolver.stats["misses"] == 2
+
+
+def test_missing_names_are_cached_for_the_negative_ttl(clock):
+    backend = CountingBackend({})
+    resolver = Resolver(backend, negative_ttl=10.0)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(socket.gaierror):
+                await resolver.resolve("missing.test")
+        assert backend.lookups == 1
+        clock.now += 10.1
+        with pytest.raises(socket.gaierror):
+            await resolver.resolve("missing.test")
+        assert backend.lookups == 2
+
+    asyncio.run(run())
+    assert resolver.stats["negative_hits"] == 1
+
+
+def test_ip_literals_skip_the_backend():
+    backend = CountingBackend({})
+    resolver = Resolver(backend)
+    assert asyncio.run(resolver.resolve("[2001:db8::5]")) == [(socket.AF_INET6, "2001:db8::5")]
+    assert backend.lookups == 0
+
+
+def test_concurrent_lookups_share_one_query():
+    backend = CountingBackend({"example.test": ["192.0.2.1"]}, delay=0.05)
+    resolver = Resolver(backend)
+
+    async def run():
+        return await asyncio.gather(*(resolver.resolve("example.test") for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert all(r == [(socket.AF_INET, "192.0.2.1")] for r in results)
+    assert backend.lookups == 1
+    assert resolver.stats["coalesced"] == 9
+
+
+def test_timeouts_are_not_cached():
+    backend = CountingBackend({"slow.test": ["192.0.2.1"]}, delay=0.2)
+    resolver = Resolver(backend, timeout=0.05)
+
+    async def run():
+        with pytest.raises(socket.gaierror) as excinfo:
+            await resolver.resolve("slow.test")
+        assert excinfo.value.errno == socket.EAI_AGAIN
+        backend.delay = 0.0
+        assert await resolver.resolve("slow.test") == [(socket.AF_INET, "192.0.2.1")]
+
+    asyncio.run(run())
+    assert backend.lookups == 2
+    assert resolver.stats["errors"] == 1
+
+
+def test_cancelled_leader_does_not_fail_its_waiters():
+    backend = CountingBackend({"example.test": ["192.0.2.1"]}, delay=0.05)
+    resolver = Resolver(backend)
+
+    async def run():
+        leader = asyncio.ensure_future(resolver.resolve("example.test"))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(resolver.resolve("example.test"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await waiter == [(socket.AF_INET, "192.0.2.1")]
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(run())
+    # The waiter started its own lookup once the leader's was cancelled
+    assert backend.lookups == 2
+
+
+def _ipv4_listener():
+    server = socket.create_server(("127.0.0.1", 0))
+    server.setblocking(False)
+    return server, server.getsockname()[1]
+
+
+def _ipv6_available() -> bool:
+    try:
+        socket.socket(socket.AF_INET6).close()
+        return socket.has_ipv6
+    except OSError:
+        return False
+
+
+@pytest.mark.skipif(not _ipv6_available(), reason="no IPv6")
+def test_connect_falls_back_from_refused_ipv6_to_ipv4():
+    server, port = _ipv4_listener()
+    # Nothing listens on [::1]:port, so the first (IPv6) attempt is refused
+    resolver = Resolver(StaticBackend({"dual.test": ["::1", "127.0.0.1"]}))
+
+    async def run():
+        sock = await resolver.connect("dual.test", port, timeout=2.0)
+        try:
+            assert sock.family == socket.AF_INET
+        finally:
+            sock.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.close()
+    assert resolver.stats["connects"] == 1 and resolver.stats["connect_failures"] == 0
+
+
+@pytest.mark.skipif(not _ipv6_available(), reason="no IPv6")
+def test_connect_starts_ipv4_when_ipv6_stalls():
+    server, port = _ipv4_listener()
+    # A listener with a full accept queue drops further SYNs: the IPv6 attempt hangs
+    stalled = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+    stalled.bind(("::1", port))
+    stalled.listen(0)
+    fillers = []
+    for _ in range(4):
+        filler = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        filler.setblocking(False)
+        filler.connect_ex(("::1", port))
+        fillers.append(filler)
+    time.sleep(0.05)
+    resolver = Resolver(StaticBackend({"dual.test": ["::1", "127.0.0.1"]}), happy_eyeballs_delay=0.1)
+
+    async def run():
+        started = time.perf_counter()
+        sock = await resolver.connect("dual.test", port, timeout=3.0)
+        try:
+            assert sock.family == socket.AF_INET
+        finally:
+            sock.close()
+        return time.perf_counter() - started
+
+    try:
+        elapsed = asyncio.run(run())
+    finally:
+        for s in (server, stalled, *fillers):
+            s.close()
+    assert elapsed < 1.0
+    assert resolver.stats["fallbacks"] == 1
@@ -0,0 +1,51 @@
+import pytest
+
+from core.shared_state import SharedState, _hash, shared_memory
+
+pytestmark = pytest.mark.skipif(shared_memory is None, reason="multiprocessing.shared_memory unavailable")
+
+
+@pytest.fixture
+def shared():
+    state = SharedState(ban_slots=64, counter_slots=64, workers=2)
+    yield state
+    state.close()
+
+
+def test_cache_totals_sum_workers(shared):
+    shared.publish_worker_cache(0, {"lookups": 10, "hits": 4, "misses": 5, "revalidated": 1,
+                                    "bytes_saved": 1000, "entries": 3, "stores": 7})
+    shared.publish_worker_cache(1, {"lookups": 10, "hits": 3, "misses": 7, "revalidated": 0,
+                                    "bytes_saved": 500, "entries": 2})
+    assert shared.cache_totals() == {
+        "lookups": 20, "hits": 7, "misses": 12, "revalidated": 1, "bytes_saved": 1500, "entries": 5,
+        "hit_ratio": 0.4,
+    }
+
+
+def test_cache_totals_without_lookups(shared):
+    assert shared.cache_totals()["hit_ratio"] == 0.0
+
+
+def test_deadline_table_get_and_update(shared):
+    table = shared.counters
+    assert table.get("203.0.113.7", now=100.0) is None
+    assert table.update("203.0.113.7", lambda current: (150.0, current), now=100.0) is None
+    assert table.get("203.0.113.7", now=100.0) == 150.0
+    assert table.get("203.0.113.7", now=200.0) is None
+
+
+def test_get_gives_up_on_a_segment_left_mid_write(shared):
+    table = shared.counters
+    table.update("203.0.113.7", lambda current: (150.0, None), now=100.0)
+    seg, _, _ = table._locate(_hash("203.0.113.7"))
+    # What a writer killed between its two sequence increments leaves behind
+    table._locks[seg].acquire()
+    table._seq[seg] += 1
+    try:
+        assert table.get("203.0.113.7", now=100.0) is None
+        assert table.get("203.0.113.7", now=100.0) is None
+    finally:
+        table._seq[seg] += 1
+        table._locks[seg].release()
+    assert table.get("203.0.113.7", now=100.0) == 150.0
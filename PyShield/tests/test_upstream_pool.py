@@ -0,0 +1,38 @@
+import asyncio
+
+from core.upstream_pool import UpstreamConnection
+
+
+class OpenTransport:
+    def is_closing(self):
+        return False
+
+
+class Writer:
+    transport = OpenTransport()
+
+
+class OpaqueReader:
+    """A StreamReader look-alike that does not expose its buffer."""
+
+    def at_eof(self):
+        return False
+
+    def exception(self):
+        return None
+
+
+def test_idle_connection_with_unread_bytes_is_not_alive():
+    async def run():
+        reader = asyncio.StreamReader()
+        conn = UpstreamConnection(("example.test", 80), reader, Writer())
+        assert conn.alive()
+        reader.feed_data(b"HTTP/1.1 408 Request Timeout\r\n\r\n")
+        assert not conn.alive()
+
+    asyncio.run(run())
+
+
+def test_unknown_buffer_state_is_not_reused():
+    conn = UpstreamConnection(("example.test", 80), OpaqueReader(), Writer())
+    assert not conn.alive()